@@ -1,37 +1,69 @@
-from redis import Redis
-from dotenv import load_dotenv, find_dotenv
-import os
-from .keys import new_chat_key
-from typing import List, Dict, Tuple
+from .keys import CHAT_KEY_PREFIX, CHAT_ID_COUNTER_KEY, user_chats_key
+from .connection_pool import connect
+from .write_behind import get_write_behind_buffer
+from .feedback_stats import set_feedback_with_stats
+from redis.commands.core import Script
+from typing import List, Dict, Optional, Tuple
 import json
-from datetime import datetime
+from datetime import datetime, date
+from config.config import HISTORY_MAX_LENGTH
 
-load_dotenv(find_dotenv())
 
-def connect() -> Redis:
-    return Redis(
-        host=os.getenv("REDIS_HOST"), 
-        port=os.getenv("REDIS_PORT"), 
-        password=os.getenv("REDIS_PW"),
-        db=0)
+SCORE_MAPPING = {"😀": 1, "🙂": 0.75, "😐": 0.5, "🙁": 0.25, "😞": 0}
 
+#Aloca o id do chat, grava o documento e o inclui no índice de chats do usuário em um único round-trip, de forma atômica.
+#KEYS[1] - contador de ids, KEYS[2] - índice de chats do usuário
+#ARGV[1] - prefixo da chave do chat, ARGV[2] - documento json do chat, ARGV[3] - timestamp de criação (score no índice)
+#Retorna {chave, 1} se criou o chat, ou {chave, 0} se a chave já existia (colisão)
+#A chave do chat é derivada do contador dentro do script, o que é aceito no Redis standalone (não em cluster)
+CREATE_CHAT_LUA = """
+local chat_id = redis.call('INCR', KEYS[1])
+local chat_key = ARGV[1] .. chat_id
+local created = redis.call('JSON.SET', chat_key, '.', ARGV[2], 'NX')
+if created then
+    redis.call('ZADD', KEYS[2], ARGV[3], chat_key)
+    return {chat_key, 1}
+end
+return {chat_key, 0}
+"""
 
+_create_chat_script: Script = None
 
-SCORE_MAPPING = {"😀": 1, "🙂": 0.75, "😐": 0.5, "🙁": 0.25, "😞": 0}
+def get_create_chat_script() -> Script:
+    #O Script calcula o sha localmente e usa EVALSHA, recarregando o script no servidor só se necessário
+    global _create_chat_script
+    if _create_chat_script is None:
+        _create_chat_script = connect().register_script(CREATE_CHAT_LUA)
+    return _create_chat_script
 
 class Chat:
     """
     Ao criar um novo chat (sem passar chat_key), é necessário passar os parâmetros de chat, que serão salvos no banco de dados
     Ao recuperar um chat existente (passando chat_key), não é possível passar parâmetros de chat, pois eles já estão salvos no banco de dados
+
+    Com lazy=True, ao recuperar um chat existente, só são lidas as últimas `window` mensagens (o que o LLM vê do histórico),
+    em vez do documento inteiro. As mais antigas podem ser carregadas sob demanda com load_older_messages.
+    self.messages contém somente as mensagens carregadas; a mensagem self.messages[i] tem índice
+    self.messages_offset + i no chat completo (índice a usar em set_message_feedback).
+
+    Com write_behind=True, add_message não espera a gravação no Redis: ela é enfileirada e enviada em lote
+    por uma thread em background (ver write_behind.py). A criação do chat continua síncrona.
     """
-    def __init__(self, user_id: str, params:Dict = None, chat_key: str = None):
+    def __init__(self, user_id: str, params:Dict = None, chat_key: str = None, lazy: bool = False, window: int = HISTORY_MAX_LENGTH,
+                 write_behind: bool = False):
         self.redis = connect()
         self.user_id = user_id
         self.chat_key = chat_key
+        self.messages_offset = 0
+        self.write_behind = write_behind
         
         r = self.redis
 
-        if self.chat_key is not None and len(self.chat_key) > 0:
+        if self.chat_key is not None and len(self.chat_key) > 0 and lazy:
+            assert params is None, "Não é possível passar parâmetros de chat ao tentar recuperar um chat existente"
+            self.__load_window(window)
+
+        elif self.chat_key is not None and len(self.chat_key) > 0:
             #Foi passada chave, tenta ler chat existente do banco de dados
             assert params is None, "Não é possível passar parâmetros de chat ao tentar recuperar um chat existente"
 
@@ -48,46 +80,83 @@ class Chat:
         
         else:
             #Não foi passada chave, cria um novo chat
-            chat_key = self.__nova_chave()
             assert params is not None, "É necessário passar parâmetros de chat ao tentar criar um novo chat"
-            
-            result = r.json().set(
-                name=chat_key, 
-                path=".",
-                obj={
-                    "user_id": self.user_id, 
-                    "messages": [],
-                    "data_hora": json.dumps(datetime.now().isoformat()),
-                    "params": params,
-                },
-                nx=True
+
+            data_hora = datetime.now()
+            chat_obj = {
+                "user_id": self.user_id, 
+                "messages": [],
+                "data_hora": json.dumps(data_hora.isoformat()),
+                "params": params,
+            }
+
+            chat_key, created = get_create_chat_script()(
+                keys=[CHAT_ID_COUNTER_KEY, user_chats_key(self.user_id)],
+                args=[CHAT_KEY_PREFIX, json.dumps(chat_obj), data_hora.timestamp()],
+                client=r
             )
-            if result is None:
+            chat_key = chat_key.decode("utf-8")
+
+            if not created:
+                #O contador está atrás de chaves já existentes (ex: chave chat_id apagada). O próximo INCR já avança o contador.
                 raise Exception(f"Não foi possível criar o chat, possivelmente tentou-se sobrescrever um chat já existente, chave: {chat_key}")
             
             self.chat_key = chat_key
             self.messages = []
 
 
-    def __nova_chave(self):
+    def __load_window(self, window: int):
         """
-        Cria a chave para um novo chat usando uma key no redis
-        Se a chave obtida corresponder a um objeto que já existe no redis, tenta novamente 10 vezes
+        Lê somente o dono do chat e as últimas `window` mensagens, com slice JSONPath, e o total de mensagens.
+        Tudo em uma transação (MULTI), para que o total seja consistente com as mensagens lidas.
         """
-        r = self.redis
+        pipe = self.redis.pipeline(transaction=True)
+        paths = ["$.user_id"] if window <= 0 else ["$.user_id", f"$.messages[-{window}:]"]
+        pipe.json().get(self.chat_key, *paths)
+        pipe.json().arrlen(self.chat_key, "$.messages")
+        #Sem raise_on_error, pois o ARRLEN falha se a chave não existir, caso tratado abaixo
+        chat_fields, messages_length = pipe.execute(raise_on_error=False)
+
+        if chat_fields is None or isinstance(messages_length, Exception):
+            raise Exception(f"Não foi possível encontrar o chat com a chave {self.chat_key}")
+
+        #Com um único path o redis-py retorna a lista de resultados direto, com mais de um, um dict por path
+        user_ids = chat_fields["$.user_id"] if isinstance(chat_fields, dict) else chat_fields
+        if len(user_ids) == 0 or self.user_id != user_ids[0]:
+            raise Exception(f"O usuário {self.user_id} não corresponde ao chat existente {self.chat_key}")
+
+        self.messages = list(chat_fields[f"$.messages[-{window}:]"]) if window > 0 else []
+        total_messages = messages_length[0] if messages_length and messages_length[0] is not None else 0
+        self.messages_offset = total_messages - len(self.messages)
+
+
+    @property
+    def total_messages(self) -> int:
+        return self.messages_offset + len(self.messages)
+
+
+    def has_older_messages(self) -> bool:
+        return self.messages_offset > 0
+
+
+    def load_older_messages(self, count: int = None) -> List[Dict]:
+        """
+        Carrega até `count` mensagens anteriores às já carregadas (todas, se count for None), 
+        inserindo-as no início de self.messages. Retorna as mensagens carregadas, em ordem.
+        """
+        if self.messages_offset == 0:
+            return []
+
+        start = 0 if count is None else max(0, self.messages_offset - count)
+        result = self.redis.json().get(self.chat_key, f"$.messages[{start}:{self.messages_offset}]")
+        older_messages = list(result) if result is not None else []
+
+        self.messages[0:0] = older_messages
+        self.messages_offset = start
+
+        return older_messages
 
-        chat_key = new_chat_key(r)
 
-        retries = 10
-        while r.exists(chat_key) and retries > 0:
-            chat_key = new_chat_key(r)
-            retries -= 1
-        
-        if retries == 0:
-            raise Exception("Não foi possível obter uma chave de chat valida apos 10 tentativas")
-        
-        return chat_key
-    
     def add_message(self, message: Tuple[str]):
         r = self.redis
 
@@ -97,7 +166,11 @@ class Chat:
             "feedback":  {"score": None, "score_numeric": None, "text": None}
         }
 
-        r.json().arrappend(self.chat_key, ".messages", message_dict)
+        if self.write_behind:
+            chat_key = self.chat_key
+            get_write_behind_buffer().submit(lambda pipe: pipe.json().arrappend(chat_key, ".messages", message_dict))
+        else:
+            r.json().arrappend(self.chat_key, ".messages", message_dict)
 
         self.messages.append(message_dict)
 
@@ -115,20 +188,102 @@ class Chat:
     
 
 #PROMOVIDA A FUNÇÃO INDEPENDENTE PARA EVITAR TER QUE BUSCAR O CHAT INTEIRO SÓ PARA ATUALIZAR O FEEDBACK
-def set_message_feedback(chat_key: str, message_index: int, feedback_score: str, feedback_text: str = None):
+#Grava o feedback e atualiza, na mesma operação atômica, os agregados de feedback por dia e por modelo (ver feedback_stats.py)
+def set_message_feedback(chat_key: str, message_index: int, feedback_score: str, feedback_text: str = None, write_behind: bool = False):
+
+    feedback = {
+        "score": feedback_score, 
+        "score_numeric": SCORE_MAPPING.get(feedback_score), 
+        "text": feedback_text,
+        "dia": date.today().isoformat()
+    }
+    # print(f"feedback: {feedback}")
+    if write_behind:
+        get_write_behind_buffer().submit(lambda pipe: set_feedback_with_stats(chat_key, message_index, feedback, client=pipe))
+        return
+
+    set_feedback_with_stats(chat_key, message_index, feedback)
+
 
+
+
+
+def list_chats(user_id: str, limit: int = 20, cursor: Optional[float] = None) -> Tuple[List[Dict], Optional[float]]:
+    """
+    Lista os chats do usuário, do mais recente para o mais antigo, usando o índice por usuário (sem varrer as chaves do Redis).
+    Retorna a página de chats (chat_key, data_hora, params e total_messages) e o cursor para a próxima página,
+    None se não houver mais chats. Na primeira página, cursor deve ser None.
+    O cursor é o timestamp do último chat retornado, então chats criados durante a paginação não deslocam as páginas seguintes.
+    """
     r = connect()
 
-    feedback = {"score": feedback_score, "score_numeric": SCORE_MAPPING.get(feedback_score), "text": feedback_text}
-    # print(f"feedback: {feedback}")
-    r.json().set(
-        name=chat_key, 
-        path=f".messages[{message_index}].feedback",
-        obj=feedback
-    )
+    max_score = "+inf" if cursor is None else f"({cursor}"
+    #Busca um a mais para saber se existe próxima página
+    entries = r.zrevrangebyscore(user_chats_key(user_id), max_score, "-inf", start=0, num=limit + 1, withscores=True)
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    pipe = r.pipeline(transaction=False)
+    for chat_key, _ in entries:
+        pipe.json().get(chat_key, "$.data_hora", "$.params")
+        pipe.json().arrlen(chat_key, "$.messages")
+    results = pipe.execute(raise_on_error=False)
+
+    chats = []
+    orphan_keys = []
+    for index, (chat_key, score) in enumerate(entries):
+        chat_fields, messages_length = results[2 * index], results[2 * index + 1]
+        if chat_fields is None or isinstance(chat_fields, Exception):
+            #Chat removido do banco, mas ainda no índice
+            orphan_keys.append(chat_key)
+            continue
+
+        chats.append({
+            "chat_key": chat_key.decode("utf-8"),
+            "data_hora": json.loads(chat_fields["$.data_hora"][0]) if chat_fields["$.data_hora"] else None,
+            "params": chat_fields["$.params"][0] if chat_fields["$.params"] else None,
+            "total_messages": messages_length[0] if not isinstance(messages_length, Exception) and messages_length else 0,
+        })
+
+    if orphan_keys:
+        r.zrem(user_chats_key(user_id), *orphan_keys)
+
+    next_cursor = entries[-1][1] if has_more and entries else None
+    return chats, next_cursor
+
+
+def rebuild_user_chats_index(scan_count: int = 1000) -> int:
+    """
+    Reconstrói os índices de chats por usuário a partir dos chats existentes, para chats criados antes do índice existir.
+    Idempotente. Retorna a quantidade de chats indexados.
+    """
+    r = connect()
+    total = 0
+
+    cursor = 0
+    while True:
+        cursor, chat_keys = r.scan(cursor=cursor, match=f"{CHAT_KEY_PREFIX}*", count=scan_count)
+
+        if chat_keys:
+            pipe = r.pipeline(transaction=False)
+            for chat_key in chat_keys:
+                pipe.json().get(chat_key, "$.user_id", "$.data_hora")
+            results = pipe.execute(raise_on_error=False)
 
+            pipe = r.pipeline(transaction=False)
+            for chat_key, chat_fields in zip(chat_keys, results):
+                if chat_fields is None or isinstance(chat_fields, Exception) or not chat_fields["$.user_id"]:
+                    continue
+                #Chats sem data_hora ficam no fim da listagem
+                score = datetime.fromisoformat(json.loads(chat_fields["$.data_hora"][0])).timestamp() if chat_fields["$.data_hora"] else 0
+                pipe.zadd(user_chats_key(chat_fields["$.user_id"][0]), {chat_key: score})
+                total += 1
+            pipe.execute()
 
+        if cursor == 0:
+            break
 
+    return total
 
 
 
@@ -1,6 +1,16 @@
+import json
 import unittest
+from datetime import datetime
+from unittest import mock
 
-from chat_persistence.chat import Chat
+from chat_persistence import chat
+from chat_persistence.chat import Chat, list_chats, rebuild_user_chats_index
+from chat_persistence.keys import CHAT_ID_COUNTER_KEY, user_chats_key
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
 
 class TestChat(unittest.TestCase):
 
@@ -84,5 +94,143 @@ class TestChat(unittest.TestCase):
         self.assertEqual(messages_notraw[1][1], "Sou a VictorIA, sua assistente virtual")
         
 
+    def test_chat_lazy(self):
+        user_id = "Laura"
+
+        novo_chat = Chat(user_id, params={"model": "gpt-3.5-turbo-16k"})
+        for i in range(7):
+            novo_chat.add_message((f"pergunta {i}", f"resposta {i}"))
+
+        chat_lazy = Chat(user_id, chat_key=novo_chat.chat_key, lazy=True, window=3)
+        self.assertEqual(chat_lazy.total_messages, 7)
+        self.assertEqual(chat_lazy.messages_offset, 4)
+        self.assertListEqual(chat_lazy.messages, novo_chat.messages[4:])
+
+        mais_antigas = chat_lazy.load_older_messages(2)
+        self.assertListEqual(mais_antigas, novo_chat.messages[2:4])
+        self.assertEqual(chat_lazy.messages_offset, 2)
+
+        chat_lazy.load_older_messages()
+        self.assertFalse(chat_lazy.has_older_messages())
+        self.assertListEqual(chat_lazy.messages, novo_chat.messages)
+
+        with self.assertRaises(Exception):
+            Chat("nao_sou_a_laura", chat_key=novo_chat.chat_key, lazy=True)
+
+        with self.assertRaises(Exception):
+            Chat(user_id, chat_key="nao_existo", lazy=True)
+
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis not installed")
+class TestChatIndex(unittest.TestCase):
+    """Listagem e reconstrução do índice de chats por usuário, sem servidor Redis.
+    Os chats são gravados direto, no formato do Chat: o JSON.SET NX do script de criação não funciona no fakeredis."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch.object(chat, "connect", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_chat(self, chat_key, user_id, data_hora, messages=0, indexed=True):
+        document = {"user_id": user_id, "messages": [{"pergunta": "p", "resposta": "r"}] * messages, "params": {"model": "gpt-4"}}
+        if data_hora is not None:
+            document["data_hora"] = json.dumps(data_hora.isoformat())
+        self.redis.json().set(chat_key, ".", document)
+        if indexed:
+            self.redis.zadd(user_chats_key(user_id), {chat_key: data_hora.timestamp()})
+
+    def test_paginacao_por_cursor(self):
+        for day in range(1, 6):
+            self.add_chat(f"chat#{day}", "laura", datetime(2024, 3, day, 10), messages=day)
+        self.add_chat("chat#99", "outro", datetime(2024, 3, 3, 10))
+
+        page, cursor = list_chats("laura", limit=2)
+        self.assertEqual([item["chat_key"] for item in page], ["chat#5", "chat#4"])
+        self.assertEqual(page[0], {"chat_key": "chat#5", "data_hora": "2024-03-05T10:00:00", "params": {"model": "gpt-4"}, "total_messages": 5})
+        self.assertEqual(cursor, datetime(2024, 3, 4, 10).timestamp())
+
+        #Chat novo durante a paginação não desloca as páginas seguintes
+        self.add_chat("chat#6", "laura", datetime(2024, 3, 6, 10))
+        page, cursor = list_chats("laura", limit=2, cursor=cursor)
+        self.assertEqual([item["chat_key"] for item in page], ["chat#3", "chat#2"])
+
+        page, cursor = list_chats("laura", limit=2, cursor=cursor)
+        self.assertEqual([item["chat_key"] for item in page], ["chat#1"])
+        self.assertIsNone(cursor)
+
+        #Página exatamente no fim: sem próxima
+        page, cursor = list_chats("laura", limit=6)
+        self.assertEqual(len(page), 6)
+        self.assertIsNone(cursor)
+
+    def test_chat_removido_sai_do_indice(self):
+        self.add_chat("chat#1", "laura", datetime(2024, 3, 1, 10))
+        self.add_chat("chat#2", "laura", datetime(2024, 3, 2, 10))
+        self.redis.delete("chat#2")
+
+        page, cursor = list_chats("laura")
+        self.assertEqual([item["chat_key"] for item in page], ["chat#1"])
+        self.assertEqual(self.redis.zrange(user_chats_key("laura"), 0, -1), [b"chat#1"])
+
+    def test_reconstrucao_do_indice(self):
+        self.add_chat("chat#1", "laura", datetime(2024, 3, 1, 10), indexed=False)
+        self.add_chat("chat#2", "laura", datetime(2024, 3, 2, 10), indexed=False)
+        self.add_chat("chat#3", "outro", datetime(2024, 3, 3, 10), indexed=False)
+        #Chat antigo, sem data_hora: vai para o fim da listagem
+        self.add_chat("chat#4", "laura", None, indexed=False)
+        self.redis.set("chat_id", 4)
+
+        self.assertEqual(rebuild_user_chats_index(scan_count=1), 4)
+        index = self.redis.zrange(user_chats_key("laura"), 0, -1, withscores=True)
+        self.assertEqual(index, [(b"chat#4", 0.0), (b"chat#1", datetime(2024, 3, 1, 10).timestamp()), (b"chat#2", datetime(2024, 3, 2, 10).timestamp())])
+        self.assertEqual(self.redis.zrange(user_chats_key("outro"), 0, -1), [b"chat#3"])
+
+        #Idempotente
+        self.assertEqual(rebuild_user_chats_index(), 4)
+        self.assertEqual(self.redis.zrange(user_chats_key("laura"), 0, -1, withscores=True), index)
+        self.assertEqual([item["chat_key"] for item in list_chats("laura")[0]], ["chat#2", "chat#1", "chat#4"])
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis not installed")
+class TestCreateChatScript(unittest.TestCase):
+    """Criação do chat pelo script Lua (CREATE_CHAT_LUA). Roda em qualquer fakeredis/servidor em que o JSON.SET
+    chamado de dentro do Lua grave a chave; no fakeredis 2.20 ele não grava, e os testes são pulados."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        try:
+            self.redis.eval("return redis.call('JSON.SET', KEYS[1], '.', '{}', 'NX')", 1, "lua_json_probe")
+            lua_json = self.redis.json().get("lua_json_probe") == {}
+        except Exception:
+            lua_json = False
+        if not lua_json:
+            self.skipTest("JSON.SET called from a Lua script does not write the key in this fakeredis (needs Redis Stack)")
+        self.redis.delete("lua_json_probe")
+
+        for patcher in [mock.patch.object(chat, "connect", return_value=self.redis), mock.patch.object(chat, "_create_chat_script", None)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_cria_e_indexa(self):
+        novo_chat = Chat("laura", params={"model": "gpt-4"})
+        self.assertEqual(novo_chat.chat_key, "chat#1")
+        self.assertEqual(self.redis.json().get("chat#1", ".user_id"), "laura")
+        self.assertEqual(self.redis.zrange(user_chats_key("laura"), 0, -1), [b"chat#1"])
+        self.assertEqual(Chat("laura", params={"model": "gpt-4"}).chat_key, "chat#2")
+
+    def test_colisao_nao_sobrescreve(self):
+        self.redis.json().set("chat#1", ".", {"user_id": "outro", "messages": [], "params": {}})
+        with self.assertRaises(Exception):
+            Chat("laura", params={"model": "gpt-4"})
+
+        #O chat existente e o índice ficam intactos, e o contador já avançou
+        self.assertEqual(self.redis.json().get("chat#1", ".user_id"), "outro")
+        self.assertEqual(self.redis.zcard(user_chats_key("laura")), 0)
+        self.assertEqual(int(self.redis.get(CHAT_ID_COUNTER_KEY)), 1)
+        self.assertEqual(Chat("laura", params={"model": "gpt-4"}).chat_key, "chat#2")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,116 @@
+from redis import Redis, BlockingConnectionPool
+from redis.exceptions import ConnectionError
+from dotenv import load_dotenv, find_dotenv
+import os
+import threading
+import time
+from typing import Dict
+
+load_dotenv(find_dotenv())
+
+#Dimensionamento do pool compartilhado por todos os chats do processo
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+#Tempo máximo, em segundos, que uma requisição espera por uma conexão livre antes de falhar
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 20))
+#Conexões ociosas há mais que esse tempo, em segundos, recebem um PING antes de serem usadas
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+
+#Mensagem do ConnectionError do BlockingConnectionPool quando nenhuma conexão fica livre dentro do timeout
+POOL_EXHAUSTED_MESSAGE = "No connection available."
+
+
+def is_pool_exhausted(error: Exception) -> bool:
+    return isinstance(error, ConnectionError) and str(error) == POOL_EXHAUSTED_MESSAGE
+
+
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    """
+    Pool bloqueante (thread safe, com no máximo max_connections conexões) que registra métricas de uso,
+    para dimensionar o pool sob carga: conexões em uso, pico de uso e tempo de espera por conexão livre.
+    Falhas ao obter conexão são separadas: pool esgotado (failed_acquisitions, o que indica pool pequeno)
+    e erro ao conectar no Redis (connection_errors, o que não se resolve com mais conexões).
+    """
+    def reset(self):
+        #Chamado no construtor e após fork: as conexões antigas deixam de existir, e o processo filho começa
+        #com métricas zeradas, em vez das contagens do pai. Lock novo: o herdado pode ter sido copiado travado
+        super().reset()
+        self._metrics_lock = threading.Lock()
+        self._in_use = set()
+        self.peak_in_use = 0
+        self.total_acquired = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+        self.connection_errors = 0
+
+    def get_connection(self, command_name, *keys, **options):
+        start = time.perf_counter()
+        try:
+            connection = super().get_connection(command_name, *keys, **options)
+        except Exception as e:
+            with self._metrics_lock:
+                if is_pool_exhausted(e):
+                    self.timeouts += 1
+                else:
+                    self.connection_errors += 1
+            raise
+
+        wait_time = time.perf_counter() - start
+        with self._metrics_lock:
+            self._in_use.add(id(connection))
+            self.peak_in_use = max(self.peak_in_use, len(self._in_use))
+            self.total_acquired += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+        return connection
+
+    def release(self, connection):
+        with self._metrics_lock:
+            self._in_use.discard(id(connection))
+        super().release(connection)
+
+    def metrics(self) -> Dict:
+        with self._metrics_lock:
+            return {
+                "max_connections": self.max_connections,
+                "created_connections": len(self._connections),
+                "in_use": len(self._in_use),
+                "peak_in_use": self.peak_in_use,
+                "total_acquired": self.total_acquired,
+                "avg_wait_ms": 1000 * self.total_wait_time / self.total_acquired if self.total_acquired > 0 else 0.0,
+                "max_wait_ms": 1000 * self.max_wait_time,
+                "failed_acquisitions": self.timeouts,
+                "connection_errors": self.connection_errors,
+            }
+
+
+_pool: InstrumentedConnectionPool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool() -> InstrumentedConnectionPool:
+    """Pool único do processo, criado na primeira chamada"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InstrumentedConnectionPool(
+                    max_connections=REDIS_MAX_CONNECTIONS,
+                    timeout=REDIS_POOL_TIMEOUT,
+                    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+                    socket_keepalive=True,
+                    host=os.getenv("REDIS_HOST"),
+                    port=os.getenv("REDIS_PORT"),
+                    password=os.getenv("REDIS_PW"),
+                    db=0)
+    return _pool
+
+
+def connect() -> Redis:
+    """Client que usa o pool compartilhado. Criar o client é barato, a conexão só é aberta quando necessário."""
+    return Redis(connection_pool=get_connection_pool())
+
+
+def get_pool_metrics() -> Dict:
+    return get_connection_pool().metrics()
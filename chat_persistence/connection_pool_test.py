@@ -0,0 +1,67 @@
+import unittest
+
+from redis import Connection
+from redis.exceptions import ConnectionError
+
+from chat_persistence.connection_pool import InstrumentedConnectionPool
+
+
+class IdleConnection(Connection):
+    #Conexão que não abre socket: o teste só exercita o pool
+    def connect(self):
+        pass
+
+    def can_read(self, timeout=0):
+        return False
+
+
+class RefusedConnection(IdleConnection):
+    def connect(self):
+        raise ConnectionError("Error 111 connecting to localhost:6379. Connection refused.")
+
+
+class TestInstrumentedConnectionPool(unittest.TestCase):
+
+    def test_pool_esgotado(self):
+        pool = InstrumentedConnectionPool(connection_class=IdleConnection, max_connections=1, timeout=0.01)
+        connection = pool.get_connection("GET")
+
+        with self.assertRaisesRegex(ConnectionError, "No connection available"):
+            pool.get_connection("GET")
+
+        metrics = pool.metrics()
+        self.assertEqual((metrics["failed_acquisitions"], metrics["connection_errors"]), (1, 0))
+        self.assertEqual((metrics["in_use"], metrics["total_acquired"]), (1, 1))
+
+        pool.release(connection)
+        pool.release(pool.get_connection("GET"))
+        self.assertEqual(pool.metrics()["in_use"], 0)
+
+    def test_erro_de_conexao_nao_conta_como_pool_esgotado(self):
+        pool = InstrumentedConnectionPool(connection_class=RefusedConnection, max_connections=1, timeout=0.01)
+
+        for _ in range(2):
+            with self.assertRaisesRegex(ConnectionError, "Connection refused"):
+                pool.get_connection("GET")
+
+        metrics = pool.metrics()
+        self.assertEqual((metrics["failed_acquisitions"], metrics["connection_errors"]), (0, 2))
+        #A conexão que falhou volta para o pool
+        self.assertEqual((metrics["in_use"], metrics["total_acquired"]), (0, 0))
+
+    def test_processo_filho_comeca_com_metricas_zeradas(self):
+        pool = InstrumentedConnectionPool(connection_class=IdleConnection, max_connections=1, timeout=0.01)
+        pool.get_connection("GET")
+        with self.assertRaises(ConnectionError):
+            pool.get_connection("GET")
+
+        #Pid diferente do atual: o pool se comporta como no processo filho depois do fork, e chama reset()
+        pool.pid = -1
+        pool.release(pool.get_connection("GET"))
+        metrics = pool.metrics()
+        self.assertEqual((metrics["total_acquired"], metrics["peak_in_use"], metrics["in_use"]), (1, 1, 0))
+        self.assertEqual((metrics["failed_acquisitions"], metrics["connection_errors"]), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
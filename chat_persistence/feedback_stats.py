@@ -0,0 +1,225 @@
+from .connection_pool import connect
+from .keys import CHAT_KEY_PREFIX
+from redis.commands.core import Script
+from typing import Dict, Optional
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+Agregados de feedback mantidos de forma incremental, a cada feedback registrado, para que os dashboards de qualidade
+não precisem ler todos os chats.
+
+Um hash por dia (data em que o feedback foi dado), com os campos:
+    count, sum, hist:<score_numeric>                         - todos os feedbacks do dia
+    model:<modelo>:count, model:<modelo>:sum, model:<modelo>:hist:<score_numeric> - por modelo (params.model do chat)
+"""
+FEEDBACK_STATS_KEY_PREFIX = "feedback_stats#"
+
+
+def feedback_stats_key(day: str) -> str:
+    return f"{FEEDBACK_STATS_KEY_PREFIX}{day}"
+
+
+#Grava o feedback da mensagem e atualiza os agregados na mesma operação atômica.
+#Se a mensagem já tinha feedback com nota, ele é descontado dos agregados do dia em que foi dado, antes de somar o novo.
+#KEYS[1] - chave do chat
+#ARGV[1] - path do feedback da mensagem, ARGV[2] - feedback json (com score_numeric e dia), ARGV[3] - prefixo das chaves de agregados
+#Os hashes de agregados são derivados dos argumentos dentro do script, o que é aceito no Redis standalone (não em cluster)
+SET_FEEDBACK_LUA = """
+local old_json = redis.call('JSON.GET', KEYS[1], ARGV[1])
+
+local model = nil
+local model_json = redis.call('JSON.GET', KEYS[1], '$.params.model')
+if model_json then
+    local models = cjson.decode(model_json)
+    if #models > 0 and models[1] ~= cjson.null then
+        model = tostring(models[1])
+    end
+end
+
+local function apply(feedback, sign)
+    if type(feedback) ~= 'table' then
+        return
+    end
+    local score = feedback['score_numeric']
+    local day = feedback['dia']
+    if score == nil or score == cjson.null or day == nil or day == cjson.null then
+        return
+    end
+
+    local key = ARGV[3] .. day
+    local hist_field = 'hist:' .. tostring(score)
+    redis.call('HINCRBY', key, 'count', sign)
+    redis.call('HINCRBYFLOAT', key, 'sum', sign * score)
+    redis.call('HINCRBY', key, hist_field, sign)
+    if model then
+        local model_prefix = 'model:' .. model .. ':'
+        redis.call('HINCRBY', key, model_prefix .. 'count', sign)
+        redis.call('HINCRBYFLOAT', key, model_prefix .. 'sum', sign * score)
+        redis.call('HINCRBY', key, model_prefix .. hist_field, sign)
+    end
+end
+
+if old_json then
+    apply(cjson.decode(old_json), -1)
+end
+redis.call('JSON.SET', KEYS[1], ARGV[1], ARGV[2])
+apply(cjson.decode(ARGV[2]), 1)
+return 1
+"""
+
+_set_feedback_script: Script = None
+
+def get_set_feedback_script() -> Script:
+    global _set_feedback_script
+    if _set_feedback_script is None:
+        _set_feedback_script = connect().register_script(SET_FEEDBACK_LUA)
+    return _set_feedback_script
+
+
+def set_feedback_with_stats(chat_key: str, message_index: int, feedback: Dict, client=None):
+    """
+    Grava o feedback (que deve conter o campo "dia") e atualiza os agregados.
+    client pode ser um pipeline, caso em que o comando é somente enfileirado (usado pelo write-behind).
+    """
+    get_set_feedback_script()(
+        keys=[chat_key],
+        args=[f".messages[{message_index}].feedback", json.dumps(feedback), FEEDBACK_STATS_KEY_PREFIX],
+        client=client if client is not None else connect()
+    )
+
+
+def _parse_fields(fields: Dict[bytes, bytes], prefix: str = "") -> Dict:
+    count = int(fields.get(f"{prefix}count".encode(), 0))
+    total = float(fields.get(f"{prefix}sum".encode(), 0))
+
+    hist_prefix = f"{prefix}hist:".encode()
+    histogram = {}
+    for field, value in fields.items():
+        if field.startswith(hist_prefix) and int(value) != 0:
+            histogram[float(field[len(hist_prefix):])] = int(value)
+
+    return {"count": count, "sum": total, "histogram": histogram}
+
+
+def get_feedback_stats(day_from: date, day_to: date, model: Optional[str] = None) -> Dict:
+    """
+    Agregados de feedback no intervalo de dias [day_from, day_to], opcionalmente só de um modelo.
+    Lê um hash por dia, em um único pipeline, independente da quantidade de chats.
+
+    Retorna count, average, histogram ({score_numeric: quantidade}) do período, e os mesmos valores por dia em per_day.
+    """
+    days = [(day_from + timedelta(days=offset)).isoformat() for offset in range((day_to - day_from).days + 1)]
+
+    pipe = connect().pipeline(transaction=False)
+    for day in days:
+        pipe.hgetall(feedback_stats_key(day))
+    results = pipe.execute()
+
+    field_prefix = f"model:{model}:" if model is not None else ""
+
+    total_count = 0
+    total_sum = 0.0
+    total_histogram = defaultdict(int)
+    per_day = {}
+    for day, fields in zip(days, results):
+        day_stats = _parse_fields(fields, field_prefix)
+        if day_stats["count"] == 0:
+            continue
+
+        per_day[day] = {
+            "count": day_stats["count"],
+            "average": day_stats["sum"] / day_stats["count"],
+            "histogram": day_stats["histogram"],
+        }
+        total_count += day_stats["count"]
+        total_sum += day_stats["sum"]
+        for score, quantity in day_stats["histogram"].items():
+            total_histogram[score] += quantity
+
+    return {
+        "count": total_count,
+        "average": total_sum / total_count if total_count > 0 else None,
+        "histogram": dict(total_histogram),
+        "per_day": per_day,
+    }
+
+
+def backfill_feedback_stats(scan_count: int = 500) -> int:
+    """
+    Recalcula todos os agregados a partir dos chats existentes, lendo-os em lotes com pipeline (só data_hora,
+    modelo e feedbacks, não as mensagens inteiras).
+    Feedbacks anteriores aos agregados não têm o campo "dia": recebem a data do chat, gravada no próprio feedback,
+    para que uma alteração posterior seja descontada do dia correto.
+
+    Deve ser executado sem feedbacks sendo registrados ao mesmo tempo, pois substitui os agregados existentes.
+    Retorna a quantidade de feedbacks contabilizados.
+    """
+    r = connect()
+    aggregates = defaultdict(lambda: defaultdict(float))
+    total = 0
+
+    cursor = 0
+    while True:
+        cursor, chat_keys = r.scan(cursor=cursor, match=f"{CHAT_KEY_PREFIX}*", count=scan_count)
+
+        if chat_keys:
+            pipe = r.pipeline(transaction=False)
+            for chat_key in chat_keys:
+                pipe.json().get(chat_key, "$.data_hora", "$.params.model", "$.messages[*].feedback")
+            results = pipe.execute(raise_on_error=False)
+
+            fix_pipe = r.pipeline(transaction=False)
+            for chat_key, chat_fields in zip(chat_keys, results):
+                if chat_fields is None or isinstance(chat_fields, Exception):
+                    continue
+
+                chat_day = None
+                if chat_fields["$.data_hora"]:
+                    chat_day = datetime.fromisoformat(json.loads(chat_fields["$.data_hora"][0])).date().isoformat()
+                models = chat_fields["$.params.model"]
+                model = str(models[0]) if models and models[0] is not None else None
+
+                for message_index, feedback in enumerate(chat_fields["$.messages[*].feedback"]):
+                    if not isinstance(feedback, dict) or feedback.get("score_numeric") is None:
+                        continue
+
+                    day = feedback.get("dia")
+                    if day is None:
+                        if chat_day is None:
+                            continue
+                        day = chat_day
+                        fix_pipe.json().set(chat_key, f".messages[{message_index}].feedback.dia", day)
+
+                    score = feedback["score_numeric"]
+                    #Mesmo formato do tostring do Lua: inteiros sem casa decimal
+                    score_label = str(int(score)) if float(score).is_integer() else str(score)
+                    fields = aggregates[day]
+                    fields["count"] += 1
+                    fields["sum"] += score
+                    fields[f"hist:{score_label}"] += 1
+                    if model is not None:
+                        fields[f"model:{model}:count"] += 1
+                        fields[f"model:{model}:sum"] += score
+                        fields[f"model:{model}:hist:{score_label}"] += 1
+                    total += 1
+            fix_pipe.execute()
+
+        if cursor == 0:
+            break
+
+    pipe = r.pipeline(transaction=True)
+    for stats_key in r.scan_iter(match=f"{FEEDBACK_STATS_KEY_PREFIX}*", count=scan_count):
+        pipe.delete(stats_key)
+    for day, fields in aggregates.items():
+        pipe.hset(feedback_stats_key(day), mapping={
+            field: (int(value) if not field.endswith("sum") else value) for field, value in fields.items()
+        })
+    pipe.execute()
+
+    logger.info("Agregados de feedback recalculados: %d feedbacks em %d dias", total, len(aggregates))
+    return total
@@ -0,0 +1,151 @@
+import json
+import unittest
+from datetime import date
+from unittest import mock
+
+from chat_persistence import feedback_stats
+from chat_persistence.feedback_stats import backfill_feedback_stats, feedback_stats_key, get_feedback_stats, set_feedback_with_stats
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def feedback(score_numeric, dia=None):
+    result = {"score": None, "score_numeric": score_numeric, "text": None}
+    if dia is not None:
+        result["dia"] = dia
+    return result
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis not installed")
+class TestFeedbackStats(unittest.TestCase):
+    """Leitura e recálculo dos agregados. O script Lua do set_feedback_with_stats usa cjson, que o fakeredis não tem."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch.object(feedback_stats, "connect", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_chat(self, chat_key, data_hora, model, feedbacks):
+        #Mesmo formato gravado pelo Chat: data_hora serializada como string json
+        self.redis.json().set(chat_key, ".", {
+            "user_id": "laura",
+            "data_hora": json.dumps(data_hora),
+            "params": {"model": model} if model is not None else {},
+            "messages": [{"pergunta": "p", "resposta": "r", "feedback": item} for item in feedbacks],
+        })
+
+    def test_agregados_por_dia_e_por_modelo(self):
+        #Hashes no formato escrito pelo script Lua
+        self.redis.hset(feedback_stats_key("2024-03-01"), mapping={
+            "count": 3, "sum": 2.25, "hist:1": 2, "hist:0.25": 1, "hist:0.5": 0,
+            "model:gpt-4:count": 2, "model:gpt-4:sum": 2, "model:gpt-4:hist:1": 2,
+            "model:gpt-3.5-turbo:count": 1, "model:gpt-3.5-turbo:sum": 0.25, "model:gpt-3.5-turbo:hist:0.25": 1,
+        })
+        self.redis.hset(feedback_stats_key("2024-03-03"), mapping={
+            "count": 1, "sum": 0, "hist:0": 1,
+            "model:gpt-3.5-turbo:count": 1, "model:gpt-3.5-turbo:sum": 0, "model:gpt-3.5-turbo:hist:0": 1,
+        })
+        #Fora do intervalo
+        self.redis.hset(feedback_stats_key("2024-03-04"), mapping={"count": 5, "sum": 5, "hist:1": 5})
+
+        stats = get_feedback_stats(date(2024, 3, 1), date(2024, 3, 3))
+        self.assertEqual(stats["count"], 4)
+        self.assertAlmostEqual(stats["average"], 2.25 / 4)
+        #Faixas zeradas (feedback alterado) não aparecem
+        self.assertEqual(stats["histogram"], {1.0: 2, 0.25: 1, 0.0: 1})
+        self.assertEqual(list(stats["per_day"]), ["2024-03-01", "2024-03-03"])
+        self.assertAlmostEqual(stats["per_day"]["2024-03-01"]["average"], 0.75)
+        self.assertEqual(stats["per_day"]["2024-03-03"], {"count": 1, "average": 0.0, "histogram": {0.0: 1}})
+
+        stats = get_feedback_stats(date(2024, 3, 1), date(2024, 3, 3), model="gpt-3.5-turbo")
+        self.assertEqual((stats["count"], stats["histogram"]), (2, {0.25: 1, 0.0: 1}))
+        self.assertAlmostEqual(stats["per_day"]["2024-03-01"]["average"], 0.25)
+
+        stats = get_feedback_stats(date(2024, 3, 2), date(2024, 3, 2))
+        self.assertEqual(stats, {"count": 0, "average": None, "histogram": {}, "per_day": {}})
+
+    def test_backfill_idempotente(self):
+        self.add_chat("chat#1", "2024-03-01T10:00:00", "gpt-4", [feedback(1), feedback(0.5, "2024-03-02"), feedback(None)])
+        self.add_chat("chat#2", "2024-03-02T09:30:00", "gpt-3.5-turbo", [feedback(0.25), feedback(1, "2024-03-02")])
+        self.add_chat("chat#3", "2024-03-02T11:00:00", None, [feedback(0)])
+        #Agregado antigo, sem nenhum feedback correspondente: o backfill o substitui
+        self.redis.hset(feedback_stats_key("2023-12-31"), mapping={"count": 7, "sum": 7, "hist:1": 7})
+
+        self.assertEqual(backfill_feedback_stats(scan_count=1), 5)
+        first = {key: self.redis.hgetall(key) for key in self.redis.scan_iter(match="feedback_stats#*")}
+        self.assertEqual(sorted(first), [b"feedback_stats#2024-03-01", b"feedback_stats#2024-03-02"])
+
+        #Feedbacks sem "dia" recebem a data do chat
+        self.assertEqual(self.redis.json().get("chat#1", ".messages[0].feedback.dia"), "2024-03-01")
+        self.assertEqual(self.redis.json().get("chat#2", ".messages[0].feedback.dia"), "2024-03-02")
+
+        stats = get_feedback_stats(date(2024, 3, 1), date(2024, 3, 2))
+        self.assertEqual(stats["count"], 5)
+        self.assertAlmostEqual(stats["average"], 2.75 / 5)
+        self.assertEqual(stats["per_day"]["2024-03-01"], {"count": 1, "average": 1.0, "histogram": {1.0: 1}})
+        self.assertEqual(stats["per_day"]["2024-03-02"]["histogram"], {0.5: 1, 0.25: 1, 1.0: 1, 0.0: 1})
+
+        stats = get_feedback_stats(date(2024, 3, 1), date(2024, 3, 2), model="gpt-4")
+        self.assertEqual((stats["count"], stats["histogram"]), (2, {1.0: 1, 0.5: 1}))
+        #Chat sem modelo conta só no total
+        stats = get_feedback_stats(date(2024, 3, 1), date(2024, 3, 2), model="gpt-3.5-turbo")
+        self.assertEqual(stats["count"], 2)
+
+        #Segunda execução: mesmos agregados, sem contar nada duas vezes
+        self.assertEqual(backfill_feedback_stats(), 5)
+        second = {key: self.redis.hgetall(key) for key in self.redis.scan_iter(match="feedback_stats#*")}
+        self.assertEqual(second, first)
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis not installed")
+class TestSetFeedbackScript(unittest.TestCase):
+    """Gravação do feedback pelo script Lua (SET_FEEDBACK_LUA). Precisa de cjson e de JSON.* dentro do Lua;
+    o fakeredis 2.20 não tem nenhum dos dois, e os testes são pulados."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        try:
+            self.redis.eval("return redis.call('JSON.SET', KEYS[1], '.', cjson.encode({ok = 1}))", 1, "lua_json_probe")
+            lua_json = self.redis.json().get("lua_json_probe") == {"ok": 1}
+        except Exception:
+            lua_json = False
+        if not lua_json:
+            self.skipTest("this fakeredis runs Lua without cjson or without JSON.SET from scripts (needs Redis Stack)")
+        self.redis.delete("lua_json_probe")
+
+        for patcher in [mock.patch.object(feedback_stats, "connect", return_value=self.redis), mock.patch.object(feedback_stats, "_set_feedback_script", None)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.redis.json().set("chat#1", ".", {
+            "user_id": "laura",
+            "params": {"model": "gpt-4"},
+            "messages": [{"pergunta": "p", "resposta": "r"}, {"pergunta": "p", "resposta": "r"}],
+        })
+
+    def test_nova_nota_desconta_a_anterior(self):
+        set_feedback_with_stats("chat#1", 0, feedback(1, "2024-03-01"))
+        set_feedback_with_stats("chat#1", 1, feedback(0.5, "2024-03-01"))
+        #Mensagem avaliada de novo, em outro dia: sai da faixa e do dia antigos
+        set_feedback_with_stats("chat#1", 0, feedback(0.25, "2024-03-02"))
+
+        self.assertEqual(self.redis.json().get("chat#1", ".messages[0].feedback"), feedback(0.25, "2024-03-02"))
+        self.assertEqual(int(self.redis.hget(feedback_stats_key("2024-03-01"), "hist:1")), 0)
+        stats = get_feedback_stats(date(2024, 3, 1), date(2024, 3, 2))
+        self.assertEqual(stats["count"], 2)
+        self.assertAlmostEqual(stats["average"], 0.75 / 2)
+        self.assertEqual(stats["per_day"]["2024-03-01"], {"count": 1, "average": 0.5, "histogram": {0.5: 1}})
+        self.assertEqual(stats["per_day"]["2024-03-02"], {"count": 1, "average": 0.25, "histogram": {0.25: 1}})
+        self.assertEqual(get_feedback_stats(date(2024, 3, 1), date(2024, 3, 2), model="gpt-4")["histogram"], {0.5: 1, 0.25: 1})
+
+        #Feedback sem nota só desconta a anterior
+        set_feedback_with_stats("chat#1", 1, feedback(None, "2024-03-02"))
+        stats = get_feedback_stats(date(2024, 3, 1), date(2024, 3, 2))
+        self.assertEqual((stats["count"], stats["histogram"]), (1, {0.25: 1}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,22 @@
 from redis import Redis
+from .connection_pool import connect
+
+#Prefixo de todas as chaves de chat, e chave do contador usado para gerar os ids
+CHAT_KEY_PREFIX = "chat#"
+CHAT_ID_COUNTER_KEY = "chat_id"
+#Índice dos chats de cada usuário: sorted set com as chaves dos chats, tendo como score o timestamp de criação
+USER_CHATS_KEY_PREFIX = "user_chats#"
 
 def chat_key(chat_id) -> str:
-    return f"chat#{chat_id}"
+    return f"{CHAT_KEY_PREFIX}{chat_id}"
+
+def user_chats_key(user_id) -> str:
+    return f"{USER_CHATS_KEY_PREFIX}{user_id}"
+
+def new_chat_key(redis:Redis = None) -> str:
+    if redis is None:
+        redis = connect()
 
-def new_chat_key(redis:Redis) -> str:
     #Usa uma chave numérica do redis como contador e gerador de ids
-    new_chat_id = redis.incr("chat_id") 
-    return f"chat#{new_chat_id}"
\ No newline at end of file
+    new_chat_id = redis.incr(CHAT_ID_COUNTER_KEY) 
+    return chat_key(new_chat_id)
@@ -0,0 +1,147 @@
+from redis import Redis
+from redis.client import Pipeline
+from .connection_pool import connect
+from typing import Callable, Dict
+import atexit
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+#Tamanho máximo da fila. Com a fila cheia, submit bloqueia até haver espaço (backpressure), preservando a ordem das escritas.
+WRITE_BEHIND_MAX_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE_SIZE", 10000))
+#Máximo de operações enviadas em um mesmo pipeline
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 100))
+
+#Uma operação recebe um pipeline e enfileira nele os comandos de escrita
+WriteOperation = Callable[[Pipeline], None]
+
+
+class WriteBehindBuffer:
+    """
+    Fila de escritas no Redis, enviadas em lotes (pipelines) por uma thread em background,
+    tirando os round-trips de persistência do caminho da resposta ao usuário.
+
+    As operações são executadas na ordem em que foram submetidas.
+    Na saída do processo (atexit) a fila é esvaziada antes de encerrar.
+    Como a escrita é assíncrona, um chat lido logo depois de submeter uma escrita pode não refleti-la; usar flush() se necessário.
+    """
+    def __init__(self, max_queue_size: int = WRITE_BEHIND_MAX_QUEUE_SIZE, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 client_factory: Callable[[], Redis] = connect):
+        self.batch_size = batch_size
+        self._client_factory = client_factory
+        self._queue: "queue.Queue[WriteOperation]" = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+
+        self._metrics_lock = threading.Lock()
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.blocked_submits = 0
+
+        self._thread = threading.Thread(target=self.__run, name="chat-write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation: WriteOperation):
+        if self._closed:
+            raise Exception("WriteBehindBuffer já foi encerrado")
+
+        with self._metrics_lock:
+            self.submitted += 1
+
+        try:
+            self._queue.put_nowait(operation)
+        except queue.Full:
+            logger.warning("Fila de write-behind cheia, aguardando espaço")
+            with self._metrics_lock:
+                self.blocked_submits += 1
+            self._queue.put(operation)
+
+    def flush(self):
+        """Bloqueia até que todas as operações submetidas tenham sido enviadas ao Redis"""
+        self._queue.join()
+
+    def close(self):
+        """Esvazia a fila e encerra a thread de escrita"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def metrics(self) -> Dict:
+        with self._metrics_lock:
+            return {
+                "queued": self._queue.qsize(),
+                "submitted": self.submitted,
+                "written": self.written,
+                "failed": self.failed,
+                "batches": self.batches,
+                "blocked_submits": self.blocked_submits,
+            }
+
+    def __run(self):
+        while True:
+            operation = self._queue.get()
+            batch = [operation]
+
+            #Junta no mesmo lote o que já estiver na fila, sem esperar
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            operations = [op for op in batch if op is not None]
+            try:
+                if operations:
+                    self.__write_batch(operations)
+            except Exception:
+                #Qualquer falha perde só este lote: a thread continua esvaziando a fila, senão flush/close/submit travariam
+                logger.exception("Falha ao gravar lote de %d operações de write-behind", len(operations))
+                with self._metrics_lock:
+                    self.failed += len(operations)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if stop:
+                #Operações submetidas antes do close já foram incluídas neste ou em lotes anteriores
+                break
+
+    def __write_batch(self, operations):
+        #Sem novas tentativas: depois de uma falha de conexão não se sabe quais comandos chegaram ao Redis,
+        #e reenviar um ARRAPPEND duplicaria mensagens
+        pipe = self._client_factory().pipeline(transaction=False)
+        for operation in operations:
+            operation(pipe)
+        results = pipe.execute(raise_on_error=False)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        for error in errors:
+            logger.error("Falha em operação de write-behind: %s", error)
+
+        with self._metrics_lock:
+            self.batches += 1
+            self.failed += len(errors)
+            #Uma operação pode gerar mais de um comando, então contabiliza por operação
+            self.written += len(operations) if not errors else max(0, len(operations) - len(errors))
+
+
+_buffer: WriteBehindBuffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_write_behind_buffer() -> WriteBehindBuffer:
+    """Buffer único do processo, criado na primeira chamada e esvaziado na saída do processo"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = WriteBehindBuffer()
+                atexit.register(_buffer.close)
+    return _buffer
@@ -0,0 +1,96 @@
+import threading
+import unittest
+
+from redis.exceptions import ConnectionError
+
+from chat_persistence.write_behind import WriteBehindBuffer
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def set(self, key, value):
+        self.commands.append((key, value))
+
+    def execute(self, raise_on_error=True):
+        self.client.executions += 1
+        if self.client.fail_executions > 0:
+            self.client.fail_executions -= 1
+            raise ConnectionError("Connection reset by peer")
+        for key, value in self.commands:
+            self.client.data.setdefault(key, []).append(value)
+        return [True] * len(self.commands)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.executions = 0
+        self.fail_executions = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class TestWriteBehindBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeRedis()
+
+    def wait(self, buffer):
+        #flush não pode travar depois de uma falha
+        thread = threading.Thread(target=buffer.flush, daemon=True)
+        thread.start()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive(), "flush travou")
+
+    def test_operacao_com_erro_nao_para_a_thread(self):
+        buffer = WriteBehindBuffer(client_factory=lambda: self.client)
+
+        def bad_operation(pipe):
+            raise ValueError("comando inválido")
+
+        buffer.submit(bad_operation)
+        self.wait(buffer)
+        buffer.submit(lambda pipe: pipe.set("chat", "mensagem"))
+        self.wait(buffer)
+        buffer.close()
+
+        self.assertEqual(self.client.data, {"chat": ["mensagem"]})
+        self.assertEqual(buffer.metrics()["failed"], 1)
+        self.assertEqual(buffer.metrics()["written"], 1)
+
+    def test_falha_ao_conectar(self):
+        clients = iter([None, self.client])
+
+        def client_factory():
+            client = next(clients)
+            if client is None:
+                raise ConnectionError("Redis fora do ar")
+            return client
+
+        buffer = WriteBehindBuffer(client_factory=client_factory)
+        buffer.submit(lambda pipe: pipe.set("chat", "perdida"))
+        self.wait(buffer)
+        buffer.submit(lambda pipe: pipe.set("chat", "gravada"))
+        buffer.close()
+
+        self.assertEqual(self.client.data, {"chat": ["gravada"]})
+        self.assertEqual(buffer.metrics()["failed"], 1)
+
+    def test_lote_nao_e_reenviado(self):
+        #Uma falha de conexão no execute não reenvia o lote (o ARRAPPEND não é idempotente)
+        self.client.fail_executions = 1
+        buffer = WriteBehindBuffer(client_factory=lambda: self.client)
+        buffer.submit(lambda pipe: pipe.set("chat", "mensagem"))
+        self.wait(buffer)
+        buffer.close()
+
+        self.assertEqual(self.client.executions, 1)
+        self.assertEqual(buffer.metrics()["failed"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
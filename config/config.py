@@ -17,8 +17,15 @@ EMBEDDING_DIMENSION = 1536
 EMBEDDING_METRIC = 'cosine'
 EMBEDDINGS_TOP_K_RESULTS = 20
 
-CHUNK_SIZE = 1024
-CHUNK_OVERLAP = 256
+#Unidade de tamanho dos chunks: "chars" ou "tokens" (tokenizador do tiktoken, ver util.token_length)
+#Em tokens, o número de chunks que cabem no contexto do LLM_MODEL é previsível, o que em caracteres varia com o texto
+CHUNK_LENGTH_UNIT = os.getenv("CHUNK_LENGTH_UNIT", "chars")
+if CHUNK_LENGTH_UNIT == "tokens":
+    CHUNK_SIZE = 256
+    CHUNK_OVERLAP = 64
+else:
+    CHUNK_SIZE = 1024
+    CHUNK_OVERLAP = 256
 
 LLM_TEMPERATURE = 0.4
 LLM_MODEL = 'gpt-3.5-turbo-16k'
@@ -27,6 +34,12 @@ LLM_MAX_TOKENS = 16384
 
 HISTORY_MAX_LENGTH = 5
 
+#Regras de reescrita das perguntas (util.improve_question) e os vocabulários ativos, separados por vírgula
+QUERY_REWRITE_RULES_PATH = os.getenv("QUERY_REWRITE_RULES_PATH", os.path.join(os.path.dirname(__file__), "query_rewrite_rules.yaml"))
+QUERY_REWRITE_VOCABULARIES = [vocabulary.strip() for vocabulary in os.getenv("QUERY_REWRITE_VOCABULARIES", "bb_consorcios").split(",") if vocabulary.strip()]
+#Perguntas reescritas mantidas em memória
+QUERY_REWRITE_CACHE_SIZE = int(os.getenv("QUERY_REWRITE_CACHE_SIZE", 4096))
+
 
 # import secrets
 # import string
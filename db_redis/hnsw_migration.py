@@ -0,0 +1,301 @@
+"""
+Migração do índice vetorial do Redis de FLAT (busca exaustiva) para HNSW, sem downtime.
+
+O novo índice é criado ao lado do atual, sobre o mesmo prefixo de chaves: o RediSearch indexa em background
+os hashes já gravados, então não há cópia de dados. Quando a indexação termina, o recall@k do HNSW é medido
+contra o FLAT e, se estiver acima do mínimo, um alias passa a apontar para o novo índice (FT.ALIASUPDATE).
+
+O app deve consultar o alias: REDIS_INDEX_NAME=<alias> e REDIS_SCHEMA_PATH=db_redis/redis_schema_hnsw.yaml.
+O índice antigo só é removido com --drop-old, e sem apagar os documentos, que são compartilhados.
+O --source é obrigatório e tem de ser um índice FLAT: depois da primeira migração o REDIS_INDEX_NAME já é o alias,
+que aponta para o HNSW, e medir o recall do HNSW contra ele mesmo trocaria o alias sem checar nada.
+O redis_schema_hnsw.yaml só é escrito depois que o recall passa e o alias é trocado.
+
+Uso:
+    python -m db_redis.hnsw_migration migrate --source <índice FLAT> --alias <alias> --m 16 --ef-construction 200 --ef-runtime 20
+    python -m db_redis.hnsw_migration recall --source <índice FLAT> --target <índice HNSW> --k 10 --queries 200
+"""
+import argparse
+import copy
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import yaml
+from langchain.utilities.redis import get_client
+from langchain.vectorstores.redis.schema import RedisModel, read_schema
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+
+from retrieval.redis_parent_retriever import get_redis_url
+
+logger = logging.getLogger(__name__)
+
+CWD = os.getcwd()
+FLAT_SCHEMA_PATH = os.path.join(CWD, "db_redis", "redis_schema.yaml")
+HNSW_SCHEMA_PATH = os.path.join(CWD, "db_redis", "redis_schema_hnsw.yaml")
+VECTOR_FIELD = "content_vector"
+
+#Parâmetros do HNSW: M (arestas por nó), EF_CONSTRUCTION (qualidade do grafo na indexação)
+#e EF_RUNTIME (candidatos avaliados por consulta; mais recall e mais latência)
+DEFAULT_M = 16
+DEFAULT_EF_CONSTRUCTION = 200
+DEFAULT_EF_RUNTIME = 20
+
+#Recall@k mínimo do HNSW contra o FLAT para trocar o alias
+DEFAULT_MIN_RECALL = 0.95
+
+
+def build_hnsw_schema(flat_schema: Dict[str, Any], m: int, ef_construction: int, ef_runtime: int) -> Dict[str, Any]:
+    """Same schema, with the content vector field as HNSW with the given parameters."""
+    schema = copy.deepcopy(flat_schema)
+    for field in schema["vector"]:
+        if field["name"] == VECTOR_FIELD:
+            field.pop("block_size", None)
+            field.update({"algorithm": "HNSW", "m": m, "ef_construction": ef_construction, "ef_runtime": ef_runtime})
+    return schema
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def index_info(client, index_name: str) -> Dict[str, Any]:
+    info = {key: _decode(value) for key, value in client.ft(index_name).info().items()}
+    definition = info["index_definition"]
+    #index_definition vem como lista chave, valor, chave, valor...
+    info["definition"] = dict(zip(definition[::2], definition[1::2]))
+    return info
+
+
+def create_index(client, index_name: str, schema: Dict[str, Any], prefixes: List[str], key_type: str = "HASH"):
+    fields = RedisModel(**schema).get_fields()
+    definition = IndexDefinition(prefix=prefixes, index_type=IndexType.JSON if key_type == "JSON" else IndexType.HASH)
+    client.ft(index_name).create_index(fields, definition=definition)
+    logger.info("Index %s created over prefixes %s", index_name, prefixes)
+
+
+def wait_for_indexing(client, index_name: str, expected_docs: int, timeout: float = 3600, poll_interval: float = 5):
+    """Block until the background indexing of the existing keys finishes."""
+    deadline = time.monotonic() + timeout
+    while True:
+        info = index_info(client, index_name)
+        indexing = int(info.get("indexing", 0))
+        num_docs = int(info["num_docs"])
+        logger.info("%s: %d/%d docs, %.0f%% indexed", index_name, num_docs, expected_docs, 100 * float(info.get("percent_indexed", 1)))
+        if not indexing and num_docs >= expected_docs:
+            return info
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Index {index_name} not ready after {timeout}s ({num_docs}/{expected_docs} docs)")
+        time.sleep(poll_interval)
+
+
+def sample_keys(client, prefixes: List[str], total: int, seed: int = 0) -> List[bytes]:
+    keys = []
+    for prefix in prefixes:
+        keys.extend(client.scan_iter(match=f"{prefix}*", count=1000))
+    return random.Random(seed).sample(keys, min(total, len(keys)))
+
+
+def sample_query_vectors(client, prefixes: List[str], total: int, seed: int = 0) -> List[bytes]:
+    """Vectors of random stored documents, as query set, when there is no set of real questions."""
+    keys = sample_keys(client, prefixes, total, seed)
+
+    pipeline = client.pipeline(transaction=False)
+    for key in keys:
+        pipeline.hget(key, VECTOR_FIELD)
+    return [vector for vector in pipeline.execute() if vector is not None]
+
+
+def embed_query_file(path: str) -> List[bytes]:
+    """Embeddings of the questions in a text file, one per line."""
+    from langchain.embeddings.openai import OpenAIEmbeddings
+
+    with open(path, encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+    vectors = OpenAIEmbeddings(model="text-embedding-ada-002").embed_documents(questions)
+    return [np.asarray(vector, dtype=np.float32).tobytes() for vector in vectors]
+
+
+def knn(client, index_name: str, vector: bytes, k: int, ef_runtime: Optional[int] = None, vector_field: str = VECTOR_FIELD) -> Tuple[List[str], float]:
+    """Ids of the k nearest documents and the query latency in seconds."""
+    ef = f" EF_RUNTIME {ef_runtime}" if ef_runtime else ""
+    query = (
+        Query(f"*=>[KNN {k} @{vector_field} $vector{ef} AS vector_distance]")
+        .sort_by("vector_distance")
+        .return_fields("vector_distance")
+        .paging(0, k)
+        .dialect(2)
+    )
+    start = time.perf_counter()
+    result = client.ft(index_name).search(query, {"vector": vector})
+    return [doc.id for doc in result.docs], time.perf_counter() - start
+
+
+def measure_recall(client, exact_index: str, approximate_index: str, query_vectors: List[bytes], k: int = 10, ef_runtime: Optional[int] = None) -> Dict[str, float]:
+    """Recall@k of the approximate index, taking the FLAT index results as ground truth, plus latency percentiles."""
+    found = 0
+    expected = 0
+    exact_latencies, approximate_latencies = [], []
+    for vector in query_vectors:
+        exact_ids, exact_latency = knn(client, exact_index, vector, k)
+        approximate_ids, approximate_latency = knn(client, approximate_index, vector, k, ef_runtime)
+        found += len(set(exact_ids) & set(approximate_ids))
+        expected += len(exact_ids)
+        exact_latencies.append(exact_latency)
+        approximate_latencies.append(approximate_latency)
+
+    return {
+        "recall": found / expected if expected > 0 else 0.0,
+        "queries": len(query_vectors),
+        "exact_p50_ms": 1000 * float(np.percentile(exact_latencies, 50)),
+        "exact_p95_ms": 1000 * float(np.percentile(exact_latencies, 95)),
+        "approximate_p50_ms": 1000 * float(np.percentile(approximate_latencies, 50)),
+        "approximate_p95_ms": 1000 * float(np.percentile(approximate_latencies, 95)),
+    }
+
+
+def resolve_index(client, name: str) -> str:
+    """Real index name behind an alias (or the name itself)."""
+    return index_info(client, name)["index_name"]
+
+
+def vector_algorithm(info: Dict[str, Any], field_name: str = VECTOR_FIELD) -> Optional[str]:
+    """Algorithm (FLAT/HNSW) of a vector field, from the attributes of FT.INFO."""
+    for attribute in info.get("attributes", []):
+        #Lista chave, valor, ...; conforme a versão, os parâmetros do vetor vêm numa sublista
+        if field_name not in attribute:
+            continue
+        pending = [attribute]
+        while pending:
+            items = pending.pop()
+            for position, item in enumerate(items):
+                if isinstance(item, list):
+                    pending.append(item)
+                elif isinstance(item, str) and item.upper() == "ALGORITHM" and position + 1 < len(items):
+                    return str(items[position + 1]).upper()
+    return None
+
+
+def require_flat(client, name: str) -> str:
+    """Real name of a FLAT index, given it or an alias; ValueError if the vector field is not FLAT."""
+    index_name = resolve_index(client, name)
+    algorithm = vector_algorithm(index_info(client, index_name))
+    if algorithm != "FLAT":
+        raise ValueError(f"{name} ({index_name}) is a {algorithm} index; the source must be the FLAT index used as ground truth")
+    return index_name
+
+
+def swap_alias(client, alias: str, index_name: str):
+    #ALIASUPDATE cria o alias ou o move atomicamente, sem janela em que ele não exista
+    client.ft(index_name).aliasupdate(alias)
+    logger.info("Alias %s -> %s", alias, index_name)
+
+
+def migrate(
+    client,
+    source: str,
+    alias: str,
+    target: Optional[str] = None,
+    m: int = DEFAULT_M,
+    ef_construction: int = DEFAULT_EF_CONSTRUCTION,
+    ef_runtime: int = DEFAULT_EF_RUNTIME,
+    flat_schema_path: str = FLAT_SCHEMA_PATH,
+    hnsw_schema_path: str = HNSW_SCHEMA_PATH,
+    query_vectors: Optional[List[bytes]] = None,
+    queries: int = 200,
+    k: int = 10,
+    min_recall: float = DEFAULT_MIN_RECALL,
+    drop_old: bool = False,
+) -> Dict[str, float]:
+    source = require_flat(client, source)
+    source_info = index_info(client, source)
+    prefixes = source_info["definition"]["prefixes"]
+    target = target or f"{source}_hnsw_m{m}_ef{ef_construction}"
+
+    schema = build_hnsw_schema(read_schema(flat_schema_path), m, ef_construction, ef_runtime)
+    create_index(client, target, schema, prefixes, source_info["definition"].get("key_type", "HASH"))
+    wait_for_indexing(client, target, int(source_info["num_docs"]))
+
+    if query_vectors is None:
+        query_vectors = sample_query_vectors(client, prefixes, queries)
+    metrics = measure_recall(client, source, target, query_vectors, k)
+    logger.info("recall@%d of %s vs %s: %s", k, target, source, metrics)
+
+    if metrics["recall"] < min_recall:
+        raise RuntimeError(
+            f"recall@{k} {metrics['recall']:.3f} below {min_recall}; alias {alias} not changed. "
+            f"Increase --ef-runtime or --m and run again, or drop {target}."
+        )
+
+    previous = None
+    try:
+        previous = resolve_index(client, alias)
+    except Exception:
+        pass
+    swap_alias(client, alias, target)
+    #Só agora o app pode passar a usar o schema HNSW
+    with open(hnsw_schema_path, "w") as f:
+        yaml.safe_dump(schema, f)
+
+    if drop_old and previous is not None and previous != target:
+        #Os documentos são os mesmos do novo índice, não podem ser apagados
+        client.ft(previous).dropindex(delete_documents=False)
+        logger.info("Index %s dropped (documents kept)", previous)
+
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="create the HNSW index, measure recall and swap the alias")
+    migrate_parser.add_argument("--source", required=True, help="current FLAT index (or an alias to it)")
+    migrate_parser.add_argument("--alias", required=True, help="alias queried by the app")
+    migrate_parser.add_argument("--target", help="name of the new index")
+    migrate_parser.add_argument("--m", type=int, default=DEFAULT_M)
+    migrate_parser.add_argument("--ef-construction", type=int, default=DEFAULT_EF_CONSTRUCTION)
+    migrate_parser.add_argument("--ef-runtime", type=int, default=DEFAULT_EF_RUNTIME)
+    migrate_parser.add_argument("--min-recall", type=float, default=DEFAULT_MIN_RECALL)
+    migrate_parser.add_argument("--drop-old", action="store_true", help="drop the index previously behind the alias")
+
+    recall_parser = subparsers.add_parser("recall", help="recall@k and latency of an index against the FLAT index")
+    recall_parser.add_argument("--source", required=True, help="FLAT index (ground truth)")
+    recall_parser.add_argument("--target", required=True, help="index to evaluate")
+    recall_parser.add_argument("--ef-runtime", type=int, help="overrides the EF_RUNTIME of the index in the queries")
+
+    for subparser in [migrate_parser, recall_parser]:
+        subparser.add_argument("--k", type=int, default=10)
+        subparser.add_argument("--queries", type=int, default=200, help="stored vectors sampled as queries")
+        subparser.add_argument("--queries-file", help="text file with one question per line, used instead of the sample")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    client = get_client(get_redis_url())
+    query_vectors = embed_query_file(args.queries_file) if args.queries_file else None
+
+    if args.command == "migrate":
+        metrics = migrate(
+            client, args.source, args.alias, args.target, args.m, args.ef_construction, args.ef_runtime,
+            query_vectors=query_vectors, queries=args.queries, k=args.k, min_recall=args.min_recall, drop_old=args.drop_old,
+        )
+    else:
+        source = require_flat(client, args.source)
+        if query_vectors is None:
+            query_vectors = sample_query_vectors(client, index_info(client, source)["definition"]["prefixes"], args.queries)
+        metrics = measure_recall(client, source, args.target, query_vectors, args.k, args.ef_runtime)
+
+    for name, value in metrics.items():
+        print(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from langchain.vectorstores.redis.schema import read_schema
+
+from db_redis.hnsw_migration import build_hnsw_schema, measure_recall, migrate, resolve_index
+
+FLAT_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "redis_schema.yaml")
+
+
+class FakeSearchClient:
+    """Só o que a migração usa do FT.*: info, create_index, search, aliasupdate e dropindex.
+    results[índice][vetor] são os ids devolvidos pelo KNN de cada índice."""
+
+    def __init__(self, results, algorithms):
+        self.results = results
+        self.algorithms = algorithms
+        self.aliases = {}
+        self.dropped = []
+
+    def ft(self, name):
+        return FakeIndex(self, name)
+
+
+class FakeIndex:
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = client.aliases.get(name, name)
+
+    def info(self):
+        if self.name not in self.client.algorithms:
+            raise Exception("Unknown index name")
+        return {
+            "index_name": self.name,
+            "index_definition": ["key_type", "HASH", "prefixes", ["doc:"]],
+            "attributes": [["identifier", "content_vector", "attribute", "content_vector", "type", "VECTOR", "algorithm", self.client.algorithms[self.name]]],
+            "num_docs": "3",
+            "indexing": "0",
+            "percent_indexed": "1",
+        }
+
+    def create_index(self, fields, definition=None):
+        algorithm = next(field.args[2] for field in fields if field.name == "content_vector")
+        self.client.algorithms[self.name] = algorithm.decode() if isinstance(algorithm, bytes) else algorithm
+
+    def search(self, query, query_params=None):
+        ids = self.client.results[self.name][query_params["vector"]]
+        return SimpleNamespace(docs=[SimpleNamespace(id=id) for id in ids])
+
+    def aliasupdate(self, alias):
+        self.client.aliases[alias] = self.name
+
+    def dropindex(self, delete_documents=False):
+        self.client.dropped.append((self.name, delete_documents))
+        del self.client.algorithms[self.name]
+
+
+class TestHnswMigration(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.hnsw_schema_path = os.path.join(self.directory.name, "redis_schema_hnsw.yaml")
+        self.queries = [b"q1", b"q2"]
+        self.results = {"flat": {b"q1": ["doc:1", "doc:2"], b"q2": ["doc:3", "doc:1"]}}
+
+    def client(self, approximate):
+        #O índice HNSW criado pela migração se chama "hnsw" em todos os testes
+        client = FakeSearchClient({**self.results, "hnsw": approximate}, {"flat": "FLAT"})
+        client.aliases["app"] = "flat"
+        return client
+
+    def migrate(self, client, source="app", **kwargs):
+        return migrate(client, source, "app", target="hnsw", flat_schema_path=FLAT_SCHEMA, hnsw_schema_path=self.hnsw_schema_path, query_vectors=self.queries, k=2, **kwargs)
+
+    def test_schema_hnsw(self):
+        flat = read_schema(FLAT_SCHEMA)
+        flat["vector"][0]["block_size"] = 1000
+        schema = build_hnsw_schema(flat, m=32, ef_construction=400, ef_runtime=50)
+
+        self.assertEqual(schema["vector"][0], {
+            "algorithm": "HNSW", "datatype": "FLOAT32", "dims": 1536, "distance_metric": "COSINE", "name": "content_vector",
+            "m": 32, "ef_construction": 400, "ef_runtime": 50,
+        })
+        self.assertEqual({key: value for key, value in schema.items() if key != "vector"}, {key: value for key, value in flat.items() if key != "vector"})
+        #O schema original não é alterado
+        self.assertEqual(flat["vector"][0]["algorithm"], "FLAT")
+
+    def test_recall(self):
+        client = self.client({b"q1": ["doc:2", "doc:9"], b"q2": ["doc:1", "doc:3"]})
+        client.algorithms["hnsw"] = "HNSW"
+        metrics = measure_recall(client, "flat", "hnsw", self.queries, k=2)
+        self.assertEqual(metrics["recall"], 0.75)
+        self.assertEqual(metrics["queries"], 2)
+
+    def test_resolve_index(self):
+        client = self.client({})
+        self.assertEqual(resolve_index(client, "app"), "flat")
+        self.assertEqual(resolve_index(client, "flat"), "flat")
+        with self.assertRaises(Exception):
+            resolve_index(client, "nao_existe")
+
+    def test_recall_abaixo_do_minimo_nao_troca_alias(self):
+        client = self.client({b"q1": ["doc:1", "doc:9"], b"q2": ["doc:3", "doc:9"]})
+        with self.assertRaises(RuntimeError):
+            self.migrate(client, min_recall=0.95, drop_old=True)
+
+        self.assertEqual(client.aliases["app"], "flat")
+        self.assertEqual(client.dropped, [])
+        #O app continua no schema FLAT
+        self.assertFalse(os.path.exists(self.hnsw_schema_path))
+
+    def test_troca_alias_e_remove_antigo_so_com_drop_old(self):
+        approximate = {b"q1": ["doc:2", "doc:1"], b"q2": ["doc:1", "doc:3"]}
+        client = self.client(approximate)
+        self.assertEqual(self.migrate(client)["recall"], 1.0)
+        self.assertEqual(client.aliases["app"], "hnsw")
+        self.assertEqual(client.dropped, [])
+        self.assertEqual(read_schema(self.hnsw_schema_path)["vector"][0]["algorithm"], "HNSW")
+
+        client = self.client(approximate)
+        self.migrate(client, source="flat", drop_old=True)
+        self.assertEqual(client.aliases["app"], "hnsw")
+        #Documentos compartilhados com o novo índice: só o índice é removido
+        self.assertEqual(client.dropped, [("flat", False)])
+
+    def test_origem_precisa_ser_flat(self):
+        client = self.client({})
+        client.algorithms["hnsw"] = "HNSW"
+        client.aliases["app"] = "hnsw"
+        #Depois da primeira migração, o alias aponta para o HNSW
+        with self.assertRaises(ValueError):
+            self.migrate(client)
+        self.assertEqual(client.aliases["app"], "hnsw")
+
+
+if __name__ == '__main__':
+    unittest.main()
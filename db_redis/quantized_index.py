@@ -0,0 +1,257 @@
+"""
+Índice vetorial compacto no Redis: cada hash ganha um campo content_vector_q, com o embedding reduzido
+(PCA/truncamento) e/ou em float16, e um novo índice é criado só sobre esse campo. O content_vector original
+continua no hash, sem índice, e é usado para re-ranquear os candidatos com precisão total.
+
+O content_vector_q aumenta cada hash, então a economia reportada é líquida: o índice vetorial (vector_index_sz_mb
+no FT.INFO, com uma cópia de cada vetor e, no HNSW, o grafo) mais os hashes, medidos com MEMORY USAGE numa amostra
+de chaves, antes (índice original, hashes sem o campo compacto) e depois (índice compacto, hashes com os dois
+campos e o índice original removido). Os parâmetros da compressão (base da PCA) ficam em db_redis/<índice>.compressor.npz,
+pois as consultas têm de ser comprimidas do mesmo jeito. Documentos carregados depois do build só entram no índice
+compacto quando o campo é gravado para eles (write_quantized_vectors).
+
+Tipos de vetor no RediSearch: FLOAT32 em qualquer versão, FLOAT16 a partir do Redis Stack 7.4 (o docker-compose
+usa 7.2). int8 não é suportado no índice; use-o nos arquivos locais (embeddings/vector_quantization.py).
+
+Uso:
+    python -m db_redis.quantized_index build --source <índice> --codec float16 --dimensions 256
+    python -m db_redis.quantized_index recall --source <índice> --target <índice>_q --k 10
+"""
+import argparse
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.utilities.redis import get_client
+from langchain.vectorstores.redis.schema import RedisModel, read_schema
+from redis.commands.search.field import VectorField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+
+from embeddings.vector_quantization import VectorCompressor
+from embeddings.vector_search import normalize_rows
+from retrieval.redis_parent_retriever import get_redis_url
+from db_redis.hnsw_migration import FLAT_SCHEMA_PATH, VECTOR_FIELD, index_info, knn, resolve_index, sample_keys, sample_query_vectors, wait_for_indexing
+
+logger = logging.getLogger(__name__)
+
+CWD = os.getcwd()
+QUANTIZED_VECTOR_FIELD = "content_vector_q"
+REDIS_VECTOR_TYPES = {"float32": "FLOAT32", "float16": "FLOAT16"}
+
+#Hashes atualizados por pipeline ao gravar o campo compacto
+WRITE_BATCH_SIZE = 500
+#Candidatos buscados no índice compacto para cada resultado final, antes do re-ranking
+DEFAULT_RERANK_FACTOR = 4
+#Chaves amostradas com MEMORY USAGE para estimar a memória dos hashes
+DEFAULT_MEMORY_SAMPLE_SIZE = 200
+
+
+def compressor_path(index_name: str) -> str:
+    return os.path.join(CWD, "db_redis", f"{index_name}.compressor.npz")
+
+
+def scan_keys(client, prefixes: List[str]) -> List[bytes]:
+    keys = []
+    for prefix in prefixes:
+        keys.extend(client.scan_iter(match=f"{prefix}*", count=1000))
+    return keys
+
+
+def encode_for_redis(compressor: VectorCompressor, vectors: np.ndarray) -> List[bytes]:
+    return [row.tobytes() for row in compressor.compress(vectors)]
+
+
+def write_quantized_vectors(client, keys: List[bytes], compressor: VectorCompressor, batch_size: int = WRITE_BATCH_SIZE):
+    """Read content_vector of each key and write the compressed version in content_vector_q, in pipelined batches."""
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        pipeline = client.pipeline(transaction=False)
+        for key in batch:
+            pipeline.hget(key, VECTOR_FIELD)
+        present = [(key, vector) for key, vector in zip(batch, pipeline.execute()) if vector is not None]
+        if not present:
+            continue
+
+        vectors = np.vstack([np.frombuffer(vector, dtype=np.float32) for _, vector in present])
+        pipeline = client.pipeline(transaction=False)
+        for (key, _), code in zip(present, encode_for_redis(compressor, vectors)):
+            pipeline.hset(key, QUANTIZED_VECTOR_FIELD, code)
+        pipeline.execute()
+        logger.info("%d/%d compressed vectors written", start + len(batch), len(keys))
+
+
+def quantized_index_fields(schema: Dict[str, Any], compressor: VectorCompressor, dimension: int) -> list:
+    """Same text/tag/numeric fields of the schema, and only the compressed vector field."""
+    vector_field = next(field for field in schema["vector"] if field["name"] == VECTOR_FIELD)
+    attributes = {
+        "TYPE": REDIS_VECTOR_TYPES[compressor.codec.name],
+        "DIM": compressor.dimensions or dimension,
+        "DISTANCE_METRIC": vector_field.get("distance_metric", "COSINE").upper(),
+    }
+    algorithm = vector_field.get("algorithm", "FLAT").upper()
+    if algorithm == "HNSW":
+        attributes.update({
+            "M": vector_field.get("m", 16),
+            "EF_CONSTRUCTION": vector_field.get("ef_construction", 200),
+            "EF_RUNTIME": vector_field.get("ef_runtime", 10),
+        })
+
+    #O RedisModel do langchain só aceita FLOAT32/FLOAT64, então o campo vetorial é montado direto
+    other_fields = RedisModel(**{key: value for key, value in schema.items() if key != "vector"}).get_fields()
+    return other_fields + [VectorField(QUANTIZED_VECTOR_FIELD, algorithm, attributes)]
+
+
+def build(
+    client,
+    source: str,
+    target: Optional[str] = None,
+    codec: str = "float16",
+    dimensions: Optional[int] = None,
+    reduction: str = "pca",
+    schema_path: str = FLAT_SCHEMA_PATH,
+    fit_sample_size: int = 20_000,
+) -> Tuple[str, VectorCompressor]:
+    if codec not in REDIS_VECTOR_TYPES:
+        raise ValueError(f"RediSearch vector fields do not support {codec}. Use one of {list(REDIS_VECTOR_TYPES)}")
+
+    source = resolve_index(client, source)
+    source_info = index_info(client, source)
+    prefixes = source_info["definition"]["prefixes"]
+    target = target or f"{source}_q"
+
+    sample = np.vstack([np.frombuffer(vector, dtype=np.float32) for vector in sample_query_vectors(client, prefixes, fit_sample_size)])
+    compressor = VectorCompressor(codec, dimensions, reduction).fit(sample)
+    compressor.save(compressor_path(target), np.empty((0, 0), dtype=compressor.codec.dtype))
+
+    write_quantized_vectors(client, scan_keys(client, prefixes), compressor)
+
+    fields = quantized_index_fields(read_schema(schema_path), compressor, sample.shape[1])
+    client.ft(target).create_index(fields, definition=IndexDefinition(prefix=prefixes, index_type=IndexType.HASH))
+    wait_for_indexing(client, target, int(source_info["num_docs"]))
+    return target, compressor
+
+
+def search_with_rerank(client, index_name: str, compressor: VectorCompressor, query_vector: np.ndarray, k: int = 10, rerank_factor: int = DEFAULT_RERANK_FACTOR) -> List[Tuple[str, float]]:
+    """(key, cosine similarity) of the k most similar documents: k * rerank_factor candidates from the
+    compressed index, re-ranked with the full content_vector of each one."""
+    query_code = encode_for_redis(compressor, np.atleast_2d(np.asarray(query_vector, dtype=np.float32)))[0]
+    candidates, _ = knn(client, index_name, query_code, k * rerank_factor, vector_field=QUANTIZED_VECTOR_FIELD)
+    if not candidates:
+        return []
+
+    pipeline = client.pipeline(transaction=False)
+    for key in candidates:
+        pipeline.hget(key, VECTOR_FIELD)
+    #Chaves apagadas (ou sem o vetor completo) entre a busca e o hget ficam de fora
+    present = [(key, vector) for key, vector in zip(candidates, pipeline.execute()) if vector is not None]
+    if not present:
+        return []
+    full_vectors = normalize_rows(np.vstack([np.frombuffer(vector, dtype=np.float32) for _, vector in present]))
+
+    scores = full_vectors @ normalize_rows(np.atleast_2d(np.asarray(query_vector, dtype=np.float32)))[0]
+    order = np.argsort(-scores)[:k]
+    return [(present[position][0], float(scores[position])) for position in order]
+
+
+def hash_memory(client, keys: List[bytes], num_docs: int) -> Dict[str, float]:
+    """MB of all the hashes, and the part of it taken by content_vector_q, extrapolated to num_docs from the sampled keys."""
+    if not keys:
+        return {"hash_mb": 0.0, "quantized_field_mb": 0.0}
+    hash_bytes = 0
+    quantized_field_bytes = 0
+    for key in keys:
+        hash_bytes += client.memory_usage(key, samples=0) or 0
+        #Valor e nome do campo; o overhead do par no hash fica de fora, então o "antes" sai um pouco maior que o real
+        if client.hexists(key, QUANTIZED_VECTOR_FIELD):
+            quantized_field_bytes += client.hstrlen(key, QUANTIZED_VECTOR_FIELD) + len(QUANTIZED_VECTOR_FIELD)
+    scale = num_docs / len(keys) / 2**20
+    return {"hash_mb": hash_bytes * scale, "quantized_field_mb": quantized_field_bytes * scale}
+
+
+def measure(
+    client,
+    exact_index: str,
+    quantized_index: str,
+    compressor: VectorCompressor,
+    query_vectors: List[bytes],
+    k: int = 10,
+    rerank_factor: int = DEFAULT_RERANK_FACTOR,
+    memory_sample_size: int = DEFAULT_MEMORY_SAMPLE_SIZE,
+) -> Dict[str, float]:
+    """Recall@k of the compressed index, with and without re-ranking, against the full-precision index, and the
+    net memory change of switching to it (vector indexes plus hashes)."""
+    found_compressed = 0
+    found_reranked = 0
+    expected = 0
+    for vector in query_vectors:
+        exact_ids, _ = knn(client, exact_index, vector, k)
+        query = np.frombuffer(vector, dtype=np.float32)
+        compressed_ids, _ = knn(client, quantized_index, encode_for_redis(compressor, np.atleast_2d(query))[0], k, vector_field=QUANTIZED_VECTOR_FIELD)
+        reranked_ids = [key for key, _ in search_with_rerank(client, quantized_index, compressor, query, k, rerank_factor)]
+
+        expected += len(exact_ids)
+        found_compressed += len(set(exact_ids) & set(compressed_ids))
+        found_reranked += len(set(exact_ids) & set(reranked_ids))
+
+    exact_info = index_info(client, exact_index)
+    exact_index_memory = float(exact_info.get("vector_index_sz_mb", 0))
+    quantized_index_memory = float(index_info(client, quantized_index).get("vector_index_sz_mb", 0))
+    keys = sample_keys(client, exact_info["definition"]["prefixes"], memory_sample_size)
+    hashes = hash_memory(client, keys, int(exact_info["num_docs"]))
+
+    #Antes: índice original e hashes sem o campo compacto. Depois: índice compacto e hashes com os dois vetores
+    before = exact_index_memory + hashes["hash_mb"] - hashes["quantized_field_mb"]
+    after = quantized_index_memory + hashes["hash_mb"]
+    return {
+        "recall_compressed": found_compressed / expected if expected > 0 else 0.0,
+        "recall_reranked": found_reranked / expected if expected > 0 else 0.0,
+        "exact_vector_index_mb": exact_index_memory,
+        "quantized_vector_index_mb": quantized_index_memory,
+        "hash_mb": hashes["hash_mb"],
+        "quantized_field_mb": hashes["quantized_field_mb"],
+        "memory_saved": 1 - after / before if before > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="write the compressed vectors and create the compact index")
+    build_parser.add_argument("--source", default=os.getenv("REDIS_INDEX_NAME"), help="current full-precision index (or alias)")
+    build_parser.add_argument("--target", help="name of the compact index (default <source>_q)")
+    build_parser.add_argument("--codec", choices=list(REDIS_VECTOR_TYPES), default="float16")
+    build_parser.add_argument("--dimensions", type=int, help="reduced dimension (default: no reduction)")
+    build_parser.add_argument("--reduction", choices=["pca", "truncate"], default="pca")
+
+    recall_parser = subparsers.add_parser("recall", help="recall@k and memory of the compact index against the full one")
+    recall_parser.add_argument("--source", default=os.getenv("REDIS_INDEX_NAME"), help="full-precision index (ground truth)")
+    recall_parser.add_argument("--target", required=True, help="compact index")
+    recall_parser.add_argument("--rerank-factor", type=int, default=DEFAULT_RERANK_FACTOR)
+
+    for subparser in [build_parser, recall_parser]:
+        subparser.add_argument("--k", type=int, default=10)
+        subparser.add_argument("--queries", type=int, default=200, help="stored vectors sampled as queries")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    client = get_client(get_redis_url())
+
+    if args.command == "build":
+        target, compressor = build(client, args.source, args.target, args.codec, args.dimensions, args.reduction)
+        rerank_factor = DEFAULT_RERANK_FACTOR
+    else:
+        target = args.target
+        compressor, _ = VectorCompressor.load(compressor_path(target))
+        rerank_factor = args.rerank_factor
+
+    source = resolve_index(client, args.source)
+    query_vectors = sample_query_vectors(client, index_info(client, source)["definition"]["prefixes"], args.queries)
+    metrics = measure(client, source, target, compressor, query_vectors, args.k, rerank_factor)
+    for name, value in metrics.items():
+        print(f"{name}: {value:.3f}")
+
+
+if __name__ == "__main__":
+    main()
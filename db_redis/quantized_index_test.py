@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from db_redis import quantized_index
+from db_redis.quantized_index import QUANTIZED_VECTOR_FIELD, VECTOR_FIELD, hash_memory, search_with_rerank, write_quantized_vectors
+from embeddings.vector_quantization import VectorCompressor
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis not installed")
+class TestQuantizedIndex(unittest.TestCase):
+    """Busca KNN e FT.INFO não existem no fakeredis: o knn é substituído pelos candidatos de cada teste."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.vectors = np.random.default_rng(0).normal(size=(4, 8)).astype(np.float32)
+        for i, vector in enumerate(self.vectors):
+            self.redis.hset(f"doc:{i}", mapping={"content": f"Cláusula {i}", VECTOR_FIELD: vector.tobytes()})
+        self.compressor = VectorCompressor("float16").fit(self.vectors)
+        write_quantized_vectors(self.redis, [f"doc:{i}".encode() for i in range(4)], self.compressor)
+
+    def test_rerank_ignora_chaves_sem_vetor(self):
+        self.redis.delete("doc:1")
+        candidates = ["doc:0", "doc:1", "doc:2", "doc:3"]
+        with mock.patch.object(quantized_index, "knn", return_value=(candidates, 0.0)):
+            results = search_with_rerank(self.redis, "idx_q", self.compressor, self.vectors[2], k=3)
+
+        self.assertEqual(len(results), 3)
+        self.assertNotIn("doc:1", [key for key, _ in results])
+        self.assertEqual(results[0][0], "doc:2")
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+
+        with mock.patch.object(quantized_index, "knn", return_value=(["doc:1"], 0.0)):
+            self.assertEqual(search_with_rerank(self.redis, "idx_q", self.compressor, self.vectors[2]), [])
+
+    def test_memoria_dos_hashes(self):
+        #MEMORY USAGE não existe no fakeredis: tamanho dos campos e valores de cada hash
+        def memory_usage(key, samples=None):
+            return sum(len(field) + len(value) for field, value in self.redis.hgetall(key).items())
+
+        keys = [b"doc:0", b"doc:1"]
+        with mock.patch.object(self.redis, "memory_usage", side_effect=memory_usage):
+            memory = hash_memory(self.redis, keys, num_docs=4)
+
+        field_bytes = 8 * 2 + len(QUANTIZED_VECTOR_FIELD)
+        self.assertAlmostEqual(memory["quantized_field_mb"], 4 * field_bytes / 2**20)
+        self.assertAlmostEqual(memory["hash_mb"], 2 * sum(memory_usage(key) for key in keys) / 2**20)
+        self.assertEqual(hash_memory(self.redis, [], num_docs=4), {"hash_mb": 0.0, "quantized_field_mb": 0.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import openai
+
+import util
+from embeddings.embedding_cache import EmbeddingCache, to_stored_precision
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = 'text-embedding-ada-002'
+
+#Limites da API de embeddings: textos por requisição e tokens por texto
+MAX_TEXTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_TEXT = 8191
+
+#Erros transitórios, em que vale a pena tentar de novo
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+    openai.error.APIError,
+)
+
+
+class BatchEmbedder:
+    """Generates embeddings for many texts with few requests.
+
+    Texts are packed into requests of up to max_tokens_per_request tokens (and MAX_TEXTS_PER_REQUEST texts),
+    texts over MAX_TOKENS_PER_TEXT are rejected before any request is sent,
+    requests run concurrently in a bounded thread pool, transient failures are retried with exponential
+    backoff and jitter, and results come back in the same order as the input texts.
+
+    Examples:
+        embedder = BatchEmbedder(max_concurrency=4)
+        vectors = embedder.embed(["first chunk", "second chunk"])
+
+        #Skipping texts already embedded in previous runs
+        embedder = BatchEmbedder(cache=EmbeddingCache())
+
+        #Against the local stub server, for tests and benchmarks
+        with EmbeddingStubServer() as server:
+            vectors = BatchEmbedder(api_base=server.api_base, api_key="stub").embed(texts)
+    """
+
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        max_tokens_per_request: int = 100_000,
+        max_concurrency: int = 4,
+        max_retries: int = 6,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        api_base: Optional[str] = None,
+        api_key: Optional[str] = None,
+        request_timeout: Optional[float] = 60,
+        cache: Optional[EmbeddingCache] = None,
+        token_counter: Optional[Callable[[List[str]], List[int]]] = None,
+    ):
+        self.model = model
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.api_base = api_base
+        self.api_key = api_key
+        self.request_timeout = request_timeout
+        self.cache = cache
+        #Número de tokens de cada texto; por padrão o tokenizador do modelo (tiktoken)
+        self.token_counter = token_counter or (lambda texts: util.token_lengths(texts, self.model))
+
+        #Métricas da última chamada de embed
+        self.requests = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.avoided_tokens = 0
+        self.avoided_cost = 0.0
+        self._metrics_lock = threading.Lock()
+
+    def pack(self, texts: Sequence[str]) -> List[Tuple[int, int]]:
+        """Split texts in batches, as (start, end) ranges, respecting the token and text limits per request.
+
+        The input order is kept, so results can be concatenated back. A text alone over the limit goes in its own request.
+        Raises ValueError if any text is over MAX_TOKENS_PER_TEXT, which the API would reject.
+        """
+        token_counts = self.token_counter(list(texts))
+
+        too_long = [index for index, token_count in enumerate(token_counts) if token_count > MAX_TOKENS_PER_TEXT]
+        if too_long:
+            longest = max(too_long, key=lambda index: token_counts[index])
+            raise ValueError(
+                f"{len(too_long)} texts over the limit of {MAX_TOKENS_PER_TEXT} tokens per text of {self.model}, "
+                f"the longest with {token_counts[longest]} tokens: {texts[longest][:80]!r}... Split them in smaller chunks."
+            )
+
+        batches = []
+        start = 0
+        batch_tokens = 0
+        for index, token_count in enumerate(token_counts):
+            batch_full = (
+                index - start >= MAX_TEXTS_PER_REQUEST
+                or batch_tokens + token_count > self.max_tokens_per_request
+            )
+            if batch_full and index > start:
+                batches.append((start, index))
+                start = index
+                batch_tokens = 0
+            batch_tokens += token_count
+
+        if start < len(token_counts):
+            batches.append((start, len(token_counts)))
+
+        return batches
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """Embeddings of the texts, in the same order."""
+        #Mesmo tratamento do openai.embeddings_utils.get_embedding, que era usado antes
+        texts = [text.replace("\n", " ") for text in texts]
+        self.requests = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.avoided_tokens = 0
+        self.avoided_cost = 0.0
+        if len(texts) == 0:
+            return []
+
+        start_time = time.perf_counter()
+
+        result: List[Optional[List[float]]] = self.cache.get_many(self.model, texts) if self.cache is not None else [None] * len(texts)
+        hit_texts = [text for text, vector in zip(texts, result) if vector is not None]
+        if hit_texts:
+            self.cache_hits = len(hit_texts)
+            self.avoided_tokens = sum(self.token_counter(hit_texts))
+            #Os tokens já vêm do token_counter, que pode não ser o tiktoken; só o preço vem do util
+            self.avoided_cost = util.price_for_tokens(self.avoided_tokens)
+
+        #Textos repetidos são enviados uma única vez
+        missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, result) if vector is None))
+        if missing_texts:
+            batches = self.pack(missing_texts)
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                #map preserva a ordem dos lotes, que por sua vez preservam a ordem dos textos
+                batch_results = executor.map(lambda batch: self._embed_batch(missing_texts[batch[0]:batch[1]]), batches)
+                new_vectors = [vector for batch_vectors in batch_results for vector in batch_vectors]
+
+            if self.cache is not None:
+                new_vectors = to_stored_precision(new_vectors)
+                self.cache.put_many(self.model, missing_texts, new_vectors)
+
+            vectors_by_text = dict(zip(missing_texts, new_vectors))
+            result = [vector if vector is not None else vectors_by_text[text] for text, vector in zip(texts, result)]
+
+        elapsed = time.perf_counter() - start_time
+        logger.info(
+            "%d embeddings in %d requests (%d retries), %.2fs (%.1f texts/s)",
+            len(result), self.requests, self.retries, elapsed, len(result) / elapsed if elapsed > 0 else float("inf")
+        )
+        if self.cache is not None:
+            logger.info(
+                "embedding cache: %d/%d hits (%.0f%%), %d tokens and $%.6f avoided",
+                self.cache_hits, len(texts), 100 * self.cache_hits / len(texts), self.avoided_tokens, self.avoided_cost
+            )
+        return result
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = openai.Embedding.create(
+                    input=batch,
+                    model=self.model,
+                    api_base=self.api_base,
+                    api_key=self.api_key,
+                    request_timeout=self.request_timeout,
+                )
+                with self._metrics_lock:
+                    self.requests += 1
+                #A API não garante a ordem dos itens, que deve ser restaurada pelo index
+                data = sorted(response["data"], key=lambda item: item["index"])
+                return [item["embedding"] for item in data]
+
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                with self._metrics_lock:
+                    self.retries += 1
+                backoff = min(self.max_backoff, self.initial_backoff * 2 ** attempt)
+                #Jitter, para que as threads não tentem de novo todas ao mesmo tempo
+                sleep_time = backoff * random.uniform(0.5, 1.0)
+                logger.warning("Embedding request failed (%s), retrying in %.1fs", e, sleep_time)
+                time.sleep(sleep_time)
+
+
+def main(total_texts: int = 2000, latency: float = 0.05):
+    """Throughput benchmark against the local stub server: one request per text (as DataFrame.apply did) vs batched."""
+    import sys, os
+    sys.path.append(os.getcwd())
+    from embeddings.embedding_stub_server import EmbeddingStubServer
+
+    texts = [f"Cláusula {i} - O consorciado obriga-se a pagar as contribuições mensais. " * 10 for i in range(total_texts)]
+
+    with EmbeddingStubServer(latency=latency) as server:
+        sequential_texts = texts[:200]
+        start = time.perf_counter()
+        for text in sequential_texts:
+            openai.Embedding.create(input=text, model=EMBEDDING_MODEL, api_base=server.api_base, api_key="stub")
+        sequential_rate = len(sequential_texts) / (time.perf_counter() - start)
+        print(f"one request per text: {sequential_rate:.1f} texts/s")
+
+        for max_tokens, concurrency in [(8191, 1), (8191, 4), (100_000, 4)]:
+            embedder = BatchEmbedder(api_base=server.api_base, api_key="stub", max_tokens_per_request=max_tokens, max_concurrency=concurrency)
+            start = time.perf_counter()
+            embedder.embed(texts)
+            rate = total_texts / (time.perf_counter() - start)
+            print(f"batched, max {max_tokens} tokens/request, concurrency {concurrency}: "
+                  f"{rate:.1f} texts/s in {embedder.requests} requests ({rate / sequential_rate:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
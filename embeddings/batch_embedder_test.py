@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+from embeddings.batch_embedder import MAX_TOKENS_PER_TEXT, BatchEmbedder
+from embeddings.embedding_cache import EmbeddingCache
+from embeddings.embedding_stub_server import EmbeddingStubServer, stub_embedding
+from util import EMBEDDING_COST_PER_1000_TOKENS
+
+
+def word_counts(texts):
+    #Contagem de tokens aproximada, sem o tiktoken (que baixa o encoding na primeira vez)
+    return [len(text.split()) for text in texts]
+
+
+class TestBatchEmbedder(unittest.TestCase):
+
+    def test_preserva_ordem(self):
+        texts = [f"texto número {i}" for i in range(50)]
+
+        with EmbeddingStubServer() as server:
+            embedder = BatchEmbedder(api_base=server.api_base, api_key="stub", max_tokens_per_request=40, max_concurrency=4, token_counter=word_counts)
+            vectors = embedder.embed(texts)
+
+        self.assertEqual(len(vectors), len(texts))
+        for text, vector in zip(texts, vectors):
+            self.assertEqual(vector, stub_embedding(text))
+        self.assertGreater(len(server.request_sizes), 1)
+
+    def test_respeita_limite_de_tokens(self):
+        texts = [f"cláusula {i} do contrato de consórcio" for i in range(30)]
+        embedder = BatchEmbedder(max_tokens_per_request=20, token_counter=word_counts)
+
+        batches = embedder.pack(texts)
+
+        self.assertEqual(batches[0][0], 0)
+        self.assertEqual(batches[-1][1], len(texts))
+        for (start, end), (next_start, _) in zip(batches, batches[1:]):
+            self.assertEqual(end, next_start)
+        for start, end in batches:
+            self.assertLessEqual(sum(word_counts(texts[start:end])), 20)
+        self.assertGreater(len(batches), 1)
+
+    def test_rejeita_texto_acima_do_limite(self):
+        texts = ["curto", "longo " * (MAX_TOKENS_PER_TEXT + 1)]
+
+        with EmbeddingStubServer() as server:
+            embedder = BatchEmbedder(api_base=server.api_base, api_key="stub", token_counter=word_counts)
+            with self.assertRaisesRegex(ValueError, str(MAX_TOKENS_PER_TEXT)):
+                embedder.embed(texts)
+
+        #Nada é enviado, nem os textos dentro do limite
+        self.assertEqual(server.request_sizes, [])
+
+    def test_retry_em_rate_limit(self):
+        texts = [f"texto {i}" for i in range(20)]
+
+        with EmbeddingStubServer(fail_every=3) as server:
+            embedder = BatchEmbedder(api_base=server.api_base, api_key="stub", max_tokens_per_request=10,
+                                     max_concurrency=2, initial_backoff=0.01, token_counter=word_counts)
+            vectors = embedder.embed(texts)
+
+        self.assertEqual(vectors, [stub_embedding(text) for text in texts])
+        self.assertGreater(server.failed_requests, 0)
+        self.assertEqual(embedder.retries, server.failed_requests)
+
+    def test_cache_evita_reenvio(self):
+        texts = [f"texto {i}" for i in range(10)]
+
+        with tempfile.TemporaryDirectory() as directory, EmbeddingStubServer() as server:
+            cache = EmbeddingCache(os.path.join(directory, "cache.sqlite3"))
+            embedder = BatchEmbedder(api_base=server.api_base, api_key="stub", cache=cache, token_counter=word_counts)
+
+            primeira = embedder.embed(texts)
+            self.assertEqual(embedder.cache_hits, 0)
+
+            #Espaços diferentes não mudam a chave do cache
+            segunda = embedder.embed([f"  texto   {i}" for i in range(10)] + ["texto novo"])
+            self.assertEqual(embedder.cache_hits, 10)
+            self.assertGreater(embedder.avoided_tokens, 0)
+            self.assertAlmostEqual(embedder.avoided_cost, embedder.avoided_tokens * EMBEDDING_COST_PER_1000_TOKENS / 1000)
+            self.assertEqual(sum(server.request_sizes[1:]), 1)
+            cache.close()
+
+        #Vetores novos e vindos do cache com a mesma precisão (float32)
+        self.assertEqual(segunda[:10], primeira)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+
+DEFAULT_CACHE_PATH = os.path.join('data', 'embedding_cache.sqlite3')
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """Normalization applied before hashing, so changes in whitespace or unicode composition do not force re-embedding."""
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFC', text)).strip()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f'{model}\0{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+
+def to_stored_precision(vectors: Sequence[Sequence[float]]) -> List[List[float]]:
+    """Vectors rounded to float32, as they come back from the cache.
+
+    Fresh vectors go through it too, so the same text gives the same vector whether it was a hit or a miss.
+    """
+    return np.asarray(vectors, dtype=np.float32).tolist()
+
+
+class EmbeddingCache:
+    """Persistent content-addressed cache of embeddings, in a local SQLite file.
+
+    Keyed by hash(model, normalized text), so an unchanged chunk is never embedded twice,
+    regardless of the document or run it comes from. Vectors are stored as float32 bytes.
+
+    Examples:
+        cache = EmbeddingCache()
+        embedder = BatchEmbedder(cache=cache)
+        embedder.embed(texts)
+        print(cache.stats())
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)')
+        self._connection.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Cached embeddings for the texts, None for each miss."""
+        keys = [cache_key(model, text) for text in texts]
+        found: Dict[str, bytes] = {}
+
+        with self._lock:
+            #Consulta em lotes, abaixo do limite de parâmetros do SQLite
+            unique_keys = list(set(keys))
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._connection.execute(f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', batch)
+                found.update(rows)
+
+        result = [np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None for key in keys]
+
+        hits = sum(1 for vector in result if vector is not None)
+        self.hits += hits
+        self.misses += len(result) - hits
+        return result
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        rows = [
+            (cache_key(model, text), np.asarray(vector, dtype=np.float32).tobytes())
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._connection.executemany('INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)', rows)
+            self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain Embeddings wrapper that consults an EmbeddingCache before the underlying model.
+
+    Lets the vector store loads (e.g. OpenAIEmbeddings used by the Redis vector store) skip unchanged chunks.
+    Queries are not cached, as they rarely repeat.
+    """
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model: str):
+        self.underlying = underlying
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(self.model, texts)
+        missing = [index for index, vector in enumerate(vectors) if vector is None]
+
+        if missing:
+            new_vectors = to_stored_precision(self.underlying.embed_documents([texts[index] for index in missing]))
+            self.cache.put_many(self.model, [texts[index] for index in missing], new_vectors)
+            for index, vector in zip(missing, new_vectors):
+                vectors[index] = vector
+
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
@@ -0,0 +1,32 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from langchain.embeddings.fake import DeterministicFakeEmbedding
+
+from embeddings.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class TestCachedEmbeddings(unittest.TestCase):
+
+    def test_mesmo_vetor_com_e_sem_cache(self):
+        texts = ["CLÁUSULA 1ª - Objeto", "CLÁUSULA 2ª - Prazo"]
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = EmbeddingCache(os.path.join(directory, "cache.sqlite3"))
+            embeddings = CachedEmbeddings(DeterministicFakeEmbedding(size=32), cache, "fake")
+
+            fresh = embeddings.embed_documents(texts)
+            cached = embeddings.embed_documents(texts + ["CLÁUSULA 3ª - Foro"])
+            self.assertEqual(cache.stats()["hits"], 2)
+            cache.close()
+
+        self.assertEqual(cached[:2], fresh)
+        for vector in fresh + cached:
+            self.assertIsInstance(vector[0], float)
+            self.assertEqual(vector, np.asarray(vector, dtype=np.float32).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+Local storage of embeddings in binary format: a float32 .npy matrix, loaded memory-mapped,
+plus a metadata table (.meta.csv) with one row per embedding, in the same order.
+
+Replaces the CSV with stringified python lists, which had to be parsed back with eval.
+"""
+import os
+import sys
+import time
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config.config import EMBEDDING_DIMENSION
+
+MATRIX_SUFFIX = '.npy'
+METADATA_SUFFIX = '.meta.csv'
+#Linhas do CSV legado convertidas por vez
+PARSE_BLOCK_ROWS = 1000
+
+
+def embeddings_paths(base_path: str) -> Tuple[str, str]:
+    return base_path + MATRIX_SUFFIX, base_path + METADATA_SUFFIX
+
+
+def to_float32_matrix(embeddings: Sequence[Sequence[float]], dimension: int = None) -> np.ndarray:
+    """Contiguous (n, dimension) float32 matrix from a sequence of vectors (lists or np arrays)."""
+    if len(embeddings) == 0:
+        return np.empty((0, dimension or EMBEDDING_DIMENSION), dtype=np.float32)
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2 or (dimension is not None and matrix.shape[1] != dimension):
+        raise ValueError(f'Expected a (n, {dimension or "d"}) matrix of embeddings, got shape {matrix.shape}')
+    return np.ascontiguousarray(matrix)
+
+
+def save_embeddings(base_path: str, metadata: pd.DataFrame, embeddings: Sequence[Sequence[float]]):
+    """Save the embeddings to base_path.npy and the metadata to base_path.meta.csv.
+
+    Files are written to temporary names and then renamed, so a reader never sees a half-written pair.
+    """
+    matrix = to_float32_matrix(embeddings)
+    if len(metadata) != matrix.shape[0]:
+        raise ValueError(f'metadata has {len(metadata)} rows, but there are {matrix.shape[0]} embeddings')
+
+    matrix_path, metadata_path = embeddings_paths(base_path)
+    directory = os.path.dirname(matrix_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(matrix_path + '.tmp', 'wb') as f:
+        np.save(f, matrix)
+    metadata.to_csv(metadata_path + '.tmp', index=False)
+
+    os.replace(matrix_path + '.tmp', matrix_path)
+    os.replace(metadata_path + '.tmp', metadata_path)
+
+
+def load_embeddings(base_path: str, mmap: bool = True) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Load the metadata table and the (n, d) float32 embedding matrix.
+
+    With mmap=True (default) the matrix is memory-mapped read-only: loading is immediate and
+    pages are read from disk on demand. Use mmap=False to get an in-memory, writable copy.
+    """
+    matrix_path, metadata_path = embeddings_paths(base_path)
+    matrix = np.load(matrix_path, mmap_mode='r' if mmap else None)
+    metadata = pd.read_csv(metadata_path)
+
+    if len(metadata) != matrix.shape[0]:
+        raise ValueError(f'{metadata_path} has {len(metadata)} rows, but {matrix_path} has {matrix.shape[0]} embeddings')
+
+    return metadata, matrix
+
+
+def parse_embedding_strings(values: Sequence[str], dimension: Optional[int] = EMBEDDING_DIMENSION, block_rows: int = PARSE_BLOCK_ROWS) -> np.ndarray:
+    """Parse the legacy CSV column of stringified lists ("[0.1, 0.2, ...]") into a (n, d) float32 matrix.
+
+    Rows are parsed without eval, block_rows at a time, straight into the preallocated matrix, so the temporary
+    strings never grow with the number of rows. Every row must have dimension values (with dimension=None,
+    the number of values of the first row).
+    """
+    if len(values) == 0:
+        return np.empty((0, dimension or EMBEDDING_DIMENSION), dtype=np.float32)
+
+    if dimension is None:
+        dimension = values[0].count(',') + 1
+    matrix = np.empty((len(values), dimension), dtype=np.float32)
+
+    for start in range(0, len(values), block_rows):
+        rows = [value.strip().strip('[]') for value in values[start:start + block_rows]]
+        for offset, row in enumerate(rows):
+            row_dimension = row.count(',') + 1 if row.strip() else 0
+            if row_dimension != dimension:
+                raise ValueError(f'Embedding in row {start + offset} has {row_dimension} values, expected {dimension}')
+        matrix[start:start + len(rows)] = np.array(','.join(rows).split(','), dtype=np.float32).reshape(len(rows), dimension)
+
+    return matrix
+
+
+def convert_csv_embeddings(csv_path: str, base_path: str, embedding_column: str = 'embedding', dimension: Optional[int] = EMBEDDING_DIMENSION) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Migrate a legacy CSV (other columns + stringified embedding column) to the binary format."""
+    df = pd.read_csv(csv_path)
+    matrix = parse_embedding_strings(df[embedding_column].tolist(), dimension)
+    metadata = df.drop(columns=[embedding_column])
+    save_embeddings(base_path, metadata, matrix)
+    return metadata, matrix
+
+
+def main(total: int = 20000):
+    """Compare loading the legacy CSV (eval per row) with the binary format."""
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((total, EMBEDDING_DIMENSION), dtype=np.float32)
+    metadata = pd.DataFrame({'page_content': [f'chunk {i}' for i in range(total)]})
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'legacy.csv')
+        legacy = metadata.copy()
+        legacy['embedding'] = [str(row.tolist()) for row in matrix]
+        legacy.to_csv(csv_path, index=False)
+
+        start = time.perf_counter()
+        df = pd.read_csv(csv_path)
+        df['embedding'] = df['embedding'].apply(eval).apply(np.array)
+        print(f'legacy csv + eval: {time.perf_counter() - start:.2f}s')
+
+        base_path = os.path.join(directory, 'binary')
+        start = time.perf_counter()
+        convert_csv_embeddings(csv_path, base_path)
+        print(f'one-time migration csv -> npy: {time.perf_counter() - start:.2f}s')
+
+        start = time.perf_counter()
+        _, loaded = load_embeddings(base_path)
+        print(f'npy (mmap): {time.perf_counter() - start:.3f}s, shape {loaded.shape}')
+
+        start = time.perf_counter()
+        _, loaded = load_embeddings(base_path, mmap=False)
+        print(f'npy (in memory): {time.perf_counter() - start:.3f}s')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
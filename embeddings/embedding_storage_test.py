@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from embeddings.embedding_storage import convert_csv_embeddings, load_embeddings, parse_embedding_strings, save_embeddings
+
+
+class TestEmbeddingStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.matrix = rng.standard_normal((25, 8)).astype(np.float32)
+        self.metadata = pd.DataFrame({'page_content': [f'chunk {i}' for i in range(25)]})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_save_load(self):
+        base_path = os.path.join(self.directory.name, 'embeddings')
+        save_embeddings(base_path, self.metadata, self.matrix)
+
+        for mmap in [True, False]:
+            metadata, matrix = load_embeddings(base_path, mmap=mmap)
+            self.assertEqual(matrix.dtype, np.float32)
+            np.testing.assert_array_equal(matrix, self.matrix)
+            self.assertEqual(metadata['page_content'].tolist(), self.metadata['page_content'].tolist())
+
+    def test_convert_csv(self):
+        csv_path = os.path.join(self.directory.name, 'legacy.csv')
+        legacy = self.metadata.copy()
+        legacy['embedding'] = [str(row.tolist()) for row in self.matrix]
+        legacy.to_csv(csv_path, index=False)
+
+        base_path = os.path.join(self.directory.name, 'converted')
+        convert_csv_embeddings(csv_path, base_path, dimension=8)
+
+        metadata, matrix = load_embeddings(base_path)
+        np.testing.assert_array_equal(matrix, self.matrix)
+        self.assertEqual(list(metadata.columns), ['page_content'])
+
+    def test_parse_em_blocos(self):
+        values = [str(row.tolist()) for row in self.matrix]
+        np.testing.assert_array_equal(parse_embedding_strings(values, dimension=None, block_rows=4), self.matrix)
+
+    def test_dimensoes_invalidas(self):
+        #Mesmo total de valores (divisível pelo número de linhas), mas linhas de tamanhos diferentes
+        with self.assertRaises(ValueError):
+            parse_embedding_strings(['[1, 2, 3]', '[4]', '[5, 6]'], dimension=None)
+        #Dimensão diferente da esperada
+        with self.assertRaises(ValueError):
+            parse_embedding_strings(['[1, 2]', '[3, 4]'], dimension=3)
+
+
+if __name__ == '__main__':
+    unittest.main()
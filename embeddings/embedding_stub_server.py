@@ -0,0 +1,111 @@
+"""
+Servidor HTTP local que imita o endpoint de embeddings da OpenAI, para testes e benchmarks sem custo nem rede.
+
+Os vetores são determinísticos (derivados do hash do texto), então o mesmo texto sempre gera o mesmo embedding.
+Permite simular latência por requisição e respostas 429 (rate limit), e registra o tamanho de cada requisição recebida.
+
+Uso:
+    with EmbeddingStubServer(latency=0.05) as server:
+        embedder = BatchEmbedder(api_base=server.api_base, api_key="stub")
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+from config.config import EMBEDDING_DIMENSION
+
+
+def stub_embedding(text: str, dimension: int = EMBEDDING_DIMENSION) -> List[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.uniform(-1, 1) for _ in range(dimension)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+
+class EmbeddingStubServer:
+    def __init__(self, latency: float = 0.0, fail_every: int = 0, dimension: int = EMBEDDING_DIMENSION, port: int = 0):
+        """
+        latency - segundos de espera em cada requisição, simulando a rede e o processamento da API
+        fail_every - se > 0, a cada fail_every requisições uma responde 429
+        port - 0 escolhe uma porta livre
+        """
+        self.latency = latency
+        self.fail_every = fail_every
+        self.dimension = dimension
+        #Quantidade de textos de cada requisição atendida com sucesso
+        self.request_sizes: List[int] = []
+        self.failed_requests = 0
+
+        self._lock = threading.Lock()
+        self._request_count = 0
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self.__handler_class())
+        self._thread = None
+
+    @property
+    def api_base(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "EmbeddingStubServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "EmbeddingStubServer":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def __handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+
+                if server.latency > 0:
+                    time.sleep(server.latency)
+
+                with server._lock:
+                    server._request_count += 1
+                    should_fail = server.fail_every > 0 and server._request_count % server.fail_every == 0
+                    if should_fail:
+                        server.failed_requests += 1
+                    else:
+                        server.request_sizes.append(len(texts))
+
+                if should_fail:
+                    self.__reply(429, {"error": {"message": "Rate limit reached (stub)", "type": "requests"}})
+                    return
+
+                data = [
+                    {"object": "embedding", "index": index, "embedding": stub_embedding(text, server.dimension)}
+                    for index, text in enumerate(texts)
+                ]
+                #Devolve fora de ordem, como a API pode fazer, para exercitar a ordenação por index do cliente
+                data.reverse()
+                self.__reply(200, {"object": "list", "data": data, "model": body.get("model"), "usage": {}})
+
+            def __reply(self, status, payload):
+                content = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -6,8 +6,11 @@ import openai
 import pandas as pd
 import numpy as np
 from openai.embeddings_utils import cosine_similarity, get_embedding
-import tiktoken
+import util
 import locale
+from embeddings.batch_embedder import BatchEmbedder
+from embeddings.embedding_storage import parse_embedding_strings
+from embeddings.vector_search import EmbeddingSearch
 
 
 def generate_embedding_for_text_type01(text:str) -> list[float]:
@@ -29,28 +32,29 @@ def generate_embedding_for_text_type02(text:str) -> list[float]:
 
 
 
-def generate_df_with_embeddings(df:pd.DataFrame, col_name_to_embed:str) -> pd.DataFrame:
+def generate_df_with_embeddings(df:pd.DataFrame, col_name_to_embed:str, embedder:BatchEmbedder = None) -> pd.DataFrame:
     result_df = df.copy()
 
-    result_df['embedding'] = result_df[col_name_to_embed].apply(lambda x: get_embedding(x, engine='text-embedding-ada-002'))
+    #Várias linhas por requisição, com requisições concorrentes, em vez de uma requisição por linha
+    embedder = embedder if embedder is not None else BatchEmbedder()
+    result_df['embedding'] = embedder.embed(result_df[col_name_to_embed].tolist())
    
     return result_df
 
 
 def convert_embeddings_to_nparray(df) -> pd.DataFrame:
     #the csv contains string representations of python lists
-    #eval takes a string and evaluates it as a python expression, so converts the column in python lists
-    #np.array gets a list and returns a numpy array, so the final result is a column of the dataframe containing
-    #numpy arrays
-    df['embedding'] = df['embedding'].apply(eval).apply(np.array)
+    #all rows are parsed at once into a contiguous float32 matrix (no eval), and each row of the
+    #column becomes a numpy view of that matrix
+    #prefer embeddings.embedding_storage (npy + metadata), which needs no parsing at all
+    matrix = parse_embedding_strings(df['embedding'].tolist())
+    df['embedding'] = list(matrix)
     
     return df
 
 
 def estimate_price_for_embedding_generation(words:list[str], current_cost_by_1000tokens_for_model=0.0001) -> float:
-    enc = tiktoken.encoding_for_model('text-embedding-ada-002')
-
-    total_tokens = sum([len(enc.encode(word)) for word in words])
+    total_tokens = sum(util.token_lengths(words))
     estimated_cost = total_tokens * (current_cost_by_1000tokens_for_model / 1000)
  
     locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
@@ -59,28 +63,18 @@ def estimate_price_for_embedding_generation(words:list[str], current_cost_by_100
     return estimated_cost
 
 
-def similarity_search_combining_words_in_df(df, *words) -> pd.DataFrame:
+def similarity_search_combining_words_in_df(df, *words, k:int = 10, engine:EmbeddingSearch = None) -> pd.DataFrame:
     print(f'words_to_be_combined_as_search_criteria: {words}')
-    #gets two vectors
+    #gets the vectors of the given words and adds them up
     filtered_df = df.loc[df['text'].isin(words)]['embedding']
     print('filtered df')
     print(filtered_df)
 
-    result_vector = None
-    for vector in filtered_df:
-        print(f'adding vector with first element {vector[0]}')
-        if result_vector is None:
-            result_vector = vector
-        else:
-            result_vector += vector
-        print(f'result vector is {result_vector}')
+    result_vector = np.sum(np.vstack(filtered_df), axis=0)
+    print(f'result vector is {result_vector}')
 
     #Find the words that are similar to milk + capuccino
-    df['similarities'] = df['embedding'].apply(lambda x: cosine_similarity(x, result_vector))
-    sorted_df = df.sort_values('similarities', ascending=False)
-
-    #returns the first 10 lines
-    result = sorted_df.iloc[:10].copy()
+    result = top_k_similar(df, result_vector, k, engine)
 
     print('similarities found')
     print(result)
@@ -88,17 +82,27 @@ def similarity_search_combining_words_in_df(df, *words) -> pd.DataFrame:
     return result
 
 
-def similarity_search(df, word):
+def similarity_search(df, word, k:int = 10, engine:EmbeddingSearch = None):
     embedding = generate_embedding_for_text_type02(word)
-    df['similarities'] = df['embedding'].apply(lambda x: cosine_similarity(x, embedding))
-    sorted_df = df.sort_values('similarities', ascending=False)
-    result = sorted_df.iloc[:10].copy()
+    result = top_k_similar(df, embedding, k, engine)
 
     print('similarities found')
     print(result)
     
     return result
 
+
+def top_k_similar(df, query_embedding, k:int = 10, engine:EmbeddingSearch = None) -> pd.DataFrame:
+    #engine can be built once with EmbeddingSearch(np.vstack(df['embedding'])) and reused across searches,
+    #so the embedding matrix is normalized only once
+    engine = engine if engine is not None else EmbeddingSearch(np.vstack(df['embedding']))
+    indices, scores = engine.search(query_embedding, k)
+
+    #returns the k most similar lines, from the most similar
+    result = df.iloc[indices[0]].copy()
+    result['similarities'] = scores[0]
+    return result
+
 def main():
     #text = 'red'
     # generate_embedding_for_test_type01(text)
@@ -20,11 +20,19 @@ import config.config as config
 from document_load.document_loaders import load_document
 from document_load.chunking import chunk_data
 from embeddings_helper import *
+from embeddings.batch_embedder import BatchEmbedder
+from embeddings.embedding_cache import EmbeddingCache
+from embeddings.embedding_storage import save_embeddings, load_embeddings, convert_csv_embeddings, embeddings_paths
 import pandas as pd
 
 os.environ['APP_ROOT_PATH'] = os.getcwd()
 logging.basicConfig(level=config.LOG_LEVEL)
 
+#Matriz float32 em CONTRATO_EMBEDDINGS.npy e textos em CONTRATO_EMBEDDINGS.meta.csv
+EMBEDDINGS_BASE_PATH = os.path.join('data', 'CONTRATO_EMBEDDINGS')
+#Formato antigo, com os embeddings como listas em texto
+LEGACY_EMBEDDINGS_CSV = os.path.join('data', 'CONTRATO_EMBEDDINGS.csv')
+
 def generate_local_embeddings():
 
     file_path = os.path.join('data', 'CONTRATO.pdf')
@@ -34,19 +42,21 @@ def generate_local_embeddings():
     text_chunks = [chunk.page_content.replace(os.linesep, ' ') for chunk in chunks]
     dataframe_from_chunks = pd.DataFrame(columns=['page_content'], data=text_chunks)
 
-    dataframe_from_chunks['embedding'] = dataframe_from_chunks['page_content'].apply(lambda x: get_embedding(x, engine='text-embedding-ada-002'))
+    #Chunks que não mudaram desde a última execução não são enviados para a API de novo
+    embedder = BatchEmbedder(cache=EmbeddingCache())
+    dataframe_from_chunks = generate_df_with_embeddings(dataframe_from_chunks, 'page_content', embedder)
     
-    dataframe_from_chunks.to_csv(os.path.join('data', 'CONTRATO_EMBEDDINGS.csv'), index=False)
+    save_embeddings(EMBEDDINGS_BASE_PATH, dataframe_from_chunks[['page_content']], dataframe_from_chunks['embedding'].tolist())
     print(dataframe_from_chunks)   
 
 def push_to_atlas():
-    dataframe_with_embeddings = pd.read_csv(os.path.join('data', 'CONTRATO_EMBEDDINGS.csv'))
-    dataframe_with_embeddings = convert_embeddings_to_nparray(dataframe_with_embeddings)
-
-    embeddings = list(dataframe_with_embeddings['embedding'])
-    data = dataframe_with_embeddings[['page_content']].to_dict('records') 
+    matrix_path, _ = embeddings_paths(EMBEDDINGS_BASE_PATH)
+    if not os.path.exists(matrix_path) and os.path.exists(LEGACY_EMBEDDINGS_CSV):
+        #Migra uma única vez do csv antigo
+        convert_csv_embeddings(LEGACY_EMBEDDINGS_CSV, EMBEDDINGS_BASE_PATH)
 
-    embeddings = np.array(embeddings)
+    metadata, embeddings = load_embeddings(EMBEDDINGS_BASE_PATH)
+    data = metadata[['page_content']].to_dict('records') 
 
     project = atlas.map_embeddings(
     embeddings=embeddings,
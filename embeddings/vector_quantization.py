@@ -0,0 +1,301 @@
+"""
+Compressed storage of embeddings: scalar quantization (float16 or int8) plus optional dimension reduction
+(PCA or truncation), with re-ranking of the candidates against the full-precision vectors.
+
+The compressed matrix is the one kept in memory and scanned in every query; the float32 matrix stays on disk,
+memory-mapped (see embedding_storage), and only the pages of the candidates are read for the re-ranking.
+
+Layout next to the binary embeddings (base_path.npy / base_path.meta.csv):
+    base_path.compressed.npz - codes and the parameters needed to compress the queries (scale, PCA basis)
+"""
+import os
+import sys
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from embeddings.vector_search import normalize_rows
+
+COMPRESSED_SUFFIX = '.compressed.npz'
+
+#Linhas convertidas para float32 por vez ao calcular os scores, para a memória não voltar ao tamanho original
+SCORE_BLOCK_ROWS = 65_536
+#Amostra usada para ajustar a escala do int8 e a PCA
+FIT_SAMPLE_SIZE = 50_000
+
+
+class VectorCodec:
+    """Scalar quantization of (already normalized) float32 vectors.
+
+    Codecs with parameters (e.g. int8 scale) must be fitted before encoding.
+    """
+
+    name: str = ""
+    dtype = np.float32
+
+    def fit(self, matrix: np.ndarray) -> "VectorCodec":
+        return self
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        return np.asarray(matrix, dtype=self.dtype)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.asarray(codes, dtype=np.float32)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        pass
+
+
+class Float32Codec(VectorCodec):
+    """No quantization. Baseline for the benchmarks, or to use only the dimension reduction."""
+
+    name = "float32"
+    dtype = np.float32
+
+
+class Float16Codec(VectorCodec):
+    """Half precision: 2 bytes per value. Normalized embeddings lose practically nothing."""
+
+    name = "float16"
+    dtype = np.float16
+
+
+class Int8Codec(VectorCodec):
+    """1 byte per value, with a symmetric scale per dimension (max absolute value of the dimension -> 127)."""
+
+    name = "int8"
+    dtype = np.int8
+
+    def __init__(self):
+        self.scale: Optional[np.ndarray] = None
+
+    def fit(self, matrix: np.ndarray) -> "Int8Codec":
+        max_abs = np.abs(np.asarray(matrix, dtype=np.float32)).max(axis=0)
+        max_abs[max_abs == 0] = 1
+        self.scale = (max_abs / 127).astype(np.float32)
+        return self
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        if self.scale is None:
+            raise ValueError("Int8Codec must be fitted before encoding")
+        return np.clip(np.rint(np.asarray(matrix, dtype=np.float32) / self.scale), -127, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"scale": self.scale}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.scale = state["scale"]
+
+
+CODECS = {
+    Float32Codec.name: Float32Codec,
+    Float16Codec.name: Float16Codec,
+    Int8Codec.name: Int8Codec,
+}
+
+
+def get_vector_codec(name: str) -> VectorCodec:
+    if name not in CODECS:
+        raise ValueError(f"Unknown vector codec: {name}. Use one of {list(CODECS)}")
+    return CODECS[name]()
+
+
+class VectorCompressor:
+    """Dimension reduction (optional) followed by scalar quantization.
+
+    reduction:
+        "pca" - projects on the first `dimensions` principal components, fitted on the data
+        "truncate" - keeps the first `dimensions` values. Only sensible for models trained for it
+                     (e.g. text-embedding-3); ada-002 embeddings lose much more than with PCA
+    Vectors are re-normalized after the reduction, so the compressed scores are still cosine similarities.
+
+    Examples:
+        compressor = VectorCompressor(codec="int8", dimensions=256).fit(matrix)
+        codes = compressor.compress(matrix)   # (n, 256) int8: 1536 * 4 / 256 = 24x smaller
+    """
+
+    def __init__(self, codec: str = "float16", dimensions: Optional[int] = None, reduction: str = "pca"):
+        if reduction not in ("pca", "truncate"):
+            raise ValueError(f"Unknown reduction: {reduction}. Use 'pca' or 'truncate'")
+        self.codec = get_vector_codec(codec)
+        self.dimensions = dimensions
+        self.reduction = reduction
+        self.mean: Optional[np.ndarray] = None
+        self.components: Optional[np.ndarray] = None
+
+    @property
+    def name(self) -> str:
+        if self.dimensions is None:
+            return self.codec.name
+        return f"{self.reduction}{self.dimensions}+{self.codec.name}"
+
+    def fit(self, matrix: np.ndarray, seed: int = 0) -> "VectorCompressor":
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if matrix.shape[0] > FIT_SAMPLE_SIZE:
+            rows = np.sort(np.random.default_rng(seed).choice(matrix.shape[0], FIT_SAMPLE_SIZE, replace=False))
+            matrix = matrix[rows]
+        matrix = normalize_rows(matrix)
+
+        if self.dimensions is not None and self.reduction == "pca":
+            self.mean = matrix.mean(axis=0)
+            centered = (matrix - self.mean).astype(np.float64)
+            #Autovetores da covariância (d x d), mais barato que o SVD da amostra inteira
+            eigenvalues, eigenvectors = np.linalg.eigh(centered.T @ centered)
+            self.components = eigenvectors[:, np.argsort(eigenvalues)[::-1][:self.dimensions]].T.astype(np.float32)
+
+        self.codec.fit(self.reduce(matrix))
+        return self
+
+    def reduce(self, matrix: np.ndarray) -> np.ndarray:
+        """Normalized float32 vectors in the reduced space (the input itself, normalized, without reduction)."""
+        matrix = normalize_rows(np.atleast_2d(np.asarray(matrix, dtype=np.float32)))
+        if self.dimensions is None:
+            return matrix
+        if self.reduction == "truncate":
+            return normalize_rows(matrix[:, :self.dimensions])
+        if self.components is None:
+            raise ValueError("VectorCompressor with PCA must be fitted before use")
+        return normalize_rows((matrix - self.mean) @ self.components.T)
+
+    def compress(self, matrix: np.ndarray) -> np.ndarray:
+        codes = [
+            self.codec.encode(self.reduce(matrix[start:start + SCORE_BLOCK_ROWS]))
+            for start in range(0, matrix.shape[0], SCORE_BLOCK_ROWS)
+        ]
+        return np.concatenate(codes) if codes else np.empty((0, self.dimensions or 0), dtype=self.codec.dtype)
+
+    def scores(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """(q, n) approximate cosine similarities between the queries (float32, original space) and the codes."""
+        reduced = self.reduce(queries)
+        scores = np.empty((reduced.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], SCORE_BLOCK_ROWS):
+            scores[:, start:start + SCORE_BLOCK_ROWS] = reduced @ self.codec.decode(codes[start:start + SCORE_BLOCK_ROWS]).T
+        return scores
+
+    def bytes_per_vector(self, original_dimension: int) -> int:
+        return (self.dimensions or original_dimension) * np.dtype(self.codec.dtype).itemsize
+
+    def save(self, path: str, codes: np.ndarray):
+        """Save the codes and the compressor parameters in a single .npz file."""
+        state = {f"codec_{key}": value for key, value in self.codec.state().items()}
+        if self.mean is not None:
+            state.update(mean=self.mean, components=self.components)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(
+                f, codes=codes, codec=np.array(self.codec.name), reduction=np.array(self.reduction),
+                dimensions=np.array(self.dimensions if self.dimensions is not None else -1), **state
+            )
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["VectorCompressor", np.ndarray]:
+        with np.load(path) as data:
+            dimensions = int(data["dimensions"])
+            compressor = cls(codec=str(data["codec"]), dimensions=dimensions if dimensions >= 0 else None, reduction=str(data["reduction"]))
+            compressor.codec.load_state({key[len("codec_"):]: data[key] for key in data.files if key.startswith("codec_")})
+            if "mean" in data.files:
+                compressor.mean = data["mean"]
+                compressor.components = data["components"]
+            return compressor, data["codes"]
+
+
+class CompressedSearch:
+    """Top-k search over compressed vectors, re-ranked with the full-precision ones.
+
+    The compressed scores select k * rerank_factor candidates; their exact cosine similarity,
+    computed from the (memory-mapped) float32 matrix, gives the final order and scores.
+
+    Examples:
+        metadata, matrix = load_embeddings(base_path)
+        compressor, codes = VectorCompressor.load(base_path + COMPRESSED_SUFFIX)
+        engine = CompressedSearch(codes, compressor, full_matrix=matrix)
+        indices, scores = engine.search(query_vector, k=10)
+    """
+
+    def __init__(self, codes: np.ndarray, compressor: VectorCompressor, full_matrix: Optional[np.ndarray] = None, rerank_factor: int = 4):
+        self.codes = codes
+        self.compressor = compressor
+        self.full_matrix = full_matrix
+        self.rerank_factor = rerank_factor
+
+    def search(self, queries: Sequence[Sequence[float]], k: int = 10, rerank: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """(indices, scores), both (q, k), from the most similar. Without full_matrix (or rerank=False)
+        the scores are the approximate ones."""
+        queries = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        rerank = rerank and self.full_matrix is not None
+        k = min(k, self.codes.shape[0])
+        candidates_per_query = min(self.codes.shape[0], k * self.rerank_factor if rerank else k)
+
+        approximate = self.compressor.scores(self.codes, queries)
+        if candidates_per_query < approximate.shape[1]:
+            candidates = np.argpartition(-approximate, candidates_per_query - 1, axis=1)[:, :candidates_per_query]
+        else:
+            candidates = np.broadcast_to(np.arange(approximate.shape[1]), approximate.shape)
+
+        if rerank:
+            candidate_scores = np.stack([
+                normalize_rows(self.full_matrix[np.sort(row_candidates)]) @ query
+                for row_candidates, query in zip(candidates, queries)
+            ])
+            candidates = np.sort(candidates, axis=1)
+        else:
+            candidate_scores = np.take_along_axis(approximate, candidates, axis=1)
+
+        order = np.argsort(-candidate_scores, axis=1)[:, :k]
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def compress_embeddings(base_path: str, codec: str = "float16", dimensions: Optional[int] = None, reduction: str = "pca") -> VectorCompressor:
+    """Write base_path.compressed.npz from the binary embeddings in base_path.npy (see embedding_storage)."""
+    from embeddings.embedding_storage import load_embeddings
+
+    _, matrix = load_embeddings(base_path)
+    compressor = VectorCompressor(codec, dimensions, reduction).fit(matrix)
+    compressor.save(base_path + COMPRESSED_SUFFIX, compressor.compress(matrix))
+    return compressor
+
+
+def main(total: int = 50_000, dimension: int = 1536, queries: int = 200, k: int = 10):
+    """Memory saved vs recall lost for each storage mode, with and without re-ranking.
+
+    The synthetic vectors have low intrinsic dimension (a 128-d latent space projected to 1536-d plus noise),
+    like real text embeddings, so the PCA results are representative.
+    """
+    rng = np.random.default_rng(0)
+    projection = rng.standard_normal((128, dimension), dtype=np.float32)
+    latent = rng.standard_normal((total + queries, 128), dtype=np.float32) * np.linspace(3, 0.2, 128, dtype=np.float32)
+    vectors = latent @ projection + 0.5 * rng.standard_normal((total + queries, dimension), dtype=np.float32)
+    matrix, query_vectors = normalize_rows(vectors[:total]), vectors[total:]
+
+    exact = normalize_rows(query_vectors) @ matrix.T
+    expected = np.argpartition(-exact, k - 1, axis=1)[:, :k]
+    full_bytes = dimension * 4
+
+    print(f"{total} vectors of dimension {dimension}, recall@{k} against exact float32 search")
+    for codec, dimensions, reduction in [
+        ("float32", None, "pca"), ("float16", None, "pca"), ("int8", None, "pca"),
+        ("float16", 512, "truncate"), ("float16", 256, "pca"), ("int8", 256, "pca"), ("int8", 128, "pca"),
+    ]:
+        compressor = VectorCompressor(codec, dimensions, reduction).fit(matrix)
+        codes = compressor.compress(matrix)
+        engine = CompressedSearch(codes, compressor, full_matrix=matrix)
+
+        result = [f"{compressor.name:>18}: {compressor.bytes_per_vector(dimension):5d} bytes/vector ({full_bytes / compressor.bytes_per_vector(dimension):4.1f}x smaller)"]
+        for rerank in (False, True):
+            start = time.perf_counter()
+            indices, _ = engine.search(query_vectors, k, rerank=rerank)
+            elapsed = (time.perf_counter() - start) / queries
+            recall = np.mean([len(set(found) & set(wanted)) / k for found, wanted in zip(indices, expected)])
+            result.append(f"recall {'reranked' if rerank else 'compressed'} {recall:.3f} ({1000 * elapsed:.2f}ms/query)")
+        print(", ".join(result))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from embeddings.vector_quantization import CompressedSearch, VectorCompressor
+from embeddings.vector_search import EmbeddingSearch
+
+
+class TestVectorQuantization(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        latent = rng.standard_normal((3000, 16)) * np.linspace(3, 0.5, 16)
+        self.matrix = (latent @ rng.standard_normal((16, 128)) + 0.1 * rng.standard_normal((3000, 128))).astype(np.float32)
+        self.queries = self.matrix[:20] + 0.05 * rng.standard_normal((20, 128)).astype(np.float32)
+        self.expected, self.expected_scores = EmbeddingSearch(self.matrix).search(self.queries, k=5)
+
+    def test_rerank_recupera_busca_exata(self):
+        for codec, dimensions in [("float16", None), ("int8", None), ("int8", 16)]:
+            compressor = VectorCompressor(codec, dimensions).fit(self.matrix)
+            codes = compressor.compress(self.matrix)
+            self.assertEqual(codes.dtype, compressor.codec.dtype)
+            self.assertEqual(codes.shape, (3000, dimensions or 128))
+
+            indices, scores = CompressedSearch(codes, compressor, full_matrix=self.matrix).search(self.queries, k=5)
+            self.assertEqual(indices.tolist(), self.expected.tolist(), compressor.name)
+            np.testing.assert_allclose(scores, self.expected_scores, rtol=1e-5)
+
+    def test_save_load(self):
+        compressor = VectorCompressor("int8", 16).fit(self.matrix)
+        codes = compressor.compress(self.matrix)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "embeddings.compressed.npz")
+            compressor.save(path, codes)
+            loaded, loaded_codes = VectorCompressor.load(path)
+
+        self.assertEqual(loaded.name, "pca16+int8")
+        np.testing.assert_array_equal(loaded_codes, codes)
+        np.testing.assert_allclose(loaded.scores(codes, self.queries), compressor.scores(codes, self.queries))
+
+
+if __name__ == '__main__':
+    unittest.main()
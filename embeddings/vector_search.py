@@ -0,0 +1,103 @@
+import sys
+import time
+from typing import Sequence, Tuple
+
+import numpy as np
+
+#Limite de elementos da matriz de scores (consultas x vetores) calculada de uma vez, para limitar o uso de memória
+MAX_SCORE_BLOCK_ELEMENTS = 50_000_000
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length, as float32. Zero rows are kept as zeros (they score 0 against everything)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+class EmbeddingSearch:
+    """Exact cosine similarity top-k search over an embedding matrix.
+
+    The matrix is normalized once, at construction, so each batch of queries costs a single
+    matrix product, followed by argpartition to select the top-k without sorting all the scores.
+
+    Examples:
+        metadata, matrix = load_embeddings(base_path)
+        engine = EmbeddingSearch(matrix)
+        indices, scores = engine.search([query_vector_1, query_vector_2], k=10)
+        top_rows = metadata.iloc[indices[0]]
+    """
+
+    def __init__(self, embeddings: Sequence[Sequence[float]]):
+        self.matrix = normalize_rows(np.vstack(embeddings) if not isinstance(embeddings, np.ndarray) else embeddings)
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def search(self, queries: Sequence[Sequence[float]], k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k most similar rows for each query.
+
+        Args:
+            queries: one query vector, or a (q, d) batch of query vectors
+            k: number of results per query
+
+        Returns:
+            (indices, scores), both (q, k), ordered from most to least similar.
+            For a single query vector, q is 1.
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        total = len(self)
+        k = min(k, total)
+
+        indices = np.empty((queries.shape[0], k), dtype=np.int64)
+        scores = np.empty((queries.shape[0], k), dtype=np.float32)
+        if k == 0:
+            return indices, scores
+
+        block_size = max(1, MAX_SCORE_BLOCK_ELEMENTS // max(total, 1))
+        for start in range(0, queries.shape[0], block_size):
+            block_scores = queries[start:start + block_size] @ self.matrix.T
+
+            if k < total:
+                #Seleciona os k maiores em O(n), e só eles são ordenados
+                top = np.argpartition(-block_scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(total), block_scores.shape)
+            top_scores = np.take_along_axis(block_scores, top, axis=1)
+
+            order = np.argsort(-top_scores, axis=1)
+            indices[start:start + block_size] = np.take_along_axis(top, order, axis=1)
+            scores[start:start + block_size] = np.take_along_axis(top_scores, order, axis=1)
+
+        return indices, scores
+
+
+def main(total: int = 200_000, dimension: int = 1536, queries: int = 100):
+    """Latency of the vectorized search vs the per-row cosine_similarity that DataFrame.apply used."""
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((total, dimension), dtype=np.float32)
+    query_vectors = rng.standard_normal((queries, dimension), dtype=np.float32)
+
+    start = time.perf_counter()
+    engine = EmbeddingSearch(matrix)
+    print(f'normalization of {total} vectors (once): {time.perf_counter() - start:.2f}s')
+
+    start = time.perf_counter()
+    engine.search(query_vectors[0], k=10)
+    print(f'1 query: {1000 * (time.perf_counter() - start):.1f}ms')
+
+    start = time.perf_counter()
+    engine.search(query_vectors, k=10)
+    print(f'{queries} queries in one batch: {1000 * (time.perf_counter() - start) / queries:.1f}ms per query')
+
+    sample = matrix[:10_000]
+    start = time.perf_counter()
+    similarities = [np.dot(row, query_vectors[0]) / (np.linalg.norm(row) * np.linalg.norm(query_vectors[0])) for row in sample]
+    np.argsort(similarities)[::-1][:10]
+    elapsed = (time.perf_counter() - start) * total / len(sample)
+    print(f'per-row cosine + full sort (extrapolated to {total}): {1000 * elapsed:.0f}ms per query')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
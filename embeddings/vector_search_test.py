@@ -0,0 +1,34 @@
+import unittest
+
+import numpy as np
+
+from embeddings.vector_search import EmbeddingSearch
+
+
+class TestEmbeddingSearch(unittest.TestCase):
+
+    def test_igual_a_busca_linha_a_linha(self):
+        rng = np.random.default_rng(42)
+        matrix = rng.standard_normal((500, 32)).astype(np.float32)
+        queries = rng.standard_normal((3, 32)).astype(np.float32)
+
+        indices, scores = EmbeddingSearch(matrix).search(queries, k=5)
+
+        for query, query_indices, query_scores in zip(queries, indices, scores):
+            similarities = [np.dot(row, query) / (np.linalg.norm(row) * np.linalg.norm(query)) for row in matrix]
+            expected = np.argsort(similarities)[::-1][:5]
+            self.assertEqual(query_indices.tolist(), expected.tolist())
+            np.testing.assert_allclose(query_scores, np.array(similarities)[expected], rtol=1e-5)
+
+    def test_k_maior_que_total(self):
+        matrix = np.array([[1, 0], [0, 1], [1, 1]], dtype=np.float32)
+
+        indices, scores = EmbeddingSearch(matrix).search([1, 0], k=10)
+
+        self.assertEqual(indices.shape, (1, 3))
+        self.assertEqual(indices[0].tolist(), [0, 2, 1])
+        self.assertTrue(np.all(np.diff(scores[0]) <= 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
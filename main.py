@@ -13,6 +13,7 @@ from embeddings.pinecone import *
 from chat import simple_chat, qa_chat
 from document_load.document_loaders import load_document
 from document_load.chunking import chunk_data
+from tratamento_dados.deduplication import ChunkDeduplicator
 
 def chat_no_history(vector_store):
     chain = simple_chat.get_conversation_chain(vector_store, config.EMBEDDINGS_TOP_K_RESULTS)
@@ -55,6 +56,9 @@ def main(load_doc_to_vector_store=False, no_history = False):
         file_path = os.path.join('data', 'CONTRATO.pdf')
         pages:list[Document] = load_document(file_path)
         chunks:list[Document] = chunk_data(pages) #Using defaults from config
+        #O índice é recriado do zero, então cada trecho repetido pode ser indexado uma única vez.
+        #Só texto igual: trechos parecidos podem diferir justamente no que é perguntado (prazos, valores)
+        chunks = ChunkDeduplicator(near_duplicates=False).deduplicate(chunks).unique
 
         vector_store = insert_or_fetch_embeddings(config.EMBEDDING_INDEX_NAME, chunks, reset_index=True)
     else:
@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import time
+import weakref
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+
+from .doc_cache import DocumentLRUCache
+from .doc_codecs import DocumentCodec, JSONDocumentCodec
+from .redis_doc_store import DEFAULT_SCAN_COUNT
+
+logger = logging.getLogger(__name__)
+
+#Um pool por event loop e por url: conexões do redis.asyncio ficam presas ao loop em que foram criadas
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+
+def get_async_connection_pool(redis_url: str, max_connections: Optional[int] = None, **pool_kwargs: Any) -> Any:
+    """Get the redis.asyncio connection pool shared by every store of the running event loop for redis_url.
+
+    Must be called from inside a running event loop.
+    """
+    try:
+        from redis.asyncio import ConnectionPool
+    except ImportError as e:
+        raise ImportError(
+            "The AsyncRedisJSONStore requires the redis library to be installed. "
+            "pip install redis"
+        ) from e
+
+    loop = asyncio.get_running_loop()
+    loop_pools = _pools.setdefault(loop, {})
+    if redis_url not in loop_pools:
+        loop_pools[redis_url] = ConnectionPool.from_url(redis_url, max_connections=max_connections, **pool_kwargs)
+    return loop_pools[redis_url]
+
+
+async def aclose_connection_pools(redis_url: Optional[str] = None) -> None:
+    """Disconnect and forget the pools of the running event loop (only the one for redis_url, if given).
+
+    Stores using them open a new pool on their next call.
+    """
+    loop_pools = _pools.get(asyncio.get_running_loop(), {})
+    urls = [redis_url] if redis_url is not None else list(loop_pools)
+    for url in urls:
+        pool = loop_pools.pop(url, None)
+        if pool is not None:
+            await pool.disconnect()
+
+
+class AsyncRedisJSONStore:
+    """Asynchronous counterpart of RedisJSONStore, built on redis.asyncio.
+
+    Same key layout, codecs, cache and batching as RedisJSONStore, so both can read and write
+    the same namespace. Stores created from a redis_url share one connection pool per event loop.
+
+    Examples:
+        .. code-block:: python
+
+            store = AsyncRedisJSONStore(redis_url="redis://localhost:6379", namespace="parentdoc")
+
+            await store.amset([("key1", doc1), ("key2", doc2)])
+
+            #O mget dos parents pode rodar em paralelo com outras chamadas de I/O
+            docs, answer = await asyncio.gather(store.amget(["key1", "key2"]), llm.apredict(question))
+
+            async for key in store.ayield_keys():
+                print(key)
+
+            #Antes de fechar o event loop
+            await store.aclose()
+    """
+
+    def __init__(
+        self,
+        *,
+        client: Any = None,
+        redis_url: Optional[str] = None,
+        max_connections: Optional[int] = None,
+        ttl: Optional[int] = None,
+        namespace: Optional[str] = None,
+        cache: Optional[DocumentLRUCache] = None,
+        batch_size: Optional[int] = None,
+        codec: Optional[DocumentCodec] = None,
+    ) -> None:
+        """Initialize the store with a redis.asyncio client or a redis_url.
+
+        Args:
+            client: A redis.asyncio.Redis instance
+            redis_url: redis url. The client is created lazily, on the first call,
+                       over the pool shared by the running event loop
+            max_connections: maximum connections of the shared pool, only used with redis_url
+            ttl: time to expire keys in seconds if provided,
+                 if None keys will never expire
+            namespace: if provided, all keys will be prefixed with this namespace
+            cache: if provided, amget reads through this in-process cache
+            batch_size: if provided, amset and amdelete send at most this many keys per command
+            codec: serialization of the documents, defaults to JSONDocumentCodec
+        """
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise ImportError(
+                "The AsyncRedisJSONStore requires the redis library to be installed. "
+                "pip install redis"
+            ) from e
+
+        if client and redis_url:
+            raise ValueError("Either a redis.asyncio client or a redis_url must be provided, but not both.")
+
+        if client:
+            if not isinstance(client, Redis):
+                raise TypeError(
+                    f"Expected redis.asyncio.Redis client, got {type(client).__name__} instead."
+                )
+        elif not redis_url:
+            raise ValueError("Either a redis.asyncio client or a redis_url must be provided.")
+
+        if not isinstance(ttl, int) and ttl is not None:
+            raise TypeError(f"Expected int or None, got {type(ttl)} instead.")
+
+        if batch_size is not None and (not isinstance(batch_size, int) or batch_size <= 0):
+            raise ValueError(f"Expected positive int or None for batch_size, got {batch_size} instead.")
+
+        self._client = client
+        self.redis_url = redis_url
+        self.max_connections = max_connections
+        self.ttl = ttl
+        self.namespace = namespace
+        self.cache = cache
+        self.batch_size = batch_size
+        self.codec = codec if codec is not None else JSONDocumentCodec()
+
+    @property
+    def client(self) -> Any:
+        if self._client is not None:
+            return self._client
+
+        from redis.asyncio import Redis
+        #Não guarda o client, pois o pool depende do event loop corrente
+        return Redis(connection_pool=get_async_connection_pool(self.redis_url, self.max_connections))
+
+    async def aclose(self) -> None:
+        """Close the connections of the store.
+
+        With a redis_url, disconnects the pool shared by the running event loop for that url;
+        a client given in the constructor is left open, it belongs to the caller.
+        """
+        if self._client is None:
+            await aclose_connection_pools(self.redis_url)
+
+    def _get_prefixed_key(self, key: str) -> str:
+        if self.namespace:
+            return f"{self.namespace}:{key}"
+        return key
+
+    def _batches(self, items: Sequence[Any]) -> List[Sequence[Any]]:
+        if self.batch_size is None:
+            return [items] if len(items) > 0 else []
+        return [items[start : start + self.batch_size] for start in range(0, len(items), self.batch_size)]
+
+    async def amget(self, keys: Sequence[str]) -> List[Optional[Document]]:
+        """Get the values associated with the given keys.
+
+        If a key is not found, the corresponding value will be None.
+        """
+        if self.cache is None:
+            return await self._amget_from_redis(keys)
+
+        result = self.cache.get_many(keys)
+
+        missing_keys = [key for key, doc in zip(keys, result) if doc is None]
+        if len(missing_keys) == 0:
+            return result
+
+        #Mesma proteção do RedisJSONStore.mget contra um amset durante a busca
+        generation = self.cache.begin_fetch(missing_keys)
+        fetched_pairs = []
+        try:
+            fetched = dict(zip(missing_keys, await self._amget_from_redis(missing_keys)))
+            fetched_pairs = [(key, doc) for key, doc in fetched.items() if doc is not None]
+        finally:
+            self.cache.end_fetch(generation, missing_keys, fetched_pairs)
+
+        return [doc if doc is not None else fetched[key] for key, doc in zip(keys, result)]
+
+    async def _amget_from_redis(self, keys: Sequence[str]) -> List[Optional[Document]]:
+        prefixed_keys = [self._get_prefixed_key(key) for key in keys]
+        client = self.client
+
+        if self.codec.uses_redis_json:
+            records = await client.json().mget(keys=prefixed_keys, path=".")
+        else:
+            records = await client.mget(prefixed_keys)
+
+        decode = self.codec.decode
+        return [decode(record) if record is not None else None for record in records]
+
+    async def amset(self, key_value_pairs: Sequence[Tuple[str, Document]]) -> None:
+        """Set the values for the given keys, in pipelined batches of at most batch_size keys."""
+        encode = self.codec.encode
+        encoded_pairs = [(self._get_prefixed_key(key), encode(doc)) for key, doc in key_value_pairs]
+        client = self.client
+
+        start = time.perf_counter()
+        batches = self._batches(encoded_pairs)
+        for batch in batches:
+            #Mesmo idioma do RedisJSONStore.mset: um pipeline sem transação por lote, comandos JSON por pipe.json()
+            pipe = client.pipeline(transaction=False)
+            if self.codec.uses_redis_json:
+                pipe.json().mset([(prefixed_key, ".", value) for prefixed_key, value in batch])
+                if self.ttl is not None:
+                    for prefixed_key, _ in batch:
+                        pipe.expire(prefixed_key, self.ttl)
+            else:
+                for prefixed_key, value in batch:
+                    pipe.set(prefixed_key, value, ex=self.ttl)
+            await pipe.execute()
+
+        logger.debug("amset: %d keys in %d batches, %.3fs", len(encoded_pairs), len(batches), time.perf_counter() - start)
+
+        if self.cache is not None:
+            self.cache.invalidate([key for key, _ in key_value_pairs])
+
+    async def amdelete(self, keys: Sequence[str]) -> None:
+        """Delete the given keys."""
+        client = self.client
+        for batch in self._batches([self._get_prefixed_key(key) for key in keys]):
+            await client.unlink(*batch)
+
+        if self.cache is not None:
+            self.cache.invalidate(keys)
+
+    async def ayield_key_batches(self, *, prefix: Optional[str] = None, scan_count: int = DEFAULT_SCAN_COUNT) -> AsyncIterator[List[str]]:
+        """Yield keys in the store in batches, one batch per SCAN reply."""
+        pattern = self._get_prefixed_key(f"{prefix}*" if prefix else "*")
+        namespace_length = len(self.namespace) + 1 if self.namespace else 0
+        client = self.client
+
+        cursor = 0
+        while True:
+            cursor, raw_keys = await client.scan(cursor=cursor, match=pattern, count=scan_count)
+            if raw_keys:
+                yield [
+                    (key.decode("utf-8") if isinstance(key, bytes) else key)[namespace_length:]
+                    for key in raw_keys
+                ]
+            if cursor == 0:
+                break
+
+    async def ayield_keys(self, *, prefix: Optional[str] = None, scan_count: int = DEFAULT_SCAN_COUNT) -> AsyncIterator[str]:
+        """Yield keys in the store."""
+        async for key_batch in self.ayield_key_batches(prefix=prefix, scan_count=scan_count):
+            for key in key_batch:
+                yield key
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from langchain.embeddings.fake import DeterministicFakeEmbedding
+from langchain.schema import Document
+from langchain.storage import InMemoryStore
+
+from retrieval.async_redis_doc_store import AsyncRedisJSONStore, _pools, get_async_connection_pool
+from retrieval.doc_cache import DocumentLRUCache
+from retrieval.doc_codecs import JSONDocumentCodec, MsgpackDocumentCodec
+
+try:
+    from fakeredis import aioredis
+except ImportError:
+    aioredis = None
+
+DOCS = [Document(page_content=f"Cláusula {i} - O consorciado obriga-se a pagar.", metadata={"source": "contrato.pdf", "page": i}) for i in range(5)]
+
+
+@unittest.skipIf(aioredis is None, "fakeredis not installed")
+class TestAsyncRedisJSONStore(unittest.TestCase):
+
+    def store(self, **kwargs):
+        kwargs.setdefault("codec", MsgpackDocumentCodec())
+        return AsyncRedisJSONStore(client=aioredis.FakeRedis(), namespace="parentdoc", **kwargs)
+
+    def test_mset_mget_em_lotes(self):
+        async def run():
+            store = self.store(batch_size=2, ttl=60)
+            await store.amset([(f"k{i}", doc) for i, doc in enumerate(DOCS)])
+
+            docs = await store.amget(["k3", "nao_existe", "k0"])
+            self.assertEqual(docs, [DOCS[3], None, DOCS[0]])
+            self.assertTrue(0 < await store.client.ttl("parentdoc:k0") <= 60)
+
+            keys = sorted([key async for key in store.ayield_keys()])
+            self.assertEqual(keys, [f"k{i}" for i in range(5)])
+
+            await store.amdelete(["k1", "k2"])
+            self.assertEqual(await store.amget(["k1", "k2", "k4"]), [None, None, DOCS[4]])
+            self.assertEqual(sorted([key async for key in store.ayield_keys(prefix="k")]), ["k0", "k3", "k4"])
+
+        asyncio.run(run())
+
+    def test_json(self):
+        async def run():
+            store = self.store(codec=JSONDocumentCodec())
+            await store.amset([("k0", DOCS[0]), ("k1", DOCS[1])])
+            self.assertEqual(await store.amget(["k1", "k0"]), [DOCS[1], DOCS[0]])
+            self.assertEqual(await store.client.json().get("parentdoc:k0", "."), {"page_content": DOCS[0].page_content, "metadata": DOCS[0].metadata})
+
+        asyncio.run(run())
+
+    def test_cache(self):
+        async def run():
+            cache = DocumentLRUCache()
+            store = self.store(cache=cache)
+            await store.amset([("k0", DOCS[0])])
+            await store.amget(["k0", "k1"])
+            self.assertEqual(cache.get_many(["k0", "k1"]), [DOCS[0], None])
+
+            #O mset invalida o cache, e a próxima leitura vem do Redis
+            await store.amset([("k0", DOCS[2])])
+            self.assertEqual(cache.get_many(["k0"]), [None])
+            self.assertEqual(await store.amget(["k0"]), [DOCS[2]])
+
+        asyncio.run(run())
+
+    def test_amset_durante_busca_nao_volta_valor_antigo(self):
+        async def run():
+            store = self.store(cache=DocumentLRUCache())
+            await store.amset([("k0", DOCS[0])])
+            fetch_from_redis = store._amget_from_redis
+
+            async def slow_fetch(keys):
+                docs = await fetch_from_redis(keys)
+                await store.amset([("k0", DOCS[1])])
+                return docs
+
+            store._amget_from_redis = slow_fetch
+            self.assertEqual(await store.amget(["k0"]), [DOCS[0]])
+            store._amget_from_redis = fetch_from_redis
+            self.assertEqual(await store.amget(["k0"]), [DOCS[1]])
+
+        asyncio.run(run())
+
+    def test_um_pool_por_event_loop(self):
+        redis_url = "redis://localhost:6379"
+
+        async def pool_of_loop():
+            store = AsyncRedisJSONStore(redis_url=redis_url)
+            pool = get_async_connection_pool(redis_url)
+            self.assertIs(store.client.connection_pool, pool)
+            self.assertIs(AsyncRedisJSONStore(redis_url=redis_url).client.connection_pool, pool)
+
+            await store.aclose()
+            self.assertNotIn(redis_url, _pools[asyncio.get_running_loop()])
+            #Depois do aclose, a próxima chamada abre outro pool
+            self.assertIsNot(store.client.connection_pool, pool)
+            await store.aclose()
+            return pool
+
+        self.assertIsNot(asyncio.run(pool_of_loop()), asyncio.run(pool_of_loop()))
+
+    def test_client_do_chamador_nao_e_fechado(self):
+        async def run():
+            store = self.store()
+            await store.amset([("k0", DOCS[0])])
+            await store.aclose()
+            self.assertEqual(await store.amget(["k0"]), [DOCS[0]])
+
+        asyncio.run(run())
+
+
+@unittest.skipIf(aioredis is None, "fakeredis not installed")
+class TestAsyncParentDocumentRetriever(unittest.TestCase):
+
+    def test_parents_pelo_store_assincrono(self):
+        from retrieval.local_vector_store import LocalVectorStore
+        from retrieval.redis_parent_retriever import AsyncParentDocumentRetriever, get_child_splitter
+
+        async def run(directory):
+            async_docstore = AsyncRedisJSONStore(client=aioredis.FakeRedis(), namespace="parentdoc", codec=MsgpackDocumentCodec())
+            vectorstore = LocalVectorStore(DeterministicFakeEmbedding(size=16), path=os.path.join(directory, "vectors"))
+            vectorstore.add_texts(
+                [DOCS[3].page_content, DOCS[1].page_content, DOCS[3].page_content + " Cópia."],
+                [{"doc_id": "p3"}, {"doc_id": "p1"}, {"doc_id": "p3"}],
+            )
+            await async_docstore.amset([("p1", DOCS[1]), ("p3", DOCS[3])])
+
+            #O docstore síncrono fica vazio: o caminho assíncrono não deve usá-lo
+            retriever = AsyncParentDocumentRetriever(
+                vectorstore=vectorstore,
+                docstore=InMemoryStore(),
+                async_docstore=async_docstore,
+                child_splitter=get_child_splitter(),
+                search_kwargs={"k": 3},
+            )
+            docs = await retriever.aget_relevant_documents(DOCS[3].page_content)
+            self.assertEqual(docs, [DOCS[3], DOCS[1]])
+            self.assertEqual(retriever.get_relevant_documents(DOCS[3].page_content), [])
+
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(run(directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
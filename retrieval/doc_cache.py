@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+
+
+def estimate_document_size(document: Document) -> int:
+    """Approximate size in bytes of a Document held in memory.
+
+    Not exact (Python object overhead is ignored), but proportional to the payload,
+    which is what matters to keep the cache bounded.
+    """
+    size = len(document.page_content.encode("utf-8"))
+    for key, value in document.metadata.items():
+        size += len(str(key)) + len(str(value))
+    return size
+
+
+class DocumentLRUCache:
+    """In-process read-through cache for Document values.
+
+    Least recently used entries are evicted once the total (approximate) size in bytes
+    exceeds max_bytes. If ttl is provided, entries older than ttl seconds are treated as misses,
+    which bounds staleness when another process rewrites the same keys.
+
+    Thread safe, so a single instance can be shared by every Streamlit session of the process.
+
+    Read-through fetches are bracketed by begin_fetch/end_fetch: a key invalidated while its fetch was in flight
+    is not inserted by end_fetch, since the fetched value may predate the write that invalidated it.
+
+    Examples:
+        .. code-block:: python
+
+            cache = DocumentLRUCache(max_bytes=32 * 1024 * 1024, ttl=600)
+            cache.put_many([("key1", doc1)])
+            docs = cache.get_many(["key1", "key2"])   # [doc1, None]
+            print(cache.stats())
+
+            generation = cache.begin_fetch(["key2"])
+            docs = fetch_from_redis(["key2"])
+            cache.end_fetch(generation, ["key2"], [("key2", docs[0])])
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = None) -> None:
+        if max_bytes <= 0:
+            raise ValueError(f"max_bytes must be positive, got {max_bytes}.")
+        if ttl is not None and ttl <= 0:
+            raise ValueError(f"ttl must be positive or None, got {ttl}.")
+
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        #chave -> (documento, tamanho estimado, instante de inserção)
+        self._entries: "OrderedDict[str, Tuple[Document, int, float]]" = OrderedDict()
+        self._size_bytes = 0
+        self._lock = threading.Lock()
+
+        #Invalidações das chaves com busca em andamento: chave -> geração da última invalidação.
+        #Só guarda chaves em busca, e as remove quando a última busca termina
+        self._generation = 0
+        self._fetching: Dict[str, int] = {}
+        self._invalidated: Dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Document]]:
+        """Get cached documents for the given keys, None for each miss.
+
+        Returned documents are shallow copies, so callers changing metadata do not corrupt the cache.
+        """
+        now = time.monotonic()
+        result: List[Optional[Document]] = []
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and self.ttl is not None and now - entry[2] > self.ttl:
+                    self._remove(key)
+                    entry = None
+
+                if entry is None:
+                    self.misses += 1
+                    result.append(None)
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    result.append(self.__copy(entry[0]))
+
+        return result
+
+    def put_many(self, key_value_pairs: Sequence[Tuple[str, Document]]) -> None:
+        """Add or replace documents in the cache, evicting the least recently used if needed."""
+        now = time.monotonic()
+
+        with self._lock:
+            for key, document in key_value_pairs:
+                size = estimate_document_size(document)
+                if key in self._entries:
+                    self._remove(key)
+
+                if size > self.max_bytes:
+                    #Documento maior que o cache inteiro, não adianta guardar
+                    continue
+
+                self._entries[key] = (self.__copy(document), size, now)
+                self._size_bytes += size
+
+            while self._size_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def begin_fetch(self, keys: Sequence[str]) -> int:
+        """Register a fetch of keys from the backing store. Returns the generation to pass to end_fetch."""
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                self._fetching[key] = self._fetching.get(key, 0) + 1
+            return self._generation
+
+    def end_fetch(self, generation: int, keys: Sequence[str], key_value_pairs: Sequence[Tuple[str, Document]] = ()) -> None:
+        """Insert the fetched documents, except those invalidated after begin_fetch, and end the fetch of keys.
+
+        Must be called once for every begin_fetch, also when the fetch fails (with no key_value_pairs).
+        """
+        with self._lock:
+            fresh = [(key, document) for key, document in key_value_pairs if self._invalidated.get(key, -1) <= generation]
+            for key in dict.fromkeys(keys):
+                remaining = self._fetching.get(key, 0) - 1
+                if remaining > 0:
+                    self._fetching[key] = remaining
+                else:
+                    self._fetching.pop(key, None)
+                    self._invalidated.pop(key, None)
+        self.put_many(fresh)
+
+    def invalidate(self, keys: Sequence[str]) -> None:
+        """Remove the given keys from the cache, if present, and keep in-flight fetches from inserting them back."""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+                if key in self._fetching:
+                    self._invalidated[key] = self._generation
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Counters for monitoring the cache effectiveness."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "evictions": self.evictions,
+                "items": len(self._entries),
+                "size_bytes": self._size_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _remove(self, key: str) -> None:
+        #Deve ser chamado com o lock adquirido
+        _, size, _ = self._entries.pop(key)
+        self._size_bytes -= size
+
+    def __copy(self, document: Document) -> Document:
+        return Document(page_content=document.page_content, metadata=dict(document.metadata))
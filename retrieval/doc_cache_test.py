@@ -0,0 +1,99 @@
+import time
+import unittest
+
+from langchain.schema import Document
+
+from retrieval.doc_cache import DocumentLRUCache, estimate_document_size
+
+
+class TestDocumentLRUCache(unittest.TestCase):
+
+    def test_hit_miss(self):
+        cache = DocumentLRUCache()
+        doc = Document(page_content="Cláusula 1", metadata={"source": "contrato.pdf"})
+
+        cache.put_many([("a", doc)])
+        result = cache.get_many(["a", "b"])
+
+        self.assertEqual(result[0].page_content, "Cláusula 1")
+        self.assertEqual(result[0].metadata, {"source": "contrato.pdf"})
+        self.assertIsNone(result[1])
+
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_copia_protege_cache(self):
+        cache = DocumentLRUCache()
+        cache.put_many([("a", Document(page_content="x", metadata={"page": 1}))])
+
+        cache.get_many(["a"])[0].metadata["page"] = 99
+
+        self.assertEqual(cache.get_many(["a"])[0].metadata["page"], 1)
+
+    def test_evicao_por_tamanho(self):
+        doc = Document(page_content="x" * 100, metadata={})
+        size = estimate_document_size(doc)
+        cache = DocumentLRUCache(max_bytes=size * 2)
+
+        cache.put_many([("a", doc), ("b", doc)])
+        #Acessa "a" para que "b" seja o menos recentemente usado
+        cache.get_many(["a"])
+        cache.put_many([("c", doc)])
+
+        self.assertIsNotNone(cache.get_many(["a"])[0])
+        self.assertIsNone(cache.get_many(["b"])[0])
+        self.assertIsNotNone(cache.get_many(["c"])[0])
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertLessEqual(cache.stats()["size_bytes"], size * 2)
+
+    def test_ttl(self):
+        cache = DocumentLRUCache(ttl=0.05)
+        cache.put_many([("a", Document(page_content="x"))])
+
+        time.sleep(0.1)
+
+        self.assertIsNone(cache.get_many(["a"])[0])
+        self.assertEqual(cache.stats()["items"], 0)
+
+    def test_invalidate(self):
+        cache = DocumentLRUCache()
+        cache.put_many([("a", Document(page_content="x")), ("b", Document(page_content="y"))])
+
+        cache.invalidate(["a", "inexistente"])
+
+        self.assertIsNone(cache.get_many(["a"])[0])
+        self.assertIsNotNone(cache.get_many(["b"])[0])
+
+    def test_invalidacao_durante_busca(self):
+        cache = DocumentLRUCache()
+        old, new = Document(page_content="antigo"), Document(page_content="novo")
+
+        #Busca lê o valor antigo, um mset grava e invalida, e só então a busca termina: o antigo não entra
+        generation = cache.begin_fetch(["a", "b"])
+        cache.invalidate(["a"])
+        cache.end_fetch(generation, ["a", "b"], [("a", old), ("b", old)])
+        self.assertEqual(cache.get_many(["a", "b"]), [None, old])
+
+        #Busca iniciada depois da invalidação insere normalmente
+        generation = cache.begin_fetch(["a"])
+        cache.end_fetch(generation, ["a"], [("a", new)])
+        self.assertEqual(cache.get_many(["a"]), [new])
+
+        #Buscas concorrentes da mesma chave: só a iniciada depois da invalidação insere
+        cache.invalidate(["a"])
+        first = cache.begin_fetch(["a"])
+        cache.invalidate(["a"])
+        second = cache.begin_fetch(["a"])
+        cache.end_fetch(second, ["a"], [("a", new)])
+        cache.end_fetch(first, ["a"], [("a", old)])
+        self.assertEqual(cache.get_many(["a"]), [new])
+
+        #Busca que falhou também termina, e nada fica registrado
+        generation = cache.begin_fetch(["c"])
+        cache.end_fetch(generation, ["c"])
+        self.assertEqual((cache._fetching, cache._invalidated), ({}, {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
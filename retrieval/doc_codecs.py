@@ -0,0 +1,110 @@
+import threading
+from typing import Any, Dict
+
+from langchain.schema import Document
+
+
+class DocumentCodec:
+    """Serializes Document objects to and from the value stored in Redis.
+
+    Codecs with uses_redis_json = True produce dicts stored with JSON.SET/JSON.MGET,
+    the others produce bytes stored with plain SET/MGET.
+
+    A namespace must always be read with the same codec it was written with.
+    """
+
+    name: str = ""
+    uses_redis_json: bool = False
+
+    def encode(self, document: Document) -> Any:
+        raise NotImplementedError
+
+    def decode(self, value: Any) -> Document:
+        raise NotImplementedError
+
+
+class JSONDocumentCodec(DocumentCodec):
+    """Stores each Document as a RedisJSON object, readable in RedisInsight. The original format."""
+
+    name = "json"
+    uses_redis_json = True
+
+    def encode(self, document: Document) -> dict:
+        return {"page_content": document.page_content, "metadata": document.metadata}
+
+    def decode(self, value: dict) -> Document:
+        return Document(page_content=value["page_content"], metadata=value["metadata"])
+
+
+class MsgpackDocumentCodec(DocumentCodec):
+    """Stores each Document as a msgpack array [page_content, metadata] with plain GET/SET.
+
+    Avoids the JSON path evaluation on the server and the JSON parsing on the client.
+    """
+
+    name = "msgpack"
+
+    def __init__(self) -> None:
+        try:
+            import msgpack
+        except ImportError as e:
+            raise ImportError(
+                "The msgpack codec requires the msgpack library to be installed. "
+                "pip install msgpack"
+            ) from e
+        self._msgpack = msgpack
+
+    def encode(self, document: Document) -> bytes:
+        return self._msgpack.packb([document.page_content, document.metadata], use_bin_type=True)
+
+    def decode(self, value: bytes) -> Document:
+        page_content, metadata = self._msgpack.unpackb(value, raw=False)
+        return Document(page_content=page_content, metadata=metadata)
+
+
+class ZstdMsgpackDocumentCodec(MsgpackDocumentCodec):
+    """msgpack payload compressed with zstd. Parent chunks are large, repetitive text,
+    so this trades a little CPU for much less Redis memory and network transfer.
+    """
+
+    name = "zstd"
+
+    def __init__(self, level: int = 3) -> None:
+        super().__init__()
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError(
+                "The zstd codec requires the zstandard library to be installed. "
+                "pip install zstandard"
+            ) from e
+        self._zstandard = zstandard
+        self.level = level
+        #Compressores do zstandard não podem ser usados por duas threads ao mesmo tempo, e as sessões do streamlit são threads
+        self._local = threading.local()
+
+    def encode(self, document: Document) -> bytes:
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = self._zstandard.ZstdCompressor(level=self.level)
+        return compressor.compress(super().encode(document))
+
+    def decode(self, value: bytes) -> Document:
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = self._zstandard.ZstdDecompressor()
+        return super().decode(decompressor.decompress(value))
+
+
+CODECS: Dict[str, type] = {
+    JSONDocumentCodec.name: JSONDocumentCodec,
+    MsgpackDocumentCodec.name: MsgpackDocumentCodec,
+    ZstdMsgpackDocumentCodec.name: ZstdMsgpackDocumentCodec,
+}
+
+
+def get_codec(name: str, **kwargs: Any) -> DocumentCodec:
+    """Instantiate a codec by name: json, msgpack or zstd."""
+    if name not in CODECS:
+        raise ValueError(f"Unknown document codec {name}, expected one of {list(CODECS)}.")
+    return CODECS[name](**kwargs)
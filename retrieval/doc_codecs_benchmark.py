@@ -0,0 +1,119 @@
+"""
+Compara os codecs de parent documents (retrieval.doc_codecs) quanto a tamanho do payload,
+latência do mget e memória ocupada no Redis.
+
+Usa como amostra os parent documents já carregados no namespace REDIS_PARENT_KEY_PREFIX
+(ou documentos sintéticos, se o namespace estiver vazio), grava uma cópia em um namespace
+temporário por codec e apaga tudo ao final.
+
+Uso (da raiz do projeto):
+    python -m retrieval.doc_codecs_benchmark [quantidade_de_documentos]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+from dotenv import load_dotenv, find_dotenv
+from langchain.schema import Document
+from langchain.utilities.redis import get_client
+
+from .doc_codecs import CODECS, get_codec
+from .redis_doc_store import RedisJSONStore
+from .redis_parent_retriever import REDIS_PARENT_KEY_PREFIX, get_redis_url
+
+BENCHMARK_NAMESPACE_PREFIX = "benchmark_codec"
+#Mesma quantidade de parents que o retriever busca por pergunta
+MGET_BATCH_SIZE = int(os.getenv("TOP_K", 20))
+MGET_ROUNDS = 200
+
+
+def load_sample(client, sample_size: int) -> List[Document]:
+    source_store = RedisJSONStore(client=client, namespace=REDIS_PARENT_KEY_PREFIX)
+    sample = []
+    for _, doc in source_store.yield_items():
+        if doc is not None:
+            sample.append(doc)
+        if len(sample) >= sample_size:
+            break
+
+    if len(sample) == 0:
+        print(f"Namespace {REDIS_PARENT_KEY_PREFIX} vazio, usando documentos sintéticos")
+        clausula = "CLÁUSULA {n} - O CONSORCIADO obriga-se a pagar as contribuições mensais à ADMINISTRADORA, " \
+                   "acrescidas da taxa de administração e do fundo de reserva, nos termos deste contrato. "
+        sample = [
+            Document(page_content=clausula.format(n=i) * 8, metadata={"source": "CONTRATO.pdf", "page": i // 3})
+            for i in range(sample_size)
+        ]
+    return sample
+
+
+def memory_usage(client, keys: List[str]) -> int:
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.memory_usage(key, samples=0)
+    return sum(usage or 0 for usage in pipe.execute())
+
+
+def benchmark_codec(client, codec_name: str, sample: List[Document]) -> Dict[str, float]:
+    codec = get_codec(codec_name)
+    namespace = f"{BENCHMARK_NAMESPACE_PREFIX}_{codec_name}"
+    store = RedisJSONStore(client=client, namespace=namespace, codec=codec, batch_size=500)
+    keys = [str(i) for i in range(len(sample))]
+
+    try:
+        payload_bytes = 0
+        for doc in sample:
+            encoded = codec.encode(doc)
+            #No caso do json, mede o tamanho do json serializado
+            payload_bytes += len(encoded) if isinstance(encoded, bytes) else len(str(encoded).encode("utf-8"))
+
+        store.mset(list(zip(keys, sample)))
+        redis_bytes = memory_usage(client, [store._get_prefixed_key(key) for key in keys])
+
+        latencies = []
+        for _ in range(MGET_ROUNDS):
+            batch = random.sample(keys, min(MGET_BATCH_SIZE, len(keys)))
+            start = time.perf_counter()
+            store.mget(batch)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+
+        return {
+            "payload_bytes": payload_bytes,
+            "redis_bytes": redis_bytes,
+            "mget_p50_ms": statistics.median(latencies) * 1000,
+            "mget_p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        }
+    finally:
+        store.mdelete(keys)
+
+
+def main(sample_size: int):
+    load_dotenv(find_dotenv())
+    client = get_client(get_redis_url())
+
+    sample = load_sample(client, sample_size)
+    print(f"{len(sample)} documentos, mget de {MGET_BATCH_SIZE} chaves x {MGET_ROUNDS} rodadas\n")
+
+    results = {}
+    for codec_name in CODECS:
+        try:
+            results[codec_name] = benchmark_codec(client, codec_name, sample)
+        except ImportError as e:
+            print(f"{codec_name}: ignorado ({e})")
+
+    baseline = results.get("json")
+    print(f"{'codec':<10}{'payload (KB)':>14}{'redis (KB)':>14}{'mget p50 (ms)':>16}{'mget p95 (ms)':>16}{'memória vs json':>18}")
+    for codec_name, result in results.items():
+        ratio = result["redis_bytes"] / baseline["redis_bytes"] if baseline and baseline["redis_bytes"] else float("nan")
+        print(
+            f"{codec_name:<10}{result['payload_bytes'] / 1024:>14.1f}{result['redis_bytes'] / 1024:>14.1f}"
+            f"{result['mget_p50_ms']:>16.2f}{result['mget_p95_ms']:>16.2f}{ratio:>17.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,68 @@
+import json
+import threading
+import unittest
+
+from langchain.schema import Document
+
+from retrieval.doc_codecs import CODECS, JSONDocumentCodec, get_codec
+
+DOCUMENT = Document(
+    page_content="CLÁUSULA 12ª - O consorciado obriga-se a pagar as contribuições mensais. Ação, coração, €, 中文, 🙂\n\n" * 20,
+    metadata={
+        "source": "data/contratos/Regulamento Consórcio – versão 3.pdf",
+        "page": 7,
+        "score": 0.875,
+        "ativo": True,
+        "revisao": None,
+        "secoes": ["Objeto", "Prazo", "Foro"],
+        "partes": {"administradora": {"nome": "BB Consórcios", "cnpj": "00.000.000/0001-00"}, "grupos": [1, 2, {"cota": 305}]},
+    },
+)
+
+
+class TestDocumentCodecs(unittest.TestCase):
+
+    def test_ida_e_volta(self):
+        for name in CODECS:
+            with self.subTest(codec=name):
+                codec = get_codec(name)
+                value = codec.encode(DOCUMENT)
+                if codec.uses_redis_json:
+                    #O Redis guarda e devolve o objeto como texto JSON
+                    value = json.loads(json.dumps(value))
+                else:
+                    self.assertIsInstance(value, bytes)
+
+                decoded = codec.decode(value)
+                self.assertEqual(decoded.page_content, DOCUMENT.page_content)
+                self.assertEqual(decoded.metadata, DOCUMENT.metadata)
+
+    def test_zstd_comprime_e_funciona_entre_threads(self):
+        codec = get_codec("zstd", level=5)
+        self.assertLess(len(codec.encode(DOCUMENT)), len(get_codec("msgpack").encode(DOCUMENT)) / 4)
+
+        #Compressores por thread: encode e decode simultâneos não se misturam
+        errors = []
+
+        def round_trip(number):
+            document = Document(page_content=f"{number} " + DOCUMENT.page_content, metadata={"thread": number})
+            for _ in range(50):
+                decoded = codec.decode(codec.encode(document))
+                if decoded.page_content != document.page_content or decoded.metadata != document.metadata:
+                    errors.append(number)
+
+        threads = [threading.Thread(target=round_trip, args=(number,)) for number in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_codec_por_nome(self):
+        self.assertIsInstance(get_codec("json"), JSONDocumentCodec)
+        with self.assertRaises(ValueError):
+            get_codec("pickle")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,436 @@
+"""
+Vector store local, em processo, alternativa ao índice FLAT do Redis (busca exaustiva a cada consulta).
+
+Índice IVF (inverted file): os vetores são agrupados por k-means em n_lists listas, e cada consulta só
+compara com os vetores das n_probe listas de centróides mais próximos. Os vetores ficam numa matriz float32
+normalizada, carregada memory-mapped, então abrir um índice grande é imediato e o SO pagina sob demanda.
+
+Layout em disco (diretório):
+    vectors.npy      - matriz (n, d) float32, linhas normalizadas
+    documents.jsonl  - id, page_content e metadata de cada linha, na mesma ordem
+    ivf.npz          - centróides e a lista de cada linha (ausente enquanto o índice não foi treinado)
+"""
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+from langchain.schema.vectorstore import VectorStore
+
+from embeddings.vector_search import normalize_rows
+
+VECTORS_FILE = "vectors.npy"
+DOCUMENTS_FILE = "documents.jsonl"
+IVF_FILE = "ivf.npz"
+
+#Abaixo disso a busca exata já é rápida, e não há vetores suficientes para treinar bons centróides
+IVF_MIN_ROWS = 10_000
+#Retreina quando a base cresce esse fator desde o último treino, para os centróides continuarem representativos
+IVF_RETRAIN_GROWTH = 4.0
+#Quantidade de listas consultadas por busca. Mais listas, mais recall e mais latência
+DEFAULT_N_PROBE = 16
+#Vetores por lista na amostra usada no k-means, para o treino não crescer com a base
+KMEANS_POINTS_PER_LIST = 64
+KMEANS_ITERATIONS = 15
+#Linhas por bloco ao atribuir vetores às listas, para limitar a memória da matriz de scores
+ASSIGN_BLOCK_ROWS = 65_536
+
+
+def default_n_lists(total: int) -> int:
+    return max(1, int(math.sqrt(total)))
+
+
+def train_kmeans(vectors: np.ndarray, n_lists: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Spherical k-means over normalized vectors. Returns the (n_lists, d) normalized centroids."""
+    rng = np.random.default_rng(seed)
+    n_lists = min(n_lists, vectors.shape[0])
+    centroids = vectors[rng.choice(vectors.shape[0], n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = assign_to_lists(vectors, centroids)
+        counts = np.bincount(assignments, minlength=n_lists)
+        #Soma por lista com os vetores ordenados pela lista (np.add.at é muito mais lento)
+        order = np.argsort(assignments, kind="stable")
+        sums = np.zeros_like(centroids)
+        non_empty = np.flatnonzero(counts)
+        sums[non_empty] = np.add.reduceat(vectors[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[non_empty])
+
+        #Listas vazias recebem um vetor aleatório, para não desperdiçar centróides
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = vectors[rng.choice(vectors.shape[0], len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+
+def assign_to_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for each vector."""
+    assignments = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        assignments[start:start + ASSIGN_BLOCK_ROWS] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, from the highest."""
+    k = min(k, scores.shape[0])
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k] if k < scores.shape[0] else np.arange(scores.shape[0])
+    return top[np.argsort(-scores[top])]
+
+
+class LocalVectorStore(VectorStore):
+    """VectorStore in-process, with an IVF index over a memory-mapped float32 matrix.
+
+    Drop-in alternative to the Redis vector store for the parent retriever: supports add_texts / add_documents,
+    similarity search (with cosine similarity as score) and delete by id. Additions and deletions are incremental:
+    new vectors are assigned to the existing lists and deleted ones are only marked, until save() compacts the files.
+
+    While there are fewer than IVF_MIN_ROWS vectors the search is exact; the index is trained automatically
+    when the store reaches that size (or explicitly with train()).
+
+    Examples:
+        store = LocalVectorStore.load("data/local_vector_store", OpenAIEmbeddings())
+        docs = store.similarity_search("prazo para contemplação", k=8)
+
+        #Carga
+        store = LocalVectorStore(OpenAIEmbeddings(), path="data/local_vector_store")
+        ids = store.add_documents(chunks)
+        store.save()
+    """
+
+    def __init__(self, embedding: Embeddings, path: Optional[str] = None, n_probe: int = DEFAULT_N_PROBE, ivf_min_rows: int = IVF_MIN_ROWS):
+        self._embedding = embedding
+        self.path = path
+        self.n_probe = n_probe
+        self.ivf_min_rows = ivf_min_rows
+
+        self._lock = threading.RLock()
+        self._dimension: Optional[int] = None
+        #Vetores já persistidos (memory-mapped) e os adicionados depois do último save
+        self._base = np.empty((0, 0), dtype=np.float32)
+        self._extra = np.empty((0, 0), dtype=np.float32)
+        #Lotes adicionados ainda fora de _extra (e suas listas do IVF): concatenados uma vez só, antes da próxima
+        #busca, delete, treino ou save, e não a cada add, o que seria quadrático numa carga em muitos lotes pequenos
+        self._pending: List[np.ndarray] = []
+        self._pending_assignments: List[np.ndarray] = []
+        self._ids: List[Optional[str]] = []
+        #Texto e metadata de cada linha; os Documents só são criados para os resultados das buscas
+        self._texts: List[Optional[str]] = []
+        self._metadatas: List[Optional[dict]] = []
+        self._row_by_id: Dict[str, int] = {}
+        self._deleted = np.zeros(0, dtype=bool)
+
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._trained_size = 0
+        self._lists: Optional[List[np.ndarray]] = None
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    #Escrita
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, metadatas, ids)
+
+    def add_embeddings(self, texts: Sequence[str], vectors: Sequence[Sequence[float]], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        """Add already computed embeddings. Existing ids are replaced."""
+        if len(texts) == 0:
+            return []
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas if metadatas is not None else [{} for _ in texts]
+        if not (len(ids) == len(metadatas) == len(texts) == len(vectors)):
+            raise ValueError("texts, vectors, metadatas and ids must have the same length")
+
+        matrix = normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+        with self._lock:
+            if self._dimension is None:
+                self._dimension = matrix.shape[1]
+                self._base = np.empty((0, self._dimension), dtype=np.float32)
+                self._extra = np.empty((0, self._dimension), dtype=np.float32)
+            elif matrix.shape[1] != self._dimension:
+                raise ValueError(f"Expected embeddings of dimension {self._dimension}, got {matrix.shape[1]}")
+
+            self.delete([id for id in ids if id in self._row_by_id])
+
+            first_row = len(self._ids)
+            self._pending.append(matrix)
+            self._ids.extend(ids)
+            self._texts.extend(texts)
+            self._metadatas.extend(metadatas)
+            self._row_by_id.update((id, first_row + offset) for offset, id in enumerate(ids))
+
+            if self.is_trained:
+                self._pending_assignments.append(assign_to_lists(matrix, self._centroids))
+                self._lists = None
+
+            needs_training = len(self) >= self.ivf_min_rows and (
+                not self.is_trained or len(self) > IVF_RETRAIN_GROWTH * self._trained_size
+            )
+            if needs_training:
+                self.train()
+
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Mark the ids as deleted. The rows are only removed from the files by save()."""
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        with self._lock:
+            if any(id in self._row_by_id for id in ids):
+                self._flush()
+            for id in ids:
+                row = self._row_by_id.pop(id, None)
+                if row is not None:
+                    self._deleted[row] = True
+                    self._texts[row] = None
+                    self._metadatas[row] = None
+        return True
+
+    def train(self, n_lists: Optional[int] = None, seed: int = 0):
+        """(Re)train the IVF centroids over the live vectors and rebuild the lists."""
+        with self._lock:
+            self._flush()
+            live_rows = np.flatnonzero(~self._deleted)
+            if len(live_rows) == 0:
+                return
+
+            n_lists = n_lists or default_n_lists(len(live_rows))
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(live_rows, min(len(live_rows), KMEANS_POINTS_PER_LIST * n_lists), replace=False))
+            self._centroids = train_kmeans(self._vectors(sample_rows), n_lists, seed=seed)
+
+            self._assignments = np.concatenate([
+                assign_to_lists(self._base, self._centroids),
+                assign_to_lists(self._extra, self._centroids),
+            ])
+            self._trained_size = len(live_rows)
+            self._lists = None
+
+    #Busca
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4, n_probe: Optional[int] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Documents most similar to the embedding, with the cosine similarity as score, from the most similar.
+
+        n_probe overrides the number of IVF lists searched; n_probe >= number of lists is an exact search.
+        """
+        rows, scores = self.search_rows(embedding, k, n_probe)
+        return [
+            (Document(page_content=self._texts[row], metadata=self._metadatas[row]), float(score))
+            for row, score in zip(rows, scores)
+        ]
+
+    def search_rows(self, embedding: Sequence[float], k: int = 4, n_probe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows (positions in the store) and scores of the k most similar live vectors."""
+        with self._lock:
+            if len(self) == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+            self._flush()
+            query = normalize_rows(np.asarray(embedding, dtype=np.float32).reshape(1, -1))[0]
+            n_probe = n_probe or self.n_probe
+
+            if not self.is_trained or n_probe >= self._centroids.shape[0]:
+                candidates = None
+                scores = np.concatenate([self._base @ query, self._extra @ query])
+            else:
+                probed = top_k(self._centroids @ query, n_probe)
+                lists = self._inverted_lists()
+                candidates = np.sort(np.concatenate([lists[index] for index in probed]))
+                scores = self._vectors(candidates) @ query
+
+            deleted = self._deleted if candidates is None else self._deleted[candidates]
+            scores[deleted] = -np.inf
+            positions = top_k(scores, min(k, len(self)))
+            positions = positions[np.isfinite(scores[positions])]
+
+            rows = positions if candidates is None else candidates[positions]
+            return rows, scores[positions]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        #Os scores já são similaridade de cosseno
+        return lambda score: score
+
+    def _flush(self):
+        """Move the batches added since the last flush to _extra, in a single concatenation."""
+        if not self._pending:
+            return
+        rows = sum(matrix.shape[0] for matrix in self._pending)
+        self._extra = np.concatenate([self._extra] + self._pending)
+        self._deleted = np.concatenate([self._deleted, np.zeros(rows, dtype=bool)])
+        if self._pending_assignments:
+            self._assignments = np.concatenate([self._assignments] + self._pending_assignments)
+        self._pending = []
+        self._pending_assignments = []
+
+    def _vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Vectors of the given (sorted) rows, gathered from the memory-mapped base and the in-memory additions."""
+        split = np.searchsorted(rows, self._base.shape[0])
+        return np.concatenate([self._base[rows[:split]], self._extra[rows[split:] - self._base.shape[0]]])
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        if self._lists is None:
+            order = np.argsort(self._assignments, kind="stable")
+            bounds = np.searchsorted(self._assignments[order], np.arange(self._centroids.shape[0] + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(self._centroids.shape[0])]
+        return self._lists
+
+    #Persistência
+
+    def save(self, path: Optional[str] = None):
+        """Write the live vectors, documents and index to the directory, compacting deleted rows,
+        and reopen the vectors memory-mapped from the new files."""
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path to save the vector store")
+
+        with self._lock:
+            self._flush()
+            os.makedirs(path, exist_ok=True)
+            live_rows = np.flatnonzero(~self._deleted)
+            vectors_path = os.path.join(path, VECTORS_FILE)
+            documents_path = os.path.join(path, DOCUMENTS_FILE)
+            ivf_path = os.path.join(path, IVF_FILE)
+
+            #Arquivos temporários + rename: um leitor nunca vê um conjunto pela metade,
+            #e a matriz memory-mapped atual continua válida enquanto é copiada
+            with open(vectors_path + ".tmp", "wb") as f:
+                np.save(f, self._vectors(live_rows) if self._dimension is not None else np.empty((0, 0), dtype=np.float32))
+            with open(documents_path + ".tmp", "w", encoding="utf-8") as f:
+                for row in live_rows:
+                    f.write(json.dumps({"id": self._ids[row], "page_content": self._texts[row], "metadata": self._metadatas[row]}, ensure_ascii=False))
+                    f.write("\n")
+            if self.is_trained:
+                with open(ivf_path + ".tmp", "wb") as f:
+                    np.savez(f, centroids=self._centroids, assignments=self._assignments[live_rows], trained_size=self._trained_size)
+
+            os.replace(vectors_path + ".tmp", vectors_path)
+            os.replace(documents_path + ".tmp", documents_path)
+            if self.is_trained:
+                os.replace(ivf_path + ".tmp", ivf_path)
+            elif os.path.exists(ivf_path):
+                os.remove(ivf_path)
+
+            self.path = path
+            self._open(path)
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings, n_probe: int = DEFAULT_N_PROBE, ivf_min_rows: int = IVF_MIN_ROWS) -> "LocalVectorStore":
+        store = cls(embedding, path=path, n_probe=n_probe, ivf_min_rows=ivf_min_rows)
+        store._open(path)
+        return store
+
+    def _open(self, path: str):
+        base = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        ids, texts, metadatas = [], [], []
+        with open(os.path.join(path, DOCUMENTS_FILE), encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                ids.append(entry["id"])
+                texts.append(entry["page_content"])
+                metadatas.append(entry["metadata"])
+        if len(ids) != base.shape[0]:
+            raise ValueError(f"{path} has {len(ids)} documents, but {base.shape[0]} vectors")
+
+        self._dimension = base.shape[1] if base.shape[0] > 0 else None
+        self._base = base
+        self._extra = np.empty((0, base.shape[1]), dtype=np.float32)
+        self._pending = []
+        self._pending_assignments = []
+        self._ids = ids
+        self._texts = texts
+        self._metadatas = metadatas
+        self._row_by_id = {id: row for row, id in enumerate(ids)}
+        self._deleted = np.zeros(len(ids), dtype=bool)
+
+        ivf_path = os.path.join(path, IVF_FILE)
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as ivf:
+                self._centroids = ivf["centroids"]
+                self._assignments = ivf["assignments"]
+                self._trained_size = int(ivf["trained_size"])
+        else:
+            self._centroids = None
+            self._assignments = np.empty(0, dtype=np.int32)
+            self._trained_size = 0
+        self._lists = None
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, path: Optional[str] = None, **kwargs: Any) -> "LocalVectorStore":
+        store = cls(embedding, path=path, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        if path is not None:
+            store.save()
+        return store
+
+
+def main(total: int = 200_000, dimension: int = 256, queries: int = 200, k: int = 10):
+    """Recall@k and latency of the IVF search against exact search, over clustered synthetic vectors."""
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    #Vetores em torno de tópicos, com bastante sobreposição, como embeddings de chunks reais
+    centers = rng.standard_normal((200, dimension), dtype=np.float32)
+    vectors = centers[rng.integers(0, len(centers), total)] + 1.5 * rng.standard_normal((total, dimension), dtype=np.float32)
+    query_vectors = centers[rng.integers(0, len(centers), queries)] + 1.5 * rng.standard_normal((queries, dimension), dtype=np.float32)
+
+    store = LocalVectorStore(embedding=None)
+    start = time.perf_counter()
+    store.add_embeddings([f"chunk {i}" for i in range(total)], vectors)
+    print(f"add + train of {total} vectors: {time.perf_counter() - start:.1f}s, {store._centroids.shape[0]} lists")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        store.save(directory)
+        print(f"save: {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        store = LocalVectorStore.load(directory, embedding=None)
+        print(f"load (mmap): {1000 * (time.perf_counter() - start):.0f}ms")
+
+        exact = []
+        start = time.perf_counter()
+        for query in query_vectors:
+            exact.append(set(store.search_rows(query, k, n_probe=sys.maxsize)[0].tolist()))
+        print(f"exact: {1000 * (time.perf_counter() - start) / queries:.2f}ms/query")
+
+        for n_probe in [1, 4, 8, 16, 32, 64]:
+            found = 0
+            start = time.perf_counter()
+            for query, expected in zip(query_vectors, exact):
+                found += len(expected & set(store.search_rows(query, k, n_probe=n_probe)[0].tolist()))
+            elapsed = (time.perf_counter() - start) / queries
+            print(f"ivf n_probe={n_probe}: {1000 * elapsed:.2f}ms/query, recall@{k} {found / (k * queries):.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,86 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from retrieval.local_vector_store import LocalVectorStore
+
+
+class TestLocalVectorStore(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.standard_normal((20, 16))
+        self.vectors = centers[rng.integers(0, 20, 2000)] + 0.3 * rng.standard_normal((2000, 16))
+        self.texts = [f"chunk {i}" for i in range(2000)]
+        self.ids = [f"id{i}" for i in range(2000)]
+
+    def test_ivf_igual_a_busca_exata(self):
+        store = LocalVectorStore(embedding=None, n_probe=4, ivf_min_rows=500)
+        store.add_embeddings(self.texts, self.vectors, ids=self.ids)
+        self.assertTrue(store.is_trained)
+
+        query = self.vectors[7]
+        exact_rows, _ = store.search_rows(query, 5, n_probe=10**9)
+        ivf_rows, ivf_scores = store.search_rows(query, 5)
+
+        self.assertEqual(exact_rows[0], 7)
+        self.assertGreaterEqual(len(set(exact_rows) & set(ivf_rows)), 4)
+        self.assertTrue(np.all(np.diff(ivf_scores) <= 0))
+
+    def test_delete_e_upsert(self):
+        store = LocalVectorStore(embedding=None, ivf_min_rows=500)
+        store.add_embeddings(self.texts, self.vectors, ids=self.ids)
+
+        store.delete(["id7"])
+        docs = [doc for doc, _ in store.similarity_search_by_vector_with_score(self.vectors[7], k=3)]
+        self.assertNotIn("chunk 7", [doc.page_content for doc in docs])
+
+        store.add_embeddings(["chunk 8 novo"], [self.vectors[8]], ids=["id8"])
+        docs = store.similarity_search_by_vector(self.vectors[8], k=2)
+        self.assertEqual(docs[0].page_content, "chunk 8 novo")
+        self.assertEqual(len(store), 1999)
+
+    def test_adicoes_em_lotes_pequenos(self):
+        store = LocalVectorStore(embedding=None, ivf_min_rows=500)
+        store.add_embeddings(self.texts[:600], self.vectors[:600], ids=self.ids[:600])
+        self.assertTrue(store.is_trained)
+        for start in range(600, 2000, 100):
+            store.add_embeddings(self.texts[start:start + 100], self.vectors[start:start + 100], ids=self.ids[start:start + 100])
+        #Os lotes só são concatenados na busca
+        self.assertEqual(store._extra.shape[0], 600)
+
+        exact_rows, _ = store.search_rows(self.vectors[1500], 1, n_probe=10**9)
+        self.assertEqual(exact_rows.tolist(), [1500])
+        self.assertEqual((store._extra.shape[0], store._deleted.shape[0], store._assignments.shape[0]), (2000, 2000, 2000))
+        self.assertEqual(store.similarity_search_by_vector(self.vectors[1999], k=1)[0].page_content, "chunk 1999")
+
+        #Upsert de um id que ainda está num lote pendente
+        store.add_embeddings(["chunk 1950"], [self.vectors[1950]], ids=["id1950"])
+        store.add_embeddings(["chunk 1950 novo"], [self.vectors[1950]], ids=["id1950"])
+        self.assertEqual(store.similarity_search_by_vector(self.vectors[1950], k=1)[0].page_content, "chunk 1950 novo")
+        self.assertEqual(len(store), 2000)
+
+    def test_save_load(self):
+        store = LocalVectorStore(embedding=None, ivf_min_rows=500)
+        store.add_embeddings(self.texts, self.vectors, [{"page_number": i} for i in range(2000)], ids=self.ids)
+        store.delete(["id0"])
+
+        with tempfile.TemporaryDirectory() as directory:
+            store.save(directory)
+            loaded = LocalVectorStore.load(directory, embedding=None)
+
+            self.assertEqual(len(loaded), 1999)
+            self.assertTrue(loaded.is_trained)
+            doc, score = loaded.similarity_search_by_vector_with_score(self.vectors[42], k=1)[0]
+            self.assertEqual(doc.page_content, "chunk 42")
+            self.assertEqual(doc.metadata, {"page_number": 42})
+            self.assertAlmostEqual(score, 1.0, places=5)
+
+            #Adições depois do load ficam em memória, junto da matriz memory-mapped
+            loaded.add_embeddings(["novo"], [self.vectors[0]], ids=["id0"])
+            self.assertEqual(loaded.similarity_search_by_vector(self.vectors[0], k=1)[0].page_content, "novo")
+
+
+if __name__ == '__main__':
+    unittest.main()
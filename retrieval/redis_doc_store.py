@@ -1,9 +1,21 @@
-from typing import Any, Iterator, List, Optional, Sequence, Tuple, cast
+import logging
+import time
+from typing import Any, Iterator, List, Optional, Sequence, Tuple, TypeVar
 
 from langchain.schema import BaseStore
 from langchain.utilities.redis import get_client
 from langchain.schema import Document
 
+from .doc_cache import DocumentLRUCache
+from .doc_codecs import DocumentCodec, JSONDocumentCodec
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+#COUNT padrão do SCAN, bem maior que o default do Redis (10), para reduzir round-trips em namespaces grandes
+DEFAULT_SCAN_COUNT = 1000
+
 class RedisJSONStore(BaseStore[str, Document]):
     """BaseStore implementation using RedisJSON as the underlying store.
     Overcomes limitations of RedisStore, that can only store scalar values, no Document objects.
@@ -40,6 +52,17 @@ class RedisJSONStore(BaseStore[str, Document]):
             # Iterate over keys
             for key in redis_store.yield_keys():
                 print(key)
+
+        Optionally, an in-process cache can be placed in front of mget, so hot documents
+        do not pay the network round-trip and deserialization again:
+
+        .. code-block:: python
+
+            from retrieval.doc_cache import DocumentLRUCache
+
+            redis_store = RedisJSONStore(client=client, cache=DocumentLRUCache(ttl=600))
+            redis_store.mget(["key1"])
+            print(redis_store.cache.stats())
     """
 
     def __init__(
@@ -50,6 +73,9 @@ class RedisJSONStore(BaseStore[str, Document]):
         client_kwargs: Optional[dict] = None,
         ttl: Optional[int] = None,
         namespace: Optional[str] = None,
+        cache: Optional[DocumentLRUCache] = None,
+        batch_size: Optional[int] = None,
+        codec: Optional[DocumentCodec] = None,
     ) -> None:
         """Initialize the RedisStore with a Redis connection.
 
@@ -62,6 +88,13 @@ class RedisJSONStore(BaseStore[str, Document]):
             ttl: time to expire keys in seconds if provided,
                  if None keys will never expire
             namespace: if provided, all keys will be prefixed with this namespace
+            cache: if provided, mget reads through this in-process cache,
+                   and mset/mdelete invalidate the affected keys
+            batch_size: if provided, mset and mdelete send at most this many keys per
+                        pipelined command, so large reloads do not block Redis
+                        for other clients. If None, all keys go in a single command
+            codec: serialization of the documents, see retrieval.doc_codecs.
+                   Defaults to JSONDocumentCodec (RedisJSON). Binary codecs use plain GET/SET.
         """
         try:
             from redis import Redis
@@ -95,8 +128,14 @@ class RedisJSONStore(BaseStore[str, Document]):
         if not isinstance(ttl, int) and ttl is not None:
             raise TypeError(f"Expected int or None, got {type(ttl)} instead.")
 
+        if batch_size is not None and (not isinstance(batch_size, int) or batch_size <= 0):
+            raise ValueError(f"Expected positive int or None for batch_size, got {batch_size} instead.")
+
         self.ttl = ttl
         self.namespace = namespace
+        self.cache = cache
+        self.batch_size = batch_size
+        self.codec = codec if codec is not None else JSONDocumentCodec()
 
 
     def _get_prefixed_key(self, key: str) -> str:
@@ -113,6 +152,27 @@ class RedisJSONStore(BaseStore[str, Document]):
             return f"{self.namespace}{delimiter}{key}"
         return key
 
+    def _batches(self, items: Sequence[T]) -> Iterator[Sequence[T]]:
+        """Split items in chunks of at most batch_size elements (a single chunk if batch_size is None)."""
+        if self.batch_size is None:
+            if len(items) > 0:
+                yield items
+            return
+
+        for start in range(0, len(items), self.batch_size):
+            yield items[start : start + self.batch_size]
+
+    def _log_throughput(self, operation: str, total_keys: int, total_batches: int, start: float) -> None:
+        elapsed = time.perf_counter() - start
+        keys_per_second = total_keys / elapsed if elapsed > 0 else float("inf")
+        #Só loga em nível INFO as operações em lote (cargas), para não poluir o log das operações do chat
+        level = logging.INFO if total_batches > 1 else logging.DEBUG
+        logger.log(
+            level,
+            "%s: %d keys in %d batches, %.3fs (%.0f keys/s)",
+            operation, total_keys, total_batches, elapsed, keys_per_second
+        )
+
     #COMO ERA NO REDIS STORE, APAGAR
     # def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
     #     """Get the values associated with the given keys."""
@@ -132,13 +192,37 @@ class RedisJSONStore(BaseStore[str, Document]):
             A sequence of optional values associated with the keys.
             If a key is not found, the corresponding value will be None.
         """
-        json_records = self.client.json().mget(keys=[self._get_prefixed_key(key) for key in keys], path=".")
+        if self.cache is None:
+            return self._mget_from_redis(keys)
+
+        result = self.cache.get_many(keys)
+
+        missing_keys = [key for key, doc in zip(keys, result) if doc is None]
+        if len(missing_keys) == 0:
+            return result
+
+        #Um mset/mdelete durante a busca invalida a chave: o valor buscado, possivelmente antigo, não entra no cache
+        generation = self.cache.begin_fetch(missing_keys)
+        fetched_pairs = []
+        try:
+            fetched = dict(zip(missing_keys, self._mget_from_redis(missing_keys)))
+            fetched_pairs = [(key, doc) for key, doc in fetched.items() if doc is not None]
+        finally:
+            self.cache.end_fetch(generation, missing_keys, fetched_pairs)
 
-        document_list = [self.__dict_to_document(json_record) for json_record in json_records]
+        return [doc if doc is not None else fetched[key] for key, doc in zip(keys, result)]
 
-        result = [doc for doc in document_list]
+    def _mget_from_redis(self, keys: Sequence[str]) -> List[Optional[Document]]:
+        prefixed_keys = [self._get_prefixed_key(key) for key in keys]
 
-        return result
+        if self.codec.uses_redis_json:
+            records = self.client.json().mget(keys=prefixed_keys, path=".")
+        else:
+            records = self.client.mget(prefixed_keys)
+
+        #Chaves inexistentes retornam None
+        decode = self.codec.decode
+        return [decode(record) if record is not None else None for record in records]
 
  #COMO ERA NO REDIS STORE, APAGAR
     #  def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
@@ -149,14 +233,6 @@ class RedisJSONStore(BaseStore[str, Document]):
     #         pipe.set(self._get_prefixed_key(key), value, ex=self.ttl)
     #     pipe.execute()
 
-    #Serialização de Document de e para json
-    #------------------------------------------------
-    def __document_to_dict(self, document: Document) -> dict:
-        return {"page_content": document.page_content, "metadata": document.metadata}
-    
-    def __dict_to_document(self, dict: dict) -> Document:
-        return Document(page_content=dict['page_content'], metadata=dict['metadata'])
-    
     #FEITO BASEADO NO INMEMORY STORE
     def mset(self, key_value_pairs: Sequence[Tuple[str, Document]]) -> None:
         """Set the values for the given keys.
@@ -167,12 +243,32 @@ class RedisJSONStore(BaseStore[str, Document]):
         Returns:
             None
         """
-        #Gera uma lista de tuples contendo: chave, jsonpath (que é . para representar o objeto inteiro), e um dictionary com as propriedades do Document, que representa o objeto json em si
-        json_tuple_list = [
-            (self._get_prefixed_key(key), ".", self.__document_to_dict(doc)) for key, doc in key_value_pairs
-        ]
+        encode = self.codec.encode
+        #Lista de tuples contendo a chave com namespace e o valor serializado pelo codec
+        encoded_pairs = [(self._get_prefixed_key(key), encode(doc)) for key, doc in key_value_pairs]
+
+        start = time.perf_counter()
+        total_batches = 0
+        for batch in self._batches(encoded_pairs):
+            #Cada lote vai em um pipeline próprio, sem transação, liberando o Redis para outros clientes entre lotes.
+            #Comandos JSON por pipe.json(), como no AsyncRedisJSONStore: o client.json().pipeline() não funciona no redis.asyncio
+            pipe = self.client.pipeline(transaction=False)
+            if self.codec.uses_redis_json:
+                #jsonpath . representa o objeto inteiro
+                pipe.json().mset([(prefixed_key, ".", value) for prefixed_key, value in batch])
+                if self.ttl is not None:
+                    for prefixed_key, _ in batch:
+                        pipe.expire(prefixed_key, self.ttl)
+            else:
+                for prefixed_key, value in batch:
+                    pipe.set(prefixed_key, value, ex=self.ttl)
+            pipe.execute()
+            total_batches += 1
 
-        self.client.json().mset(json_tuple_list)
+        self._log_throughput("mset", len(encoded_pairs), total_batches, start)
+
+        if self.cache is not None:
+            self.cache.invalidate([key for key, _ in key_value_pairs])
         
 
 
@@ -180,20 +276,70 @@ class RedisJSONStore(BaseStore[str, Document]):
     def mdelete(self, keys: Sequence[str]) -> None:
         """Delete the given keys."""
         _keys = [self._get_prefixed_key(key) for key in keys]
-        self.client.delete(*_keys)
 
+        start = time.perf_counter()
+        total_batches = 0
+        for batch in self._batches(_keys):
+            #UNLINK libera a memória em background no servidor, sem bloquear como o DEL em lotes grandes
+            self.client.unlink(*batch)
+            total_batches += 1
+
+        self._log_throughput("mdelete", len(_keys), total_batches, start)
+
+        if self.cache is not None:
+            self.cache.invalidate(keys)
+
+
+    def yield_keys(self, *, prefix: Optional[str] = None, scan_count: int = DEFAULT_SCAN_COUNT) -> Iterator[str]:
+        """Yield keys in the store.
+
+        Args:
+            prefix: if provided, only keys starting with this prefix are yielded
+            scan_count: COUNT hint passed to each SCAN call, bigger values mean fewer round-trips
+        """
+        for key_batch in self.yield_key_batches(prefix=prefix, scan_count=scan_count):
+            yield from key_batch
+
+    def yield_key_batches(self, *, prefix: Optional[str] = None, scan_count: int = DEFAULT_SCAN_COUNT) -> Iterator[List[str]]:
+        """Yield keys in the store in batches, one batch per SCAN reply.
+
+        Batch sizes are approximately scan_count (Redis treats COUNT as a hint).
+        As with any SCAN, a key may be yielded more than once if the keyspace changes during iteration.
 
-    def yield_keys(self, *, prefix: Optional[str] = None) -> Iterator[str]:
-        """Yield keys in the store."""
+        Args:
+            prefix: if provided, only keys starting with this prefix are yielded
+            scan_count: COUNT hint passed to each SCAN call
+        """
         if prefix:
-            pattern = self._get_prefixed_key(prefix)
+            pattern = self._get_prefixed_key(f"{prefix}*")
         else:
             pattern = self._get_prefixed_key("*")
-        scan_iter = cast(Iterator[bytes], self.client.scan_iter(match=pattern))
-        for key in scan_iter:
-            decoded_key = key.decode("utf-8")
-            if self.namespace:
-                relative_key = decoded_key[len(self.namespace) + 1 :]
-                yield relative_key
-            else:
-                yield decoded_key
+
+        #Tamanho do prefixo "namespace:" removido de cada chave, calculado uma única vez
+        namespace_length = len(self.namespace) + 1 if self.namespace else 0
+
+        cursor = 0
+        while True:
+            cursor, raw_keys = self.client.scan(cursor=cursor, match=pattern, count=scan_count)
+            if raw_keys:
+                yield [
+                    (key.decode("utf-8") if isinstance(key, bytes) else key)[namespace_length:]
+                    for key in raw_keys
+                ]
+            if cursor == 0:
+                break
+
+    def yield_items(self, *, prefix: Optional[str] = None, scan_count: int = DEFAULT_SCAN_COUNT) -> Iterator[Tuple[str, Optional[Document]]]:
+        """Yield (key, document) pairs for the whole store in a single sweep.
+
+        Each SCAN batch is followed by one mget of the values, so a full export or
+        garbage-collection pass costs two round-trips per batch. The cache, if any, is bypassed,
+        so exports do not evict the documents hot for the chat.
+        A document may be None if its key was deleted between the SCAN and the mget.
+
+        Args:
+            prefix: if provided, only keys starting with this prefix are yielded
+            scan_count: COUNT hint passed to each SCAN call
+        """
+        for key_batch in self.yield_key_batches(prefix=prefix, scan_count=scan_count):
+            yield from zip(key_batch, self._mget_from_redis(key_batch))
@@ -0,0 +1,70 @@
+import unittest
+
+from langchain.schema import Document
+
+from retrieval.doc_cache import DocumentLRUCache
+from retrieval.doc_codecs import JSONDocumentCodec, MsgpackDocumentCodec
+from retrieval.redis_doc_store import RedisJSONStore
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+OLD = Document(page_content="Cláusula 1 - versão antiga", metadata={"page": 1})
+NEW = Document(page_content="Cláusula 1 - versão nova", metadata={"page": 1})
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis not installed")
+class TestRedisJSONStoreCache(unittest.TestCase):
+
+    def store(self):
+        return RedisJSONStore(client=fakeredis.FakeRedis(), namespace="parentdoc", cache=DocumentLRUCache(), codec=MsgpackDocumentCodec())
+
+    def test_mset_durante_busca_nao_volta_valor_antigo(self):
+        store = self.store()
+        store.mset([("k1", OLD)])
+        fetch_from_redis = store._mget_from_redis
+
+        def slow_fetch(keys):
+            #Lê o valor antigo e, antes de devolvê-lo, outro cliente grava o novo
+            docs = fetch_from_redis(keys)
+            store.mset([("k1", NEW)])
+            return docs
+
+        store._mget_from_redis = slow_fetch
+        self.assertEqual(store.mget(["k1"]), [OLD])
+        store._mget_from_redis = fetch_from_redis
+
+        self.assertEqual(store.cache.get_many(["k1"]), [None])
+        self.assertEqual(store.mget(["k1"]), [NEW])
+        self.assertEqual(store.cache.get_many(["k1"]), [NEW])
+
+    def test_falha_na_busca_encerra_a_busca(self):
+        store = self.store()
+        store.mset([("k1", OLD)])
+
+        def failed_fetch(keys):
+            raise ConnectionError("Connection reset by peer")
+
+        store._mget_from_redis = failed_fetch
+        with self.assertRaises(ConnectionError):
+            store.mget(["k1"])
+        self.assertEqual(store.cache._fetching, {})
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis not installed")
+class TestRedisJSONStoreBatches(unittest.TestCase):
+
+    def test_json_em_lotes_com_ttl(self):
+        docs = [Document(page_content=f"Cláusula {i}", metadata={"page": i}) for i in range(5)]
+        store = RedisJSONStore(client=fakeredis.FakeRedis(), namespace="parentdoc", codec=JSONDocumentCodec(), batch_size=2, ttl=60)
+        store.mset([(f"k{i}", doc) for i, doc in enumerate(docs)])
+
+        self.assertEqual(store.mget(["k4", "k0", "k2"]), [docs[4], docs[0], docs[2]])
+        self.assertEqual(store.client.json().get("parentdoc:k1", "."), {"page_content": "Cláusula 1", "metadata": {"page": 1}})
+        self.assertTrue(all(0 < store.client.ttl(f"parentdoc:k{i}") <= 60 for i in range(5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,26 +1,64 @@
 import os
-from typing import List     
+from typing import Any, List     
 
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.vectorstores.redis import Redis #VectorStore para armazenar os filhos
+from langchain.schema.vectorstore import VectorStore
 from langchain.retrievers import ParentDocumentRetriever
+from langchain.callbacks.manager import AsyncCallbackManagerForRetrieverRun
 
 from .redis_doc_store import RedisJSONStore
+from .async_redis_doc_store import AsyncRedisJSONStore
+from .doc_cache import DocumentLRUCache
+from .doc_codecs import get_codec
+from .local_vector_store import LocalVectorStore
+from config.config import CHUNK_LENGTH_UNIT
+from util import get_length_function
 
 CWD = os.getcwd()
 
 #Obrigatório no construtor do parent retriever, mas não usado no app, pois o retriever será somente leitura
-MAX_CHUNK_SIZE = 1210
-CHUNK_OVERLAP = 256
+#Medidos na mesma unidade dos parents (config.CHUNK_LENGTH_UNIT)
+if CHUNK_LENGTH_UNIT == "tokens":
+    MAX_CHUNK_SIZE = 300
+    CHUNK_OVERLAP = 64
+else:
+    MAX_CHUNK_SIZE = 1210
+    CHUNK_OVERLAP = 256
 
 REDIS_INDEX_NAME = os.getenv("REDIS_INDEX_NAME")
-REDIS_SCHEMA_PATH = os.path.join(CWD, "db_redis", "redis_schema.yaml")
+#Depois da migração para HNSW (db_redis/hnsw_migration.py), aponte para db_redis/redis_schema_hnsw.yaml
+#e use o alias como REDIS_INDEX_NAME
+REDIS_SCHEMA_PATH = os.getenv("REDIS_SCHEMA_PATH", os.path.join(CWD, "db_redis", "redis_schema.yaml"))
+
+#Onde ficam os embeddings dos filhos: "redis" (índice do REDIS_INDEX_NAME) ou "local" (LocalVectorStore em processo,
+#para deploys na borda ou bases grandes, em que a busca FLAT do Redis fica lenta)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "redis")
+LOCAL_VECTOR_STORE_PATH = os.getenv("LOCAL_VECTOR_STORE_PATH", os.path.join(CWD, "data", "local_vector_store"))
+LOCAL_VECTOR_STORE_N_PROBE = int(os.getenv("LOCAL_VECTOR_STORE_N_PROBE", 16))
 
 #Todos os parent chunks tem chaves no redis com esse prefixo
 REDIS_PARENT_KEY_PREFIX = "parentdoc"
 
+#Cache em memória dos parent documents, compartilhado por todos os retrievers do processo. Tamanho 0 desabilita.
+PARENT_DOC_CACHE_MAX_BYTES = int(os.getenv("PARENT_DOC_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+#Limita o tempo em que um documento recarregado por outro processo pode ser servido desatualizado
+PARENT_DOC_CACHE_TTL = float(os.getenv("PARENT_DOC_CACHE_TTL", 600))
+
+_parent_doc_cache: DocumentLRUCache = None
+
+#Serialização dos parent documents: json (RedisJSON), msgpack ou zstd (ver config/docstore_requirements.txt)
+#Tem que ser o mesmo codec usado na carga do namespace
+PARENT_DOC_CODEC = os.getenv("PARENT_DOC_CODEC", "json")
+
+#Nas cargas, grava/apaga os parent documents em lotes, para não bloquear o Redis compartilhado com o chat
+PARENT_DOC_WRITE_BATCH_SIZE = int(os.getenv("PARENT_DOC_WRITE_BATCH_SIZE", 500))
+
+#Máximo de conexões do pool compartilhado pelos stores assíncronos de cada event loop
+ASYNC_REDIS_MAX_CONNECTIONS = int(os.getenv("ASYNC_REDIS_MAX_CONNECTIONS", 50))
+
 
 def get_redis_url():
     host = os.getenv("REDIS_HOST")
@@ -40,24 +78,89 @@ def get_redis_store(embeddings_model:OpenAIEmbeddings) -> Redis:
     return redis_vector_store
 
 
-def get_redis_parent_retriever() -> ParentDocumentRetriever:
+def get_local_vector_store(embeddings_model:OpenAIEmbeddings) -> LocalVectorStore:
+    #Se ainda não existe, começa vazio no mesmo caminho; a carga grava com save()
+    if not os.path.exists(LOCAL_VECTOR_STORE_PATH):
+        return LocalVectorStore(embeddings_model, path=LOCAL_VECTOR_STORE_PATH, n_probe=LOCAL_VECTOR_STORE_N_PROBE)
+    return LocalVectorStore.load(LOCAL_VECTOR_STORE_PATH, embeddings_model, n_probe=LOCAL_VECTOR_STORE_N_PROBE)
+
+
+def get_vector_store(embeddings_model:OpenAIEmbeddings) -> VectorStore:
+    if VECTOR_STORE_BACKEND == "local":
+        return get_local_vector_store(embeddings_model)
+    if VECTOR_STORE_BACKEND == "redis":
+        return get_redis_store(embeddings_model)
+    raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {VECTOR_STORE_BACKEND}. Use 'redis' or 'local'")
+
+
+def get_parent_doc_cache() -> DocumentLRUCache:
+    global _parent_doc_cache
+    if PARENT_DOC_CACHE_MAX_BYTES <= 0:
+        return None
+
+    if _parent_doc_cache is None:
+        _parent_doc_cache = DocumentLRUCache(max_bytes=PARENT_DOC_CACHE_MAX_BYTES, ttl=PARENT_DOC_CACHE_TTL or None)
+    return _parent_doc_cache
+
+
+def get_async_redis_doc_store() -> AsyncRedisJSONStore:
+    #Mesma configuração do store síncrono do retriever, inclusive o cache, para buscar os parents sem bloquear a thread
+    return AsyncRedisJSONStore(
+        redis_url=get_redis_url(),
+        max_connections=ASYNC_REDIS_MAX_CONNECTIONS,
+        namespace=REDIS_PARENT_KEY_PREFIX,
+        cache=get_parent_doc_cache(),
+        batch_size=PARENT_DOC_WRITE_BATCH_SIZE,
+        codec=get_codec(PARENT_DOC_CODEC)
+    )
+
+
+def get_child_splitter() -> RecursiveCharacterTextSplitter:
     #Este será usado para quebrar cada parent conforme o tamanho máximo recomendado de tamanho de chunk para geração de embedding
-    child_splitter = RecursiveCharacterTextSplitter(
+    return RecursiveCharacterTextSplitter(
         chunk_size = MAX_CHUNK_SIZE,
         chunk_overlap  = CHUNK_OVERLAP,
+        length_function = get_length_function(CHUNK_LENGTH_UNIT),
         separators=["\n\n", "\n", "(?<=\. )", " ", ""] #Prioriza ponto final antes de espaço.
     )
 
+
+def get_redis_doc_store() -> RedisJSONStore:
+    #O namespace é o prefixo de todas as chaves de parent document
+    return RedisJSONStore(redis_url=get_redis_url(), namespace=REDIS_PARENT_KEY_PREFIX, cache=get_parent_doc_cache(), batch_size=PARENT_DOC_WRITE_BATCH_SIZE, codec=get_codec(PARENT_DOC_CODEC))
+
+
+class AsyncParentDocumentRetriever(ParentDocumentRetriever):
+    """ParentDocumentRetriever whose async path fetches the parents with an AsyncRedisJSONStore.
+
+    The chains call aget_relevant_documents from acall/ainvoke; without this, the parents would be read with the
+    synchronous docstore in a thread of the executor. The synchronous path is unchanged.
+    """
+
+    async_docstore: Any
+    """AsyncRedisJSONStore over the same keys as docstore"""
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        sub_docs = await self.vectorstore.asimilarity_search(query, **self.search_kwargs)
+        #Mantém a ordem dos filhos, como o MultiVectorRetriever
+        ids = list(dict.fromkeys(doc.metadata[self.id_key] for doc in sub_docs))
+        docs = await self.async_docstore.amget(ids)
+        return [doc for doc in docs if doc is not None]
+
+
+def get_redis_parent_retriever() -> ParentDocumentRetriever:
+    child_splitter = get_child_splitter()
+
     embeddings_model = OpenAIEmbeddings(model="text-embedding-ada-002")
 
-    redis_vector_store:Redis = get_redis_store(embeddings_model)
+    vector_store:VectorStore = get_vector_store(embeddings_model)
 
-    #O namespace é o prefixo de todas as chaves de parent document
-    redis_doc_store:RedisJSONStore = RedisJSONStore(redis_url=get_redis_url(), namespace=REDIS_PARENT_KEY_PREFIX)
+    redis_doc_store:RedisJSONStore = get_redis_doc_store()
 
-    retriever = ParentDocumentRetriever(
-        vectorstore=redis_vector_store,
+    retriever = AsyncParentDocumentRetriever(
+        vectorstore=vector_store,
         docstore=redis_doc_store,
+        async_docstore=get_async_redis_doc_store(),
         child_splitter=child_splitter,
         search_kwargs={"k": int(os.getenv("TOP_K"))}
     )
@@ -1,23 +1,62 @@
 from langchain.document_loaders import UnstructuredPDFLoader
 from langchain.schema import Document
 
-import pdfbox
-
-from typing import List, Text
+from typing import Iterator, List, Text
+from html.parser import HTMLParser
+import codecs
 import enum
+import io
 import os
 import requests
 
+TIKA_SERVER = 'http://localhost:9998/tika'
+
 class LoadMode(enum.Enum):
     SINGLE = "single"
     ELEMENTS = "elements"
+    PAGED = "paged"
 
 def load_pdf_unstructured(path, mode=LoadMode.SINGLE) -> List[Document]:
     loader = UnstructuredPDFLoader(file_path=path, mode=mode.value)
     return loader.load()
 
 
+def lazy_load_pdf_unstructured(path, mode=LoadMode.PAGED) -> Iterator[Document]:
+    """
+    Particiona o PDF uma página por vez, e devolve os elementos (ELEMENTS) ou o texto de cada página (PAGED) à medida
+    que são extraídos. O partition_pdf do unstructured processa o arquivo inteiro de uma vez, então cada página
+    é recortada num PDF separado em memória.
+    SINGLE (um documento com o arquivo todo) não faz sentido aqui, use load_pdf_unstructured.
+    """
+    if mode == LoadMode.SINGLE:
+        raise ValueError("SINGLE mode loads the whole file at once, use load_pdf_unstructured")
+
+    import pypdf
+    from unstructured.partition.pdf import partition_pdf
+
+    pdf_filename = os.path.basename(path)
+    with open(path, 'rb') as f:
+        reader = pypdf.PdfReader(f)
+        for page_number, page in enumerate(reader.pages, start=1):
+            writer = pypdf.PdfWriter()
+            writer.add_page(page)
+            page_pdf = io.BytesIO()
+            writer.write(page_pdf)
+            page_pdf.seek(0)
+
+            elements = partition_pdf(file=page_pdf)
+            if mode == LoadMode.ELEMENTS:
+                for element in elements:
+                    metadata = {"source": pdf_filename, "page_number": page_number, "category": element.category}
+                    yield Document(page_content=str(element), metadata=metadata)
+            else:
+                text = "\n\n".join(str(element) for element in elements)
+                yield Document(page_content=text, metadata={"source": pdf_filename, "page_number": page_number})
+
+
 def load_pdf_apache(pdf_path:Text) -> Document:
+    #Import tardio: o pdfbox só é necessário para este loader
+    import pdfbox
     p = pdfbox.PDFBox()
 
     #set output path to same folder as the file in path
@@ -33,8 +72,7 @@ def load_pdf_apache(pdf_path:Text) -> Document:
     return Document(page_content=text, metadata={"source": pdf_filename})
 
 
-def load_tika(pdf_path:Text) -> Document:
-    tika_server = 'http://localhost:9998/tika'
+def load_tika(pdf_path:Text, tika_server:Text = TIKA_SERVER) -> Document:
     headers = {
         "X-Tika-PDFextractInlineImages": "true",
         "X-Tika-OCRLanguage": "por",
@@ -49,6 +87,74 @@ def load_tika(pdf_path:Text) -> Document:
     return Document(page_content=text, metadata={"source": pdf_filename})
 
 
+class TikaPageParser(HTMLParser):
+    """
+    Recebe o XHTML do Tika em pedaços (feed) e acumula o texto de cada <div class="page"> já completa em pages.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pages: List[str] = []
+        self._current: List[str] = None
+        self._div_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "div":
+            if self._current is None and ("class", "page") in attrs:
+                self._current = []
+                self._div_depth = 0
+            elif self._current is not None:
+                self._div_depth += 1
+        elif self._current is not None and tag in ("p", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6"):
+            self._current.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag == "div" and self._current is not None:
+            if self._div_depth == 0:
+                self.pages.append("".join(self._current))
+                self._current = None
+            else:
+                self._div_depth -= 1
+
+    def handle_data(self, data):
+        if self._current is not None:
+            self._current.append(data)
+
+
+def stream_tika(pdf_path:Text, chunk_size:int = 64 * 1024, tika_server:Text = TIKA_SERVER) -> Iterator[Document]:
+    """
+    Mesmo processamento do load_tika, mas pede ao Tika a saída em XHTML, que separa as páginas, e lê a resposta
+    em streaming: cada página é devolvida assim que chega, sem montar o texto do documento inteiro.
+    """
+    headers = {
+        "X-Tika-PDFextractInlineImages": "true",
+        "X-Tika-OCRLanguage": "por",
+        "Accept": "text/html",
+        "Accept-Charset": "UTF-8"
+    }
+
+    pdf_filename = os.path.basename(pdf_path)
+    parser = TikaPageParser()
+    decoder = codecs.getincrementaldecoder('utf-8')('ignore')
+    page_number = 0
+
+    with open(pdf_path, 'rb') as file:
+        with requests.put(tika_server, headers=headers, data=file, stream=True) as response:
+            response.raise_for_status()
+            for content in response.iter_content(chunk_size=chunk_size):
+                parser.feed(decoder.decode(content))
+                for text in parser.pages:
+                    page_number += 1
+                    yield Document(page_content=text, metadata={"source": pdf_filename, "page": page_number})
+                parser.pages.clear()
+
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    for text in parser.pages:
+        page_number += 1
+        yield Document(page_content=text, metadata={"source": pdf_filename, "page": page_number})
+
+
 def write_docs_to_txt(out_file_path:Text, documents:List[Document]):
     with open(out_file_path, "w") as f:
         f.write("\n\n=========================================\n\n"
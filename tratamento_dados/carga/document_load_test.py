@@ -0,0 +1,115 @@
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tratamento_dados.carga.document_load import LoadMode, TikaPageParser, load_pdf_unstructured, lazy_load_pdf_unstructured, stream_tika
+
+#Saída XHTML do Tika para um PDF de três páginas, com div aninhada, entidades e acentos
+TIKA_XHTML = (
+    '<html xmlns="http://www.w3.org/1999/xhtml"><head><meta name="Content-Type" content="application/pdf"/>'
+    '<title>contrato</title></head><body>'
+    '<div class="page"><p>CLÁUSULA 1ª - Objeto</p><p>O consorciado &amp; a administradora.</p></div>'
+    '<div class="page"><p>CLÁUSULA 2ª - Prazo</p><div class="annotation"><p>nota de rodapé</p></div><p>Fim da página.</p></div>'
+    '<div class="page"><p>CLÁUSULA 3ª - Foro</p></div>'
+    '</body></html>'
+)
+EXPECTED_PAGES = [
+    "\nCLÁUSULA 1ª - Objeto\nO consorciado & a administradora.",
+    "\nCLÁUSULA 2ª - Prazo\nnota de rodapé\nFim da página.",
+    "\nCLÁUSULA 3ª - Foro",
+]
+
+
+def parse_at_once(xhtml):
+    parser = TikaPageParser()
+    parser.feed(xhtml)
+    parser.close()
+    return parser.pages
+
+
+class TikaStub(BaseHTTPRequestHandler):
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = TIKA_XHTML.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTikaPageParser(unittest.TestCase):
+
+    def test_pedacos_com_tags_divididas(self):
+        self.assertEqual(parse_at_once(TIKA_XHTML), EXPECTED_PAGES)
+
+        #Pedaços de todos os tamanhos pequenos: tags, atributos e entidades divididos entre dois feeds
+        for size in (1, 2, 3, 7, 16):
+            parser = TikaPageParser()
+            pages = []
+            for start in range(0, len(TIKA_XHTML), size):
+                parser.feed(TIKA_XHTML[start:start + size])
+                pages.extend(parser.pages)
+                parser.pages.clear()
+            parser.close()
+            pages.extend(parser.pages)
+            self.assertEqual(pages, EXPECTED_PAGES, f"chunks of {size} chars")
+
+
+class TestStreamTika(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), TikaStub)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "contrato.pdf")
+        with open(self.path, "wb") as f:
+            f.write(b"%PDF-1.4 conteudo ignorado pelo stub")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def test_mesmas_paginas_da_leitura_completa(self):
+        tika_server = f"http://127.0.0.1:{self.server.server_address[1]}/tika"
+        #Blocos de 5 bytes: tags e caracteres de vários bytes (Á, ª, é) divididos entre blocos
+        pages = list(stream_tika(self.path, chunk_size=5, tika_server=tika_server))
+
+        self.assertEqual([page.page_content for page in pages], parse_at_once(TIKA_XHTML))
+        self.assertEqual([page.metadata for page in pages], [{"source": "contrato.pdf", "page": number} for number in (1, 2, 3)])
+
+
+class TestLazyLoadPdfUnstructured(unittest.TestCase):
+
+    def test_mesmas_paginas_do_loader_completo(self):
+        try:
+            import pypdf
+            import unstructured.partition.pdf
+        except ImportError as e:
+            raise unittest.SkipTest(f"unstructured PDF support unavailable: {e}")
+        from tratamento_dados.document_loaders_test import make_pdf
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "contrato.pdf")
+            with open(path, "wb") as f:
+                f.write(make_pdf(["CLAUSULA 1 - Objeto", "CLAUSULA 2 - Prazo", "CLAUSULA 3 - Foro"]))
+
+            lazy = list(lazy_load_pdf_unstructured(path))
+            eager = load_pdf_unstructured(path, mode=LoadMode.PAGED)
+
+        self.assertEqual([page.page_content.strip() for page in lazy], [page.page_content.strip() for page in eager])
+        self.assertEqual([page.metadata["page_number"] for page in lazy], [page.metadata["page_number"] for page in eager])
+
+        with self.assertRaises(ValueError):
+            next(lazy_load_pdf_unstructured(path, mode=LoadMode.SINGLE))
+
+
+if __name__ == '__main__':
+    unittest.main()
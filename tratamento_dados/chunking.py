@@ -1,14 +1,73 @@
+"""
+Quebra das páginas em chunks (parents), com o tamanho medido em caracteres ou em tokens (config.CHUNK_LENGTH_UNIT).
+
+Benchmark (chars x tokens, com e sem a memória de tamanhos do util.token_length; precisa do encoding do tiktoken):
+    python -m tratamento_dados.chunking --pages 500
+"""
+import argparse
+import time
+from typing import Iterable, Iterator
 from langchain.schema import Document
 #Will split on \n \\n and whitespace
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from config.config import CHUNK_SIZE, CHUNK_OVERLAP
+from config.config import CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_LENGTH_UNIT
+from util import get_length_function
 
-def chunk_data(data: list[Document], chunk_size:int = CHUNK_SIZE, overlap:int = CHUNK_OVERLAP) -> list[Document]:
-    text_splitter = RecursiveCharacterTextSplitter(
+def get_text_splitter(chunk_size:int = CHUNK_SIZE, overlap:int = CHUNK_OVERLAP, length_unit:str = CHUNK_LENGTH_UNIT) -> RecursiveCharacterTextSplitter:
+    #chunk_size e overlap são medidos na length_unit: "chars" ou "tokens"
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
-        chunk_overlap=overlap
+        chunk_overlap=overlap,
+        length_function=get_length_function(length_unit)
     )
+
+def chunk_data(data: list[Document], chunk_size:int = CHUNK_SIZE, overlap:int = CHUNK_OVERLAP, length_unit:str = CHUNK_LENGTH_UNIT, max_workers:int = 1) -> list[Document]:
+    text_splitter = get_text_splitter(chunk_size, overlap, length_unit)
+    if max_workers != 1:
+        #Lotes grandes de documentos: quebra num pool de processos (None usa todos os núcleos), na mesma ordem
+        from tratamento_dados.chunking_engine import ChunkingEngine
+        return ChunkingEngine(text_splitter, max_workers=max_workers).split_documents(data)
     #Split documents should be used when the document has already been splitted into pages
     #Use create_documents instead of split_documents, otherwise
     chunks = text_splitter.split_documents(data)
-    return chunks
\ No newline at end of file
+    return chunks
+
+
+def lazy_chunk_data(data: Iterable[Document], chunk_size:int = CHUNK_SIZE, overlap:int = CHUNK_OVERLAP, length_unit:str = CHUNK_LENGTH_UNIT) -> Iterator[Document]:
+    #Mesmo resultado do chunk_data (cada página é quebrada independentemente), mas consumindo as páginas
+    #à medida que um loader lazy as produz: os primeiros chunks saem antes do documento ser lido inteiro
+    text_splitter = get_text_splitter(chunk_size, overlap, length_unit)
+    for page in data:
+        yield from text_splitter.split_documents([page])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500, help="synthetic contract pages")
+    args = parser.parse_args()
+
+    from util import get_encoding
+
+    paragraph = "O consorciado obriga-se a pagar as contribuições mensais até a data de vencimento, sob pena de multa.\n\n"
+    pages = [Document(page_content=f"CLÁUSULA {number} - " + paragraph * (20 + number % 40), metadata={"page": number}) for number in range(args.pages)]
+    encoding = get_encoding()
+
+    #Mesmos tamanhos da config para cada unidade (1024/256 caracteres, 256/64 tokens)
+    runs = [
+        ("chars", dict(chunk_size=1024, overlap=256, length_unit="chars")),
+        ("tokens", dict(chunk_size=256, overlap=64, length_unit="tokens")),
+    ]
+    for name, kwargs in runs:
+        start = time.perf_counter()
+        chunks = chunk_data(pages, **kwargs)
+        print(f"{name}: {len(chunks)} chunks in {time.perf_counter() - start:.2f}s")
+
+    #Referência: tokens contados a cada chamada, sem memória
+    splitter = RecursiveCharacterTextSplitter(chunk_size=256, chunk_overlap=64, length_function=lambda text: len(encoding.encode_ordinary(text)))
+    start = time.perf_counter()
+    chunks = splitter.split_documents(pages)
+    print(f"tokens without memo: {len(chunks)} chunks in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
-from typing import List
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+from functools import lru_cache
 from langchain.schema import Document
+from langchain.text_splitter import TextSplitter
+import bisect
 import re
-from io import StringIO
 import os
+import sys
+import time
 
 
 """
@@ -12,114 +16,309 @@ Visa contornar limitações dos text splitter padrão do langchain.
 Útil para dados de documentos semi-estruturados, que permite agrupar seções semanticamente relacionadas, como cláusulas de contratos,
 ou perguntas-respostas de um FAQ.
 
-TODO - TRANSFORMAR EM CLASSE que herde do TextSplitter básico do LangChain
+O RegexContextTextSplitter é um TextSplitter do LangChain, e pode ser usado onde os outros splitters são usados.
+
+Benchmark contra o RecursiveCharacterTextSplitter:
+    python tratamento_dados/chunking/regex_context_text_splitter.py
 """
 
-def split_text_including_separator(original_doc:Document, regex:str, prefixo_as_contexto:bool = False, max_chunk_size:int = None, metadata_to_content:List[str] = None) -> List[Document]:
+#Raiz do projeto, de onde vêm config e util. tratamento_dados/chunking.py esconde este diretório, então o módulo é
+#importado pelo diretório (tratamento_dados/chunking no sys.path) ou roda como script, sem a raiz no path
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#Trecho final do buffer em que um separador ainda pode ser completado pelo texto da próxima página
+STREAM_MARGIN = 256
+#Tamanho a partir do qual o trecho anterior ao primeiro separador deixa de ser acumulado (quando não é contexto)
+MAX_PREAMBLE_SIZE = 100_000
+
+
+def iter_separator_segments(pages:Iterable[Document], pattern:re.Pattern, hold_preamble:bool = True, margin:int = STREAM_MARGIN, max_preamble:int = MAX_PREAMBLE_SIZE, page_separator:str = "\n") -> Iterator[Tuple[bool, str, dict]]:
     """
-    Splits a string by a regex, and includes the regex match at the beginning of the following split.
+    Percorre as páginas como um único texto (unidas por page_separator) e produz (is_preamble, texto, metadata):
+    primeiro o trecho anterior ao primeiro separador, depois um segmento por separador (o separador + o texto até o próximo).
+    O metadata é o da página onde o segmento começa.
+
+    Só o texto ainda não emitido fica em memória, e cada trecho é buscado uma única vez (mais a margem), então o custo
+    é linear mesmo com segmentos muito longos. Com hold_preamble=False, o trecho anterior ao primeiro separador
+    que passar de max_preamble caracteres é emitido em pedaços (em quebras de linha), para não acumular o documento
+    inteiro quando o separador nunca aparece.
+    """
+    held: List[str] = []  #Texto do segmento corrente que já saiu do buffer (termina em buffer_start)
+    held_length = 0
+    buffer = ""  #Só o fim do texto lido: o que ainda pode conter o início de um separador, mais a margem de contexto
+    buffer_start = 0  #Posição global de buffer[0]
+    segment_start = 0  #Posição global do início do segmento corrente
+    search_from = 0  #Posição no buffer em que a próxima busca começa: o texto anterior nunca é buscado de novo
+    total = 0
+    page_offsets: List[int] = []
+    page_metadatas: List[dict] = []
+    in_preamble = True
+
+    def metadata_at(position):
+        return page_metadatas[max(0, bisect.bisect_right(page_offsets, position) - 1)]
+
+    def take_segment(end):
+        #Texto do segmento corrente até buffer[end]; os pedaços guardados só são unidos aqui, uma vez
+        nonlocal held, held_length
+        segment_in_buffer = max(0, segment_start - buffer_start)
+        text = "".join(held) + buffer[segment_in_buffer:end] if held else buffer[segment_in_buffer:end]
+        held = []
+        held_length = 0
+        return text
+
+    def drain(final):
+        nonlocal held_length, buffer, buffer_start, segment_start, search_from, in_preamble
+        limit = len(buffer) if final else len(buffer) - margin
+        resume = None
+        for match in pattern.finditer(buffer, search_from):
+            #Só é aceito o separador que termina antes da margem, pois perto do fim do buffer a próxima página ainda pode completá-lo
+            if match.end() > limit:
+                resume = match.start()
+                break
+            if match.start() == match.end():
+                continue
+            if held or buffer_start + match.start() > segment_start or not in_preamble:
+                yield in_preamble, take_segment(match.start()), metadata_at(segment_start)
+            segment_start = buffer_start + match.start()
+            in_preamble = False
+            search_from = match.end()
+
+        if final:
+            text = take_segment(len(buffer))
+            if text:
+                yield in_preamble, text, metadata_at(segment_start)
+            return
+
+        #Um separador só pode começar depois de limit (ou no que foi recusado por não caber na margem)
+        if resume is None:
+            resume = max(search_from, limit)
+
+        segment_in_buffer = max(0, segment_start - buffer_start)
+        if in_preamble and not hold_preamble and held_length + resume - segment_in_buffer > max_preamble:
+            #Emite, até a última quebra de linha, o que com certeza é anterior ao primeiro separador
+            newline = buffer.rfind("\n", segment_in_buffer, resume)
+            emit_until = newline + 1 if newline >= 0 else resume
+            if held or emit_until > segment_in_buffer:
+                yield True, take_segment(emit_until), metadata_at(segment_start)
+                segment_start = buffer_start + emit_until
+                segment_in_buffer = emit_until
+
+        #Move para held o texto do segmento que não será mais buscado, mantendo margin caracteres de contexto
+        cut = max(0, resume - margin)
+        if cut > segment_in_buffer:
+            held.append(buffer[segment_in_buffer:cut])
+            held_length += cut - segment_in_buffer
+        buffer = buffer[cut:]
+        buffer_start += cut
+        search_from = resume - cut
+
+    for page in pages:
+        #As páginas são unidas pelo page_separator, que fica no fim da página anterior
+        text = page.page_content if not page_metadatas else page_separator + page.page_content
+        page_offsets.append(total if not page_metadatas else total + len(page_separator))
+        page_metadatas.append(page.metadata)
+        buffer += text
+        total += len(text)
+        yield from drain(False)
+
+        #Descarta as páginas que já ficaram inteiras para trás
+        first_needed = max(0, bisect.bisect_right(page_offsets, segment_start) - 1)
+        del page_offsets[:first_needed]
+        del page_metadatas[:first_needed]
+
+    if page_metadatas:
+        yield from drain(True)
+
+
+#Bloco de leitura de arquivos texto no lazy_split_file
+FILE_BLOCK_SIZE = 1024 * 1024
+
+
+@lru_cache(maxsize=128)
+def compile_separator(regex:str) -> re.Pattern:
+    #Os splitters são criados a cada documento; a expressão de cada separador é compilada uma única vez
+    return re.compile(regex, re.IGNORECASE | re.MULTILINE)
+
+
+class RegexContextTextSplitter(TextSplitter):
     """
-    result:List[Document] = []
-    last_split_end = None
+    Splits a text by a regex, and includes the regex match at the beginning of the following split.
 
-    current_chunk = StringIO() 
-    current_match = None   
-    context_prefix = ""
+    The text before the first match is its own chunk or, with prefixo_as_contexto, the context prepended to all
+    the others. With max_chunk_size, consecutive splits are merged while they fit; without it, each split is a chunk.
+    The metadata keys in metadata_to_content are written in the context of each chunk.
 
-    for match in re.finditer(regex, original_doc.page_content, re.IGNORECASE | re.MULTILINE):
+    Examples:
+        splitter = RegexContextTextSplitter(r"^CL[AÁ]USULA\\s+\\w+", prefixo_as_contexto=True, max_chunk_size=2000)
+        chunks = splitter.split_documents(pages)
+        for chunk in splitter.lazy_split_file("contratos.txt"):
+            ...
 
-        if last_split_end == None:
-            #Primeira iteração
-            if match.start() > 0:
-                if prefixo_as_contexto:
+        #max_chunk_size in tokens: the context prefix is measured once and each split once
+        splitter = RegexContextTextSplitter(r"^CL[AÁ]USULA\\s+\\w+", max_chunk_size=512, length_function=util.token_length)
+    """
+
+    def __init__(self, regex:str, prefixo_as_contexto:bool = False, max_chunk_size:Optional[int] = None, metadata_to_content:Optional[List[str]] = None, **kwargs: Any):
+        #chunk_size/chunk_overlap do TextSplitter não são usados na quebra, apenas mantidos coerentes com max_chunk_size
+        kwargs.setdefault("chunk_overlap", 0)
+        if max_chunk_size is not None:
+            kwargs.setdefault("chunk_size", max_chunk_size)
+        super().__init__(**kwargs)
+        self._pattern = compile_separator(regex)
+        self._prefixo_as_contexto = prefixo_as_contexto
+        self._max_chunk_size = max_chunk_size
+        self._metadata_to_content = metadata_to_content
+
+    def split_text(self, text:str) -> List[str]:
+        return [chunk for chunk, _ in self._merge_segments(self._iter_text_segments(text, {}))]
+
+    def create_documents(self, texts:List[str], metadatas:Optional[List[dict]] = None) -> List[Document]:
+        metadatas = metadatas or [{}] * len(texts)
+        return list(self.lazy_split_documents(Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)))
+
+    def lazy_split_documents(self, documents:Iterable[Document]) -> Iterator[Document]:
+        """Split each document independently, like split_documents, producing the chunks one at a time."""
+        for document in documents:
+            for chunk, metadata in self._merge_segments(self._iter_text_segments(document.page_content, document.metadata)):
+                yield Document(page_content=chunk, metadata=dict(metadata))
+
+    def lazy_split_pages(self, pages:Iterable[Document], page_separator:str = "\n") -> Iterator[Document]:
+        """Split the pages of one document as a single text, keeping in memory only the current chunk.
+
+        Each chunk gets the metadata of the page where it starts.
+        """
+        segments = iter_separator_segments(pages, self._pattern, hold_preamble=self._prefixo_as_contexto, page_separator=page_separator)
+        for chunk, metadata in self._merge_segments((is_preamble, text, 0, len(text), metadata) for is_preamble, text, metadata in segments):
+            yield Document(page_content=chunk, metadata=dict(metadata))
+
+    def lazy_split_file(self, path:str, encoding:str = "utf-8", block_size:int = FILE_BLOCK_SIZE) -> Iterator[Document]:
+        """Split a text file of any size, read in blocks of block_size characters."""
+        def blocks():
+            with open(path, encoding=encoding) as f:
+                for block in iter(lambda: f.read(block_size), ""):
+                    yield Document(page_content=block, metadata={"source": path})
+
+        yield from self.lazy_split_pages(blocks(), page_separator="")
+
+    def _iter_text_segments(self, text:str, metadata:dict) -> Iterator[Tuple[bool, str, int, int, dict]]:
+        #(is_preamble, texto, início, fim, metadata): os segmentos são só posições no texto original, sem cópias
+        position = 0
+        in_preamble = True
+        for match in self._pattern.finditer(text):
+            if match.start() == match.end():
+                continue
+            if match.start() > position or not in_preamble:
+                yield in_preamble, text, position, match.start(), metadata
+            position = match.start()
+            in_preamble = False
+        if position < len(text):
+            yield in_preamble, text, position, len(text), metadata
+
+    def _segment_length(self, text:str, start:int, end:int) -> int:
+        if self._length_function is len:
+            return end - start
+        return self._length_function(text[start:end])
+
+    def _metadata_prefix(self, metadata:dict) -> str:
+        prefix = ""
+        if self._metadata_to_content is not None:
+            #Adiciona os metadados selecionados ao conteúdo do chunk
+            for metadata_key in self._metadata_to_content:
+                if metadata_key in metadata:
+                    prefix += f"{metadata[metadata_key]}\n"
+        return prefix
+
+    def _merge_segments(self, segments:Iterable[Tuple[bool, str, int, int, dict]]) -> Iterator[Tuple[str, dict]]:
+        context_prefix = ""
+        context_length = 0
+        context_metadata = None
+        found_separator = False
+        #Trechos do chunk corrente como [texto, início, fim]; trechos contíguos do mesmo texto viram um só,
+        #de modo que o chunk é montado com um único fatiamento (e sem reler o que já foi acumulado)
+        parts: List[list] = []
+        chunk_length = 0
+        chunk_metadata = None
+
+        for is_preamble, text, start, end, metadata in segments:
+            if is_preamble:
+                if self._prefixo_as_contexto:
+                    context_prefix = text[start:end]
+                    context_metadata = metadata
+                elif end > start:
+                    #Todo o conteúdo anterior ao primeiro match é um chunk separado
+                    yield text[start:end], metadata
+                continue
+
+            if not found_separator:
+                found_separator = True
+                if self._prefixo_as_contexto and context_prefix:
                     #O conteudo antes do primeiro match é considerado contexto de todos os posteriores
-                    context_prefix = original_doc.page_content[:match.start()] + "\n"
-                else:
-                    #Adiciona todo o conteúdo anterior ao primeiro match como chunk separad
-                    temp_chunk = StringIO()
-                    temp_chunk.write(original_doc.page_content[:match.start()])
-                    add_chunk_to_result(original_doc, result, temp_chunk)
-                
-                if metadata_to_content is not None: 
-                    #Adiciona os metadados selecionados ao conteúdo do chunk
-                    for metadata_key in metadata_to_content:
-                        if metadata_key in original_doc.metadata:
-                            context_prefix += f"{original_doc.metadata[metadata_key]}\n"
-        
-        else:
-
-            if max_chunk_size is None:
-                current_chunk.write(context_prefix)
-                current_chunk.write(current_match)
-                current_chunk.write(original_doc.page_content[last_split_end:match.start()])
-                add_chunk_to_result(original_doc, result, current_chunk)
+                    context_prefix += "\n"
+                context_prefix += self._metadata_prefix(metadata)
+                context_length = self._length_function(context_prefix) if context_prefix else 0
+
+            if self._max_chunk_size is None:
+                yield context_prefix + text[start:end], metadata
+                continue
+
+            segment_length = self._segment_length(text, start, end)
+            if parts and chunk_length + segment_length > self._max_chunk_size:
+                yield self._join_parts(context_prefix, parts), chunk_metadata
+                parts = []
+
+            if not parts:
+                chunk_length = context_length
+                chunk_metadata = metadata
+            if parts and parts[-1][0] is text and parts[-1][2] == start:
+                parts[-1][2] = end
             else:
-                content_to_add = current_match + original_doc.page_content[last_split_end:match.start()]
-                current_chunk_content = current_chunk.getvalue()
-
-                if len(current_chunk_content) == 0:
-                    current_chunk.write(context_prefix)
-                    current_chunk.write(content_to_add)
-                else:
-                    if len(current_chunk_content) + len(content_to_add) > max_chunk_size:
-                        add_chunk_to_result(original_doc, result, current_chunk)
-
-                        current_chunk.write(context_prefix)
-                        current_chunk.write(content_to_add)
-                    else:
-                        current_chunk.write(content_to_add)
-        
-        current_match = match.group(0)
-        last_split_end = match.end()
-
-    if current_match is None:
-        #Não houve nenhum match para a expressão de separador fornecida - retorna lista com o próprio doc de entrada
-        result.append(original_doc)
-        return result
-    
-    #Trata o trecho referente ao último match
-    current_chunk_content = current_chunk.getvalue()
-    if current_chunk_content != "":
-    
-        if last_split_end < len(original_doc.page_content): 
-            #Faltou ler do último separador em diante
-            content_to_add = current_match + original_doc.page_content[match.end():]
+                parts.append([text, start, end])
+            chunk_length += segment_length
 
-            if len(current_chunk_content) + len(content_to_add) > max_chunk_size:
-                add_chunk_to_result(original_doc, result, current_chunk)
-
-                current_chunk.write(context_prefix)
-                current_chunk.write(content_to_add)
-
-            else:
-                current_chunk.write(content_to_add)
+        if parts:
+            yield self._join_parts(context_prefix, parts), chunk_metadata
 
-        add_chunk_to_result(original_doc, result, current_chunk)
+        if not found_separator and self._prefixo_as_contexto and context_prefix:
+            #Não houve nenhum match para a expressão de separador fornecida - devolve o próprio conteúdo
+            yield context_prefix, context_metadata
 
-    elif last_split_end < len(original_doc.page_content): 
-        #Faltou ler do último separador em diante
-        content_to_add = current_match + original_doc.page_content[match.end():]
+    @staticmethod
+    def _join_parts(context_prefix:str, parts:List[list]) -> str:
+        if len(parts) == 1 and not context_prefix:
+            text, start, end = parts[0]
+            return text[start:end]
+        return "".join([context_prefix] + [text[start:end] for text, start, end in parts])
 
-        current_chunk.write(context_prefix)
-        current_chunk.write(content_to_add)
 
-        add_chunk_to_result(original_doc, result, current_chunk)
+def get_length_function(length_unit:Optional[str] = None):
+    #Import tardio, com a raiz do projeto no path qualquer que seja o diretório de execução
+    if ROOT_PATH not in sys.path:
+        sys.path.append(ROOT_PATH)
+    from config.config import CHUNK_LENGTH_UNIT
+    import util
+    return util.get_length_function(length_unit or CHUNK_LENGTH_UNIT)
 
-         
-    return result
 
+def split_text_including_separator(original_doc:Document, regex:str, prefixo_as_contexto:bool = False, max_chunk_size:int = None, metadata_to_content:List[str] = None, length_unit:Optional[str] = None) -> List[Document]:
+    """
+    Splits a string by a regex, and includes the regex match at the beginning of the following split.
+    max_chunk_size is measured in length_unit ("chars" or "tokens", default config.CHUNK_LENGTH_UNIT).
+    Kept for the existing callers; see RegexContextTextSplitter.
+    """
+    splitter = RegexContextTextSplitter(regex, prefixo_as_contexto, max_chunk_size, metadata_to_content, length_function=get_length_function(length_unit))
+    #Sem conteúdo para quebrar, devolve lista com o próprio doc de entrada
+    return splitter.split_documents([original_doc]) or [original_doc]
 
-def add_chunk_to_result(original_document:Document, result:List[Document], current_chunk:StringIO, metadata_adicional=None):
-    #Cria um novo documento com o conteudo do StringIO e com os metadados do documento original
-    document_chunk = Document(page_content=current_chunk.getvalue(), metadata=dict(original_document.metadata))
-    if metadata_adicional is not None:
-        document_chunk.metadata.update(metadata_adicional)
 
-    result.append(document_chunk)
+def lazy_split_text_including_separator(pages:Iterable[Document], regex:str, prefixo_as_contexto:bool = False, max_chunk_size:int = None, metadata_to_content:List[str] = None, length_unit:Optional[str] = None) -> Iterator[Document]:
+    """
+    Versão em streaming do split_text_including_separator: recebe as páginas de um documento (por exemplo de um loader lazy)
+    e produz os chunks à medida que os separadores aparecem, com memória limitada ao chunk corrente.
+    Cada chunk recebe o metadata da página onde começa.
+    """
+    splitter = RegexContextTextSplitter(regex, prefixo_as_contexto, max_chunk_size, metadata_to_content, length_function=get_length_function(length_unit))
+    yield from splitter.lazy_split_pages(pages)
 
-    #Limpa o StringIO para ser reutilizado
-    current_chunk.truncate(0)
-    current_chunk.seek(0)
 
 CHUNK_SEPARATOR = "\n||||||||||||||||||||||||||||||||||\n"
 
@@ -140,3 +339,33 @@ def save_chunks(result:List[Document], chunk_file_path:str):
 
 
 
+
+
+def main():
+    #Benchmark com um contrato sintético de muitas cláusulas, contra o RecursiveCharacterTextSplitter
+    import random
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    random.seed(0)
+    regex = r"^CL[AÁ]USULA\s+\d+"
+    chunk_size = 2000
+
+    for clauses in [1_000, 10_000, 100_000]:
+        parts = ["CONTRATO DE ADESÃO AO GRUPO DE CONSÓRCIO\nPreâmbulo do contrato.\n"]
+        for number in range(1, clauses + 1):
+            parts.append(f"CLÁUSULA {number} - " + "Texto da cláusula, com obrigações das partes.\n" * random.randint(1, 20))
+        text = "".join(parts)
+
+        splitters = {
+            "regex_context": RegexContextTextSplitter(regex, prefixo_as_contexto=True, max_chunk_size=chunk_size),
+            "recursive_character": RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0),
+        }
+        for name, splitter in splitters.items():
+            start = time.perf_counter()
+            chunks = splitter.split_text(text)
+            elapsed = time.perf_counter() - start
+            print(f"{clauses:>7} clauses ({len(text) / 1e6:.1f} MB) {name:>20}: {elapsed:.3f}s, {len(text) / 1e6 / elapsed:.1f} MB/s, {len(chunks)} chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import os
+import re
+import sys
+import tempfile
+import tracemalloc
+import unittest
+
+from langchain.schema import Document
+from langchain.text_splitter import TextSplitter
+
+#tratamento_dados/chunking.py esconde o diretório tratamento_dados/chunking, que não pode ser importado como pacote
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from regex_context_text_splitter import STREAM_MARGIN, RegexContextTextSplitter, iter_separator_segments, split_text_including_separator
+
+REGEX = r"^CLÁUSULA \d+"
+TEXT = "Contrato de consórcio\nCLÁUSULA 1 - Objeto.\nCLÁUSULA 2 - Prazo.\nCLÁUSULA 3 - Foro.\n"
+
+
+class TestRegexContextTextSplitter(unittest.TestCase):
+
+    def test_quebra_com_contexto(self):
+        splitter = RegexContextTextSplitter(REGEX, prefixo_as_contexto=True, max_chunk_size=80, metadata_to_content=["title"])
+        self.assertIsInstance(splitter, TextSplitter)
+
+        chunks = splitter.split_documents([Document(page_content=TEXT, metadata={"title": "Contrato X"})])
+        self.assertEqual([chunk.page_content for chunk in chunks], [
+            "Contrato de consórcio\n\nContrato X\nCLÁUSULA 1 - Objeto.\nCLÁUSULA 2 - Prazo.\n",
+            "Contrato de consórcio\n\nContrato X\nCLÁUSULA 3 - Foro.\n",
+        ])
+        self.assertEqual(chunks[0].metadata, {"title": "Contrato X"})
+
+    def test_sem_max_chunk_size(self):
+        #Texto terminando logo depois do último separador, sem max_chunk_size
+        chunks = split_text_including_separator(Document(page_content=TEXT + "CLÁUSULA 4"), REGEX)
+        self.assertEqual([chunk.page_content for chunk in chunks], [
+            "Contrato de consórcio\n",
+            "CLÁUSULA 1 - Objeto.\n",
+            "CLÁUSULA 2 - Prazo.\n",
+            "CLÁUSULA 3 - Foro.\n",
+            "CLÁUSULA 4",
+        ])
+
+    def test_unidade_de_tamanho(self):
+        #Os wrappers medem max_chunk_size na unidade pedida (ou na config.CHUNK_LENGTH_UNIT), como o chunk_data
+        splitter = RegexContextTextSplitter(REGEX, prefixo_as_contexto=True, max_chunk_size=80)
+        chunks = split_text_including_separator(Document(page_content=TEXT), REGEX, True, 80, length_unit="chars")
+        self.assertEqual([chunk.page_content for chunk in chunks], splitter.split_text(TEXT))
+        with self.assertRaises(ValueError):
+            split_text_including_separator(Document(page_content=TEXT), REGEX, True, 80, length_unit="words")
+
+    def test_arquivo_em_blocos(self):
+        splitter = RegexContextTextSplitter(REGEX, prefixo_as_contexto=True, max_chunk_size=200)
+        text = "".join(f"CLÁUSULA {number} - " + "texto. " * (number % 7) + "\n" for number in range(1, 500))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "contrato.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("Preâmbulo\n" + text)
+            #Blocos menores que os separadores, que ficam divididos entre dois blocos
+            chunks = [chunk.page_content for chunk in splitter.lazy_split_file(path, block_size=5)]
+
+        self.assertEqual(chunks, splitter.split_text("Preâmbulo\n" + text))
+        self.assertTrue(all(len(chunk) <= 200 for chunk in chunks))
+
+    def test_busca_linear_em_segmento_longo(self):
+        class CountingPattern:
+            #Conta os caracteres entregues à busca do regex
+            def __init__(self, pattern):
+                self.pattern = pattern
+                self.scanned = 0
+
+            def finditer(self, text, position=0):
+                self.scanned += len(text) - position
+                return self.pattern.finditer(text, position)
+
+        block = "texto de uma cláusula muito longa\n" * 100
+        for hold_preamble in [True, False]:
+            pattern = CountingPattern(re.compile(REGEX, re.IGNORECASE | re.MULTILINE))
+            pages = [Document(page_content="CLÁUSULA 1 - ")] + [Document(page_content=block) for _ in range(500)]
+            segments = list(iter_separator_segments(pages, pattern, hold_preamble=hold_preamble, page_separator=""))
+
+            self.assertEqual("".join(text for _, text, _ in segments), "CLÁUSULA 1 - " + block * 500)
+            #Cada trecho é buscado uma vez, mais a margem de cada bloco
+            self.assertLessEqual(pattern.scanned, len(block) * 500 + len(pages) * 2 * STREAM_MARGIN)
+
+    def test_memoria_nao_cresce_com_paginas(self):
+        splitter = RegexContextTextSplitter(REGEX, prefixo_as_contexto=True, max_chunk_size=2000)
+
+        def pages(count):
+            for page in range(count):
+                text = "".join(f"CLÁUSULA {page * 10 + number} - " + "texto do contrato. " * 20 + "\n" for number in range(10))
+                yield Document(page_content=text, metadata={"page": page})
+
+        def peak(count):
+            tracemalloc.start()
+            try:
+                chunks = sum(1 for _ in splitter.lazy_split_pages(pages(count)))
+                return chunks, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        #Primeira passada só para os caches (regex compilado, imports); cada página tem ~4KB
+        peak(10)
+        chunks, small = peak(100)
+        self.assertEqual(chunks, 200)
+        chunks, large = peak(1000)
+        self.assertEqual(chunks, 2000)
+        #Pico limitado ao chunk corrente: 10x mais páginas não aumentam a memória
+        self.assertLess(large, 2 * small)
+        self.assertLess(large, 100 * 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
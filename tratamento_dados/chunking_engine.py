@@ -0,0 +1,146 @@
+"""
+Quebra de muitos documentos em chunks num pool de processos, para lotes grandes de contratos.
+
+- Os documentos são agrupados em lotes de até BATCH_SIZE_CHARS caracteres e cada lote vai para um processo.
+- Documentos e chunks trafegam entre os processos como tuplas (page_content, metadata), bem mais baratas de
+  serializar que os Documents (pydantic). O splitter é enviado uma única vez para cada processo.
+- Os chunks saem na mesma ordem da quebra serial, e os lotes são consumidos à medida que ficam prontos,
+  com um número limitado de lotes em processamento.
+
+Funciona com qualquer TextSplitter do LangChain que possa ser serializado: o RecursiveCharacterTextSplitter do
+chunk_data e o RegexContextTextSplitter (tratamento_dados/chunking/regex_context_text_splitter.py).
+
+Benchmark (serial x pool):
+    python -m tratamento_dados.chunking_engine --documents 2000 --workers 4
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import chain
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+
+from langchain.schema import Document
+from langchain.text_splitter import TextSplitter
+
+#Tamanho dos lotes enviados a cada processo: lotes pequenos demais gastam mais com comunicação que com a quebra
+BATCH_SIZE_CHARS = 1024 * 1024
+#Abaixo disso a quebra é feita no próprio processo, sem o custo de subir o pool
+MIN_PARALLEL_CHARS = 4 * BATCH_SIZE_CHARS
+
+DocumentTuple = Tuple[str, dict]
+
+#Splitter de cada processo do pool, recebido uma única vez no initializer
+_worker_splitter: Optional[TextSplitter] = None
+
+
+def _init_worker(splitter: TextSplitter):
+    global _worker_splitter
+    _worker_splitter = splitter
+
+
+def split_batch(splitter: TextSplitter, batch: List[DocumentTuple]) -> List[DocumentTuple]:
+    documents = [Document(page_content=text, metadata=metadata) for text, metadata in batch]
+    return [(chunk.page_content, chunk.metadata) for chunk in splitter.split_documents(documents)]
+
+
+def _split_batch_in_worker(batch: List[DocumentTuple]) -> List[DocumentTuple]:
+    return split_batch(_worker_splitter, batch)
+
+
+def iter_batches(documents: Iterable[Document], batch_size_chars: int = BATCH_SIZE_CHARS) -> Iterator[List[DocumentTuple]]:
+    batch: List[DocumentTuple] = []
+    batch_chars = 0
+    for document in documents:
+        batch.append((document.page_content, document.metadata))
+        batch_chars += len(document.page_content)
+        if batch_chars >= batch_size_chars:
+            yield batch
+            batch = []
+            batch_chars = 0
+    if batch:
+        yield batch
+
+
+class ChunkingEngine:
+    """Splits many documents with a text splitter in a process pool, keeping the serial order of the chunks.
+
+    Examples:
+        engine = ChunkingEngine(get_text_splitter(), max_workers=8)
+        chunks = engine.split_documents(pages)
+
+        splitter = RegexContextTextSplitter(r"^CL[AÁ]USULA\\s+\\w+", prefixo_as_contexto=True, max_chunk_size=2000)
+        for chunk in ChunkingEngine(splitter).lazy_split_documents(lazy_pages):
+            ...
+    """
+
+    def __init__(self, splitter: TextSplitter, max_workers: Optional[int] = None, batch_size_chars: int = BATCH_SIZE_CHARS, min_parallel_chars: int = MIN_PARALLEL_CHARS):
+        self.splitter = splitter
+        self.max_workers = max_workers or os.cpu_count()
+        self.batch_size_chars = batch_size_chars
+        self.min_parallel_chars = min_parallel_chars
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        return list(self.lazy_split_documents(documents))
+
+    def lazy_split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        batches = iter_batches(documents, self.batch_size_chars)
+
+        #Lotes lidos até decidir se vale a pena usar o pool
+        first_batches = []
+        total_chars = 0
+        for batch in batches:
+            first_batches.append(batch)
+            total_chars += sum(len(text) for text, _ in batch)
+            if total_chars >= self.min_parallel_chars:
+                break
+
+        if self.max_workers <= 1 or total_chars < self.min_parallel_chars:
+            for batch in chain(first_batches, batches):
+                yield from self._to_documents(split_batch(self.splitter, batch))
+            return
+
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker, initargs=(self.splitter,)) as executor:
+            #Limita os lotes em processamento, para os chunks prontos não se acumularem na memória
+            running: Deque[Future] = deque()
+            for batch in chain(first_batches, batches):
+                running.append(executor.submit(_split_batch_in_worker, batch))
+                if len(running) >= 2 * self.max_workers:
+                    yield from self._to_documents(running.popleft().result())
+            while running:
+                yield from self._to_documents(running.popleft().result())
+
+    @staticmethod
+    def _to_documents(chunks: List[DocumentTuple]) -> Iterator[Document]:
+        for text, metadata in chunks:
+            yield Document(page_content=text, metadata=metadata)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=2000, help="synthetic contract pages")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    from tratamento_dados.chunking import get_text_splitter
+
+    paragraph = "O consorciado obriga-se a pagar as contribuições mensais até a data de vencimento.\n\n"
+    documents = [Document(page_content=f"CLÁUSULA {number} - " + paragraph * (20 + number % 40), metadata={"page": number}) for number in range(args.documents)]
+    splitter = get_text_splitter()
+
+    start = time.perf_counter()
+    serial = splitter.split_documents(documents)
+    serial_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = ChunkingEngine(splitter, max_workers=args.workers, min_parallel_chars=0).split_documents(documents)
+    parallel_time = time.perf_counter() - start
+
+    assert [chunk.page_content for chunk in parallel] == [chunk.page_content for chunk in serial]
+    print(f"{len(documents)} documents, {len(serial)} chunks")
+    print(f"serial: {serial_time:.2f}s, {args.workers} workers: {parallel_time:.2f}s ({serial_time / parallel_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
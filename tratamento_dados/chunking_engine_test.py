@@ -0,0 +1,39 @@
+import os
+import sys
+import unittest
+
+from langchain.schema import Document
+
+from tratamento_dados.chunking import get_text_splitter
+from tratamento_dados.chunking_engine import ChunkingEngine
+
+#tratamento_dados/chunking.py esconde o diretório tratamento_dados/chunking, que não pode ser importado como pacote
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "chunking"))
+from regex_context_text_splitter import RegexContextTextSplitter
+
+
+class TestChunkingEngine(unittest.TestCase):
+
+    def setUp(self):
+        paragraph = "O consorciado obriga-se a pagar as contribuições mensais.\n\n"
+        self.documents = [
+            Document(page_content=f"Contrato {number}\nCLÁUSULA 1 - " + paragraph * (number % 9 + 1) + "CLÁUSULA 2 - " + paragraph * 3, metadata={"page": number})
+            for number in range(60)
+        ]
+
+    def assert_same_as_serial(self, splitter):
+        engine = ChunkingEngine(splitter, max_workers=2, batch_size_chars=2000, min_parallel_chars=0)
+        chunks = engine.split_documents(self.documents)
+        serial = splitter.split_documents(self.documents)
+
+        self.assertEqual([(chunk.page_content, chunk.metadata) for chunk in chunks], [(chunk.page_content, chunk.metadata) for chunk in serial])
+
+    def test_recursive_character_splitter(self):
+        self.assert_same_as_serial(get_text_splitter(chunk_size=200, overlap=50, length_unit="chars"))
+
+    def test_regex_context_splitter(self):
+        self.assert_same_as_serial(RegexContextTextSplitter(r"^CLÁUSULA \d+", prefixo_as_contexto=True, max_chunk_size=300))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+"""
+Remoção de chunks duplicados entre a quebra e a indexação: cláusulas padrão de contratos e respostas de FAQ se repetem
+entre documentos e páginas, e cada cópia indexada custa embeddings, memória no índice e posições do top k.
+
+- Duplicados exatos: mesmo texto, ignorando diferenças de espaços e quebras de linha (hash sha1).
+- Quase duplicados: MinHash dos shingles de caracteres do texto, com LSH (bandas da assinatura) para achar os
+  candidatos, confirmados pela similaridade de Jaccard estimada pelas assinaturas completas.
+
+O primeiro chunk de cada grupo é o canônico; os demais são descartados e as suas origens (metadata "source" e "page",
+como "<source>#page=<page>") ficam no metadata do canônico, e as posições no mapeamento do DeduplicationResult.
+
+Quase duplicados não têm o mesmo conteúdo ("30 dias" x "90 dias"): descartá-los perde o texto que só existe neles.
+Com near_duplicates=False só os duplicados exatos são descartados, como na carga do índice.
+
+Uso:
+    result = ChunkDeduplicator().deduplicate(chunks)
+    insert_or_fetch_embeddings(index_name, result.unique)
+"""
+import hashlib
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+
+#Similaridade de Jaccard (entre os shingles) a partir da qual dois chunks são considerados o mesmo
+DEFAULT_THRESHOLD = 0.85
+#Funções de hash da assinatura MinHash, divididas em LSH_BANDS bandas de NUM_PERM / LSH_BANDS linhas.
+#Com 16 bandas de 8 linhas, pares com Jaccard acima de ~0.7 quase sempre viram candidatos
+NUM_PERM = 128
+LSH_BANDS = 16
+SHINGLE_SIZE = 5
+#Metadata do chunk canônico com as origens dos duplicados descartados
+DUPLICATE_SOURCES_KEY = "duplicate_sources"
+
+_WHITESPACE = re.compile(r"\s+")
+_MERSENNE_61 = np.uint64((1 << 61) - 1)
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def shingle_hashes(text: str, shingle_size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Distinct 64-bit hashes of the character shingles of text, computed with numpy over the code points."""
+    code_points = np.frombuffer(text.lower().encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(code_points) < shingle_size:
+        shingle_size = max(len(code_points), 1)
+        if len(code_points) == 0:
+            return np.zeros(1, dtype=np.uint64)
+
+    #Hash polinomial de cada janela; a multiplicação em uint64 dá a volta em 2^64, o que é o esperado
+    count = len(code_points) - shingle_size + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(shingle_size):
+        hashes = hashes * np.uint64(1_000_003) + code_points[offset:offset + count]
+    return np.unique(hashes)
+
+
+def _source_of(metadata: dict) -> str:
+    #Lista de strings, aceita como metadata pelos vector stores (Redis, Pinecone)
+    source = str(metadata.get("source", ""))
+    return f"{source}#page={metadata['page']}" if "page" in metadata else source
+
+
+@dataclass
+class DeduplicationResult:
+    unique: List[Document]
+    #Posição de cada chunk descartado na entrada -> posição do seu canônico na entrada
+    canonical: Dict[int, int] = field(default_factory=dict)
+    exact_duplicates: int = 0
+    near_duplicates: int = 0
+
+    def duplicates_of(self, canonical_position: int) -> List[int]:
+        return [position for position, canonical in self.canonical.items() if canonical == canonical_position]
+
+
+class ChunkDeduplicator:
+    """Drops exact and near-duplicate chunks, keeping the first of each group.
+
+    The state is kept between calls, so chunks of later batches are also compared with the ones already seen
+    (in that case the canonical is a chunk of a previous batch, not present in the result).
+
+    Examples:
+        deduplicator = ChunkDeduplicator(threshold=0.9)
+        result = deduplicator.deduplicate(chunks)
+        result.unique[0].metadata["duplicate_sources"]  #["data/contrato2.pdf#page=3", ...]
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        num_perm: int = NUM_PERM,
+        bands: int = LSH_BANDS,
+        shingle_size: int = SHINGLE_SIZE,
+        seed: int = 0,
+        sources_key: Optional[str] = DUPLICATE_SOURCES_KEY,
+        near_duplicates: bool = True,
+    ):
+        if num_perm % bands != 0:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.sources_key = sources_key
+        self.near_duplicates = near_duplicates
+
+        #Permutações da forma (a * x + b) mod (2^61 - 1), com x reduzido a 32 bits para não estourar o uint64
+        generator = np.random.default_rng(seed)
+        self._a = generator.integers(1, 1 << 29, size=num_perm, dtype=np.uint64)
+        self._b = generator.integers(0, 1 << 61, size=num_perm, dtype=np.uint64)
+
+        self._exact: Dict[str, int] = {}
+        self._signatures: List[np.ndarray] = []
+        self._buckets: List[Dict[bytes, List[int]]] = [defaultdict(list) for _ in range(bands)]
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = shingle_hashes(text, self.shingle_size) & np.uint64(0xFFFFFFFF)
+        hashes = (self._a[:, None] * shingles[None, :] + self._b[:, None]) % _MERSENNE_61
+        return hashes.min(axis=1)
+
+    def deduplicate(self, documents: List[Document]) -> DeduplicationResult:
+        result = DeduplicationResult(unique=[])
+        #Canônicos desta chamada: id interno -> (posição na entrada, documento de saída)
+        kept: Dict[int, tuple] = {}
+
+        for position, document in enumerate(documents):
+            text = normalize_text(document.page_content)
+            digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+            duplicate_of = self._exact.get(digest)
+            if duplicate_of is not None:
+                result.exact_duplicates += 1
+            else:
+                signature = self.signature(text) if self.near_duplicates else None
+                duplicate_of = self._find_near_duplicate(signature) if self.near_duplicates else None
+                if duplicate_of is not None:
+                    result.near_duplicates += 1
+                else:
+                    duplicate_of = self._add(signature)
+                    self._exact[digest] = duplicate_of
+                    unique = Document(page_content=document.page_content, metadata=dict(document.metadata))
+                    kept[duplicate_of] = (position, unique)
+                    result.unique.append(unique)
+                    continue
+
+            if duplicate_of in kept:
+                canonical_position, canonical = kept[duplicate_of]
+                result.canonical[position] = canonical_position
+                source = _source_of(document.metadata)
+                if self.sources_key is not None and source:
+                    canonical.metadata.setdefault(self.sources_key, []).append(source)
+
+        return result
+
+    def _add(self, signature: Optional[np.ndarray]) -> int:
+        doc_id = len(self._signatures)
+        self._signatures.append(signature)
+        if signature is None:
+            #Só duplicados exatos: sem assinatura nem LSH
+            return doc_id
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band][key].append(doc_id)
+        return doc_id
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _find_near_duplicate(self, signature: np.ndarray) -> Optional[int]:
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(key, ()))
+        if not candidates:
+            return None
+
+        candidates = sorted(candidates)
+        #Fração de posições iguais nas assinaturas: estimativa da similaridade de Jaccard
+        similarities = (np.vstack([self._signatures[doc_id] for doc_id in candidates]) == signature).mean(axis=1)
+        best = int(np.argmax(similarities))
+        return candidates[best] if similarities[best] >= self.threshold else None
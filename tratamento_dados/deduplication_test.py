@@ -0,0 +1,66 @@
+import unittest
+
+from langchain.schema import Document
+
+from tratamento_dados.deduplication import ChunkDeduplicator
+
+CLAUSULA = (
+    "CLÁUSULA 12 - O consorciado contemplado deverá apresentar garantias suficientes para a liberação do crédito, "
+    "a critério da administradora, que poderá exigir a alienação fiduciária do bem adquirido e a contratação de seguro."
+)
+
+
+class TestChunkDeduplicator(unittest.TestCase):
+
+    def test_duplicados_exatos_e_quase_duplicados(self):
+        chunks = [
+            Document(page_content=CLAUSULA, metadata={"source": "contrato1.pdf", "page": 1}),
+            Document(page_content="CLÁUSULA 1 - Do objeto do contrato de participação em grupo de consórcio.", metadata={"source": "contrato1.pdf", "page": 0}),
+            #Mesmo texto com outras quebras de linha
+            Document(page_content=CLAUSULA.replace(" ", "\n", 3), metadata={"source": "contrato2.pdf", "page": 4}),
+            #Quase igual: uma palavra diferente
+            Document(page_content=CLAUSULA.replace("suficientes", "idôneas"), metadata={"source": "contrato3.pdf", "page": 2}),
+        ]
+
+        result = ChunkDeduplicator().deduplicate(chunks)
+
+        self.assertEqual([chunk.page_content for chunk in result.unique], [chunks[0].page_content, chunks[1].page_content])
+        self.assertEqual((result.exact_duplicates, result.near_duplicates), (1, 1))
+        self.assertEqual(result.canonical, {2: 0, 3: 0})
+        self.assertEqual(result.unique[0].metadata["duplicate_sources"], ["contrato2.pdf#page=4", "contrato3.pdf#page=2"])
+        self.assertNotIn("duplicate_sources", result.unique[1].metadata)
+        #A entrada não é alterada
+        self.assertNotIn("duplicate_sources", chunks[0].metadata)
+
+    def test_somente_duplicados_exatos(self):
+        chunks = [
+            Document(page_content=CLAUSULA.replace("garantias", "garantias em 30 dias")),
+            Document(page_content=CLAUSULA.replace("garantias", "garantias em 90 dias")),
+            Document(page_content=CLAUSULA.replace("garantias", "garantias em 30 dias")),
+        ]
+
+        result = ChunkDeduplicator(near_duplicates=False).deduplicate(chunks)
+        self.assertEqual(result.unique, chunks[:2])
+        self.assertEqual((result.exact_duplicates, result.near_duplicates), (1, 0))
+        #Sem source no metadata, não há origem a registrar
+        self.assertNotIn("duplicate_sources", result.unique[0].metadata)
+
+        #Com a busca por quase duplicados, a de 90 dias seria descartada
+        self.assertEqual(len(ChunkDeduplicator().deduplicate(chunks).unique), 1)
+
+    def test_textos_diferentes_nao_sao_agrupados(self):
+        chunks = [
+            Document(page_content=CLAUSULA),
+            Document(page_content="CLÁUSULA 13 - As assembleias gerais ordinárias serão realizadas mensalmente, na sede da administradora."),
+            Document(page_content="CLÁUSULA 14 - O lance livre será ofertado em percentual do valor do crédito, até a data da assembleia."),
+            #Metade da cláusula 12: parecida, mas abaixo do limite
+            Document(page_content=CLAUSULA[:len(CLAUSULA) // 2]),
+        ]
+
+        result = ChunkDeduplicator().deduplicate(chunks)
+
+        self.assertEqual(len(result.unique), len(chunks))
+
+
+if __name__ == "__main__":
+    unittest.main()
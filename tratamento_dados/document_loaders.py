@@ -1,6 +1,7 @@
 from langchain.schema import Document
 import os
 import logging
+from typing import Iterator
 from config.config import LOG_LEVEL
 
 logger = logging.getLogger(__name__)
@@ -24,14 +25,38 @@ def load_document(file) -> list[Document]:
             return None
 
 
+def lazy_load_document(file) -> Iterator[Document]:
+    """Same as load_document, but yields the pages as they are parsed (PDF), so chunking can start on the first page
+    and memory does not grow with the number of pages. DOCX and TXT are loaded at once, as before."""
+    name, extension = os.path.splitext(file)
+    extension = extension.upper().strip('.')
+
+    match extension:
+        case 'PDF':
+            return lazy_load_PDF(file)
+        case 'DOCX':
+            return iter(load_DOCX(file))
+        case 'TXT':
+            return iter(load_TXT(file))
+        case _ :
+            logger.warn('unsupported extension: %s', extension)
+            return iter([])
+
+
 #Loads the pdfs using PyPDF into an array of Documents
 #Each document contents the page content and metadata with the page number
 def load_PDF(file) -> list[Document]:
-    from langchain.document_loaders import PyPDFLoader
+    return list(lazy_load_PDF(file))
+
+
+def lazy_load_PDF(file) -> Iterator[Document]:
+    #Mesmo resultado do PyPDFLoader, mas página a página: o lazy_load dele monta a lista de todas as páginas antes
+    import pypdf
     logger.debug(f'Loading PDF file {file}')
-    loader = PyPDFLoader(file)
-    document_list = loader.load()
-    return document_list
+    with open(file, 'rb') as f:
+        reader = pypdf.PdfReader(f)
+        for page_number, page in enumerate(reader.pages):
+            yield Document(page_content=page.extract_text(), metadata={'source': file, 'page': page_number})
 
 def load_DOCX(file)  -> list[Document]:
     logger.debug(f'Loading DOCX file {file}')
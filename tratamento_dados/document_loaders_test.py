@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+from langchain.schema import Document
+
+from tratamento_dados.chunking import chunk_data, lazy_chunk_data
+from tratamento_dados.document_loaders import lazy_load_document, lazy_load_PDF, load_document
+
+
+def make_pdf(pages):
+    """Minimal PDF with one line of text (ASCII) per page, for the loader tests."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects) + 2} 0 R >>".encode())
+        kids.append(f"{len(objects)} 0 R")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, content in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + content + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+
+class TestLazyLoaders(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_pdf_pagina_a_pagina(self):
+        try:
+            from langchain.document_loaders import PyPDFLoader
+            import pypdf
+        except ImportError as e:
+            raise unittest.SkipTest(f"pypdf unavailable: {e}")
+
+        path = self.write("contrato.pdf", make_pdf(["CLAUSULA 1 - Objeto", "CLAUSULA 2 - Prazo", "CLAUSULA 3 - Foro"]))
+        pages = lazy_load_PDF(path)
+        #Gerador: nenhuma página é lida antes de ser pedida
+        self.assertFalse(isinstance(pages, list))
+        pages = list(pages)
+
+        self.assertEqual(pages, PyPDFLoader(path).load())
+        self.assertEqual([page.metadata["page"] for page in pages], [0, 1, 2])
+        self.assertIn("CLAUSULA 2", pages[1].page_content)
+        self.assertEqual(list(lazy_load_document(path)), load_document(path))
+
+    def test_documento_por_extensao(self):
+        path = self.write("contrato.txt", "CLÁUSULA 1ª - Objeto\n\nO consorciado obriga-se a pagar.\n".encode("utf-8"))
+        self.assertEqual(list(lazy_load_document(path)), load_document(path))
+
+        #Extensão não suportada: nenhuma página, como o None do load_document
+        path = self.write("planilha.xlsx", b"")
+        self.assertIsNone(load_document(path))
+        self.assertEqual(list(lazy_load_document(path)), [])
+
+    def test_chunks_iguais_aos_da_quebra_completa(self):
+        paragraph = "O consorciado obriga-se a pagar as contribuições mensais até a data de vencimento.\n\n"
+        pages = [Document(page_content=f"CLÁUSULA {number} - " + paragraph * (number % 30), metadata={"page": number}) for number in range(40)]
+
+        chunks = lazy_chunk_data(iter(pages), chunk_size=300, overlap=50, length_unit="chars")
+        self.assertFalse(isinstance(chunks, list))
+        self.assertEqual(list(chunks), chunk_data(pages, chunk_size=300, overlap=50, length_unit="chars"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,369 @@
+"""
+Carga incremental de um diretório de documentos no parent document store e no vector store do retriever.
+
+- Os arquivos são carregados e quebrados em chunks (parents e filhos) em paralelo, num pool de processos.
+- Um manifesto guarda o hash do conteúdo de cada arquivo, os parâmetros da quebra e os ids gravados a partir dele:
+  arquivos que não mudaram desde a última execução, com os mesmos parâmetros, são pulados; os demais têm os chunks
+  antigos removidos depois da carga dos novos (mudar CHUNK_LENGTH_UNIT recarrega tudo).
+- Os chunks de cada arquivo são gravados assim que o processo que o tratou termina, sem esperar o diretório todo.
+- Filhos repetidos (texto igual) dentro de um arquivo (cláusulas padrão, cabeçalhos de página) são indexados uma única
+  vez (tratamento_dados/deduplication.py), e parents sem nenhum filho restante não são gravados. Filhos apenas parecidos
+  ("30 dias" x "90 dias") são todos indexados: o texto que os diferencia continua recuperável.
+  Entre arquivos não: o canônico sumiria do índice junto com o seu arquivo.
+
+Uso:
+    python -m tratamento_dados.ingestion data/contratos --loader tika --workers 8
+    python -m tratamento_dados.ingestion data/contratos --prune   #remove também os arquivos que saíram do diretório
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain.schema import Document
+from langchain.schema.vectorstore import VectorStore
+
+from config.config import CHUNK_LENGTH_UNIT, CHUNK_OVERLAP, CHUNK_SIZE, LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+DEFAULT_MANIFEST_PATH = os.path.join("data", "ingestion_manifest.json")
+
+#Chave do metadata dos filhos com o id do parent, a mesma usada pelo ParentDocumentRetriever (tag doc_id no schema)
+ID_KEY = "doc_id"
+#Metadata do filho canônico com os parents dos filhos repetidos descartados em seu favor
+DUPLICATE_PARENT_IDS_KEY = "duplicate_parent_ids"
+
+#Extensões aceitas por cada loader. "default" escolhe pelo tipo do arquivo (tratamento_dados/document_loaders.py)
+LOADER_EXTENSIONS = {
+    "default": ("pdf", "docx", "txt"),
+    "unstructured": ("pdf",),
+    "pdfbox": ("pdf",),
+    "tika": ("pdf",),
+}
+
+#Leitura do arquivo em blocos para o hash, sem carregá-lo inteiro na memória
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_loader(name: str) -> Callable[[str], Iterable[Document]]:
+    #Imports tardios: cada loader tem dependências opcionais próprias (unstructured, pdfbox, servidor tika)
+    #Sempre que possível, loaders que produzem as páginas à medida que são lidas
+    if name == "default":
+        from tratamento_dados.document_loaders import lazy_load_document
+        return lazy_load_document
+    if name == "unstructured":
+        from tratamento_dados.carga.document_load import lazy_load_pdf_unstructured
+        return lazy_load_pdf_unstructured
+    if name == "pdfbox":
+        from tratamento_dados.carga.document_load import load_pdf_apache
+        return lambda path: [load_pdf_apache(path)]
+    if name == "tika":
+        from tratamento_dados.carga.document_load import stream_tika
+        return stream_tika
+    raise ValueError(f"Unknown loader: {name}. Use one of {list(LOADER_EXTENSIONS)}")
+
+
+@dataclass
+class FileChunks:
+    """Chunks of one file, as produced by a worker process."""
+    path: str
+    parents: List[Tuple[str, Document]] = field(default_factory=list)
+    children: List[Document] = field(default_factory=list)
+    duplicates: int = 0
+
+
+def load_and_chunk(path: str, loader: str = "default", chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP, deduplicate: bool = True) -> FileChunks:
+    """Load one file and split it in parents (chunk_size) and children (child splitter of the retriever).
+
+    Runs in the worker processes, so everything it returns must be picklable.
+    Pages are loaded and split lazily, but all the chunks of the file are collected before returning: the
+    deduplication needs every child of the file, and the chunks go back to the parent process in one piece.
+    The memory of a worker grows with the size of the file being ingested, not with the directory.
+    """
+    from tratamento_dados.chunking import lazy_chunk_data
+    from retrieval.redis_parent_retriever import get_child_splitter
+
+    pages = get_loader(loader)(path) or []
+    child_splitter = get_child_splitter()
+    result = FileChunks(path=path)
+
+    for parent in lazy_chunk_data(pages, chunk_size, chunk_overlap):
+        parent_id = str(uuid.uuid4())
+        result.parents.append((parent_id, parent))
+        for child in child_splitter.split_documents([parent]):
+            child.metadata[ID_KEY] = parent_id
+            result.children.append(child)
+
+    if deduplicate:
+        deduplicate_children(result)
+
+    return result
+
+
+def deduplicate_children(chunks: FileChunks):
+    """Drop the exact repeated children of a file, and the parents left with no child in the vector store.
+
+    The canonical child keeps, in DUPLICATE_PARENT_IDS_KEY, the parents of the children dropped in its favour.
+    Only children with the same (normalized) text are dropped, so a dropped parent is never unreachable content:
+    each of its children's text is in the parent of a canonical child. Near-duplicates are kept, as they may differ
+    in exactly what is asked ("30 dias" x "90 dias").
+    """
+    from tratamento_dados.deduplication import ChunkDeduplicator
+
+    deduplicated = ChunkDeduplicator(near_duplicates=False).deduplicate(chunks.children)
+    kept_positions = [position for position in range(len(chunks.children)) if position not in deduplicated.canonical]
+    canonical_children = dict(zip(kept_positions, deduplicated.unique))
+    for position, canonical_position in deduplicated.canonical.items():
+        parent_ids = canonical_children[canonical_position].metadata.setdefault(DUPLICATE_PARENT_IDS_KEY, [])
+        parent_id = chunks.children[position].metadata[ID_KEY]
+        if parent_id not in parent_ids:
+            parent_ids.append(parent_id)
+
+    referenced = {child.metadata[ID_KEY] for child in deduplicated.unique}
+    #Só ids de parents gravados: os descartados não teriam como ser lidos do docstore
+    for child in deduplicated.unique:
+        parent_ids = [parent_id for parent_id in child.metadata.pop(DUPLICATE_PARENT_IDS_KEY, []) if parent_id in referenced]
+        if parent_ids:
+            child.metadata[DUPLICATE_PARENT_IDS_KEY] = parent_ids
+    chunks.duplicates = len(chunks.children) - len(deduplicated.unique)
+    chunks.children = deduplicated.unique
+    chunks.parents = [(parent_id, parent) for parent_id, parent in chunks.parents if parent_id in referenced]
+
+
+class IngestionManifest:
+    """Content hash and ids written for each ingested file, persisted as JSON.
+
+    Saved after every file, so an interrupted run resumes from where it stopped.
+    """
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def is_unchanged(self, key: str, sha256: str, loader: str, chunking: dict) -> bool:
+        #Entradas de versões anteriores, sem os parâmetros da quebra, contam como alteradas
+        entry = self.entries.get(key)
+        return entry is not None and entry["sha256"] == sha256 and entry["loader"] == loader and entry.get("chunking") == chunking
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(self.path + ".tmp", self.path)
+
+
+@dataclass
+class IngestionStats:
+    scanned: int = 0
+    skipped: int = 0
+    ingested: int = 0
+    failed: int = 0
+    removed: int = 0
+    parents: int = 0
+    children: int = 0
+    duplicates: int = 0
+
+
+class DirectoryIngestion:
+    """Incremental, parallel ingestion of a directory into a parent docstore and a child vector store.
+
+    Examples:
+        ingestion = DirectoryIngestion(get_redis_doc_store(), get_vector_store(embeddings), loader="tika")
+        stats = ingestion.run("data/contratos")
+    """
+
+    def __init__(
+        self,
+        docstore,
+        vectorstore: VectorStore,
+        manifest: Optional[IngestionManifest] = None,
+        loader: str = "default",
+        max_workers: Optional[int] = None,
+        chunk_size: int = CHUNK_SIZE,
+        chunk_overlap: int = CHUNK_OVERLAP,
+        vectorstore_kwargs: Optional[dict] = None,
+        deduplicate: bool = True,
+    ):
+        if loader not in LOADER_EXTENSIONS:
+            raise ValueError(f"Unknown loader: {loader}. Use one of {list(LOADER_EXTENSIONS)}")
+        self.docstore = docstore
+        self.vectorstore = vectorstore
+        self.manifest = manifest if manifest is not None else IngestionManifest()
+        self.loader = loader
+        self.max_workers = max_workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        #Argumentos extras do delete do vector store (o Redis do langchain precisa do redis_url)
+        self.vectorstore_kwargs = vectorstore_kwargs or {}
+        self.deduplicate = deduplicate
+
+    @property
+    def chunking(self) -> dict:
+        """Parameters that change the chunks of a file: a file ingested with other values is ingested again."""
+        from retrieval.redis_parent_retriever import CHUNK_OVERLAP as CHILD_CHUNK_OVERLAP, MAX_CHUNK_SIZE
+
+        return {
+            "length_unit": CHUNK_LENGTH_UNIT,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "child_chunk_size": MAX_CHUNK_SIZE,
+            "child_chunk_overlap": CHILD_CHUNK_OVERLAP,
+            "deduplicate": self.deduplicate,
+        }
+
+    def find_files(self, directory: str, pattern: str = "*") -> List[str]:
+        extensions = LOADER_EXTENSIONS[self.loader]
+        files = []
+        for root, _, names in os.walk(directory):
+            for name in sorted(names):
+                if fnmatch.fnmatch(name, pattern) and name.lower().rsplit(".", 1)[-1] in extensions:
+                    files.append(os.path.join(root, name))
+        return files
+
+    def run(self, directory: str, pattern: str = "*", prune: bool = False) -> IngestionStats:
+        start = time.perf_counter()
+        stats = IngestionStats()
+
+        chunking = self.chunking
+        pending: Dict[str, str] = {}
+        for path in self.find_files(directory, pattern):
+            stats.scanned += 1
+            key = os.path.relpath(path, directory)
+            sha256 = file_hash(path)
+            if self.manifest.is_unchanged(key, sha256, self.loader, chunking):
+                stats.skipped += 1
+            else:
+                pending[path] = sha256
+
+        logger.info("%d files, %d unchanged, %d to ingest with %d workers", stats.scanned, stats.skipped, len(pending), self.max_workers)
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            #Limita os arquivos em processamento, para os chunks prontos não se acumularem na memória
+            paths = iter(pending)
+            running: Dict[Future, str] = {}
+            while True:
+                while len(running) < 2 * self.max_workers:
+                    path = next(paths, None)
+                    if path is None:
+                        break
+                    running[executor.submit(load_and_chunk, path, self.loader, self.chunk_size, self.chunk_overlap, self.deduplicate)] = path
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = running.pop(future)
+                    try:
+                        chunks = future.result()
+                        self._write(os.path.relpath(path, directory), pending[path], chunks)
+                        stats.ingested += 1
+                        stats.parents += len(chunks.parents)
+                        stats.children += len(chunks.children)
+                        stats.duplicates += chunks.duplicates
+                    except Exception:
+                        logger.exception("Failed to ingest %s", path)
+                        stats.failed += 1
+
+        if prune:
+            present = {os.path.relpath(path, directory) for path in self.find_files(directory, pattern)}
+            for key in [key for key in self.manifest.entries if key not in present]:
+                self._remove(key)
+                stats.removed += 1
+
+        #O LocalVectorStore só persiste com save(); o Redis grava direto
+        if hasattr(self.vectorstore, "save"):
+            self.vectorstore.save()
+
+        logger.info("Ingestion finished in %.1fs: %s", time.perf_counter() - start, stats)
+        return stats
+
+    def _write(self, key: str, sha256: str, chunks: FileChunks):
+        #Grava os chunks novos antes de remover os antigos: durante a troca a busca pode ver os dois, mas nunca nenhum
+        child_ids = self.vectorstore.add_documents(chunks.children) if chunks.children else []
+        self.docstore.mset(chunks.parents)
+
+        previous = self.manifest.entries.get(key)
+        if previous is not None:
+            self._delete_ids(previous)
+
+        self.manifest.entries[key] = {
+            "sha256": sha256,
+            "loader": self.loader,
+            "chunking": self.chunking,
+            "parent_ids": [parent_id for parent_id, _ in chunks.parents],
+            "child_ids": child_ids,
+            "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self.manifest.save()
+        logger.info("%s: %d parents, %d children, %d duplicate children dropped", key, len(chunks.parents), len(chunks.children), chunks.duplicates)
+
+    def _remove(self, key: str):
+        self._delete_ids(self.manifest.entries.pop(key))
+        self.manifest.save()
+        logger.info("%s removed", key)
+
+    def _delete_ids(self, entry: dict):
+        if entry["child_ids"]:
+            self.vectorstore.delete(entry["child_ids"], **self.vectorstore_kwargs)
+        if entry["parent_ids"]:
+            self.docstore.mdelete(entry["parent_ids"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--loader", choices=list(LOADER_EXTENSIONS), default="default")
+    parser.add_argument("--pattern", default="*", help="file name pattern, e.g. 'CONTRATO*'")
+    parser.add_argument("--workers", type=int, help="worker processes (default: number of cores)")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument("--prune", action="store_true", help="remove the chunks of files no longer in the directory")
+    parser.add_argument("--no-dedup", action="store_true", help="index repeated children of a file more than once")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=LOG_LEVEL)
+
+    from langchain.embeddings.openai import OpenAIEmbeddings
+    from embeddings.embedding_cache import CachedEmbeddings, EmbeddingCache
+    from retrieval.redis_parent_retriever import get_redis_doc_store, get_redis_url, get_vector_store
+
+    model = "text-embedding-ada-002"
+    #Chunks que não mudaram dentro de um arquivo alterado reaproveitam os embeddings já gerados
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(model=model), EmbeddingCache(), model)
+
+    ingestion = DirectoryIngestion(
+        get_redis_doc_store(),
+        get_vector_store(embeddings),
+        IngestionManifest(args.manifest),
+        loader=args.loader,
+        max_workers=args.workers,
+        vectorstore_kwargs={"redis_url": get_redis_url()},
+        deduplicate=not args.no_dedup,
+    )
+    stats = ingestion.run(args.directory, args.pattern, args.prune)
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
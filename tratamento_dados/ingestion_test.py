@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+
+from langchain.embeddings.fake import DeterministicFakeEmbedding
+from langchain.storage import InMemoryStore
+
+from retrieval.local_vector_store import LocalVectorStore
+from tratamento_dados.ingestion import DirectoryIngestion, IngestionManifest
+
+
+class TestDirectoryIngestion(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.data = os.path.join(self.directory.name, "docs")
+        os.makedirs(self.data)
+        for i in range(3):
+            self.write(f"doc{i}.txt", f"Cláusula {i}. O consorciado obriga-se a pagar as contribuições mensais.\n\n" * 30)
+
+        self.docstore = InMemoryStore()
+        self.vectorstore = LocalVectorStore(DeterministicFakeEmbedding(size=16), path=os.path.join(self.directory.name, "vectors"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, content):
+        with open(os.path.join(self.data, name), "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def ingestion(self, deduplicate=False, **kwargs):
+        #Os arquivos de teste repetem o mesmo parágrafo; sem deduplicação, cada parent tem os seus filhos
+        manifest = IngestionManifest(os.path.join(self.directory.name, "manifest.json"))
+        return DirectoryIngestion(self.docstore, self.vectorstore, manifest, max_workers=2, deduplicate=deduplicate, **kwargs)
+
+    def test_carga_incremental(self):
+        stats = self.ingestion().run(self.data)
+        self.assertEqual((stats.ingested, stats.skipped), (3, 0))
+        children = len(self.vectorstore)
+        parents = len(list(self.docstore.yield_keys()))
+        self.assertGreaterEqual(children, parents)
+
+        #Nada mudou: nada é recarregado
+        stats = self.ingestion().run(self.data)
+        self.assertEqual((stats.ingested, stats.skipped), (0, 3))
+
+        #Arquivo alterado: os chunks antigos saem, os novos entram
+        self.write("doc0.txt", "Cláusula nova, curta.")
+        stats = self.ingestion().run(self.data)
+        self.assertEqual((stats.ingested, stats.skipped), (1, 2))
+        self.assertEqual(len(list(self.docstore.yield_keys())), parents - parents // 3 + 1)
+        doc = self.vectorstore.similarity_search("Cláusula nova, curta.", k=1)[0]
+        self.assertEqual(doc.page_content, "Cláusula nova, curta.")
+        self.assertIsNotNone(self.docstore.mget([doc.metadata["doc_id"]])[0])
+
+        #Arquivo removido, com prune
+        os.remove(os.path.join(self.data, "doc1.txt"))
+        stats = self.ingestion().run(self.data, prune=True)
+        self.assertEqual(stats.removed, 1)
+        self.assertEqual(len(list(self.docstore.yield_keys())), parents // 3 + 1)
+
+    def test_parametros_da_quebra_alterados(self):
+        stats = self.ingestion(chunk_size=800, chunk_overlap=100).run(self.data)
+        self.assertEqual((stats.ingested, stats.skipped), (3, 0))
+        stats = self.ingestion(chunk_size=800, chunk_overlap=100).run(self.data)
+        self.assertEqual((stats.ingested, stats.skipped), (0, 3))
+
+        #Mesmo conteúdo, outro tamanho de chunk: tudo é recarregado e os chunks antigos saem
+        stats = self.ingestion(chunk_size=400, chunk_overlap=50).run(self.data)
+        self.assertEqual((stats.ingested, stats.skipped), (3, 0))
+        self.assertEqual(len(list(self.docstore.yield_keys())), stats.parents)
+        self.assertEqual(len(self.vectorstore), stats.children)
+
+        #Manifesto de uma versão anterior, sem os parâmetros da quebra
+        manifest = IngestionManifest(os.path.join(self.directory.name, "manifest.json"))
+        for entry in manifest.entries.values():
+            del entry["chunking"]
+        manifest.save()
+        stats = self.ingestion(chunk_size=400, chunk_overlap=50).run(self.data)
+        self.assertEqual((stats.ingested, stats.skipped), (3, 0))
+
+    def test_filhos_repetidos_indexados_uma_vez(self):
+        stats = self.ingestion(deduplicate=True).run(self.data)
+        #Dois filhos distintos por arquivo: o parent cheio, repetido, e o último, mais curto
+        self.assertEqual(len(self.vectorstore), 6)
+        self.assertEqual(stats.children, 6)
+        self.assertEqual(stats.duplicates, 3)
+
+        #Todo parent gravado é alcançável a partir de algum filho no vector store
+        children = self.vectorstore.similarity_search("contribuições mensais", k=len(self.vectorstore))
+        self.assertEqual({child.metadata["doc_id"] for child in children}, set(self.docstore.yield_keys()))
+        self.assertEqual(stats.parents, 6)
+
+    def test_quase_duplicados_continuam_recuperaveis(self):
+        clausula = "Cláusula {}. O consorciado excluído receberá os valores pagos em até {} dias após o encerramento do grupo."
+        self.write("prazos.txt", "\n\n".join([clausula.format(1, 30), clausula.format(2, 90), clausula.format(1, 30)]))
+        stats = self.ingestion(deduplicate=True, chunk_size=120, chunk_overlap=0).run(self.data, pattern="prazos*")
+
+        #Só a cópia exata sai; a de 90 dias, quase igual à de 30, fica com o seu parent
+        self.assertEqual((stats.children, stats.parents, stats.duplicates), (2, 2, 1))
+        parents = self.docstore.mget(list(self.docstore.yield_keys()))
+        self.assertEqual(sorted("90 dias" in parent.page_content for parent in parents), [False, True])
+
+        children = self.vectorstore.similarity_search(clausula.format(2, 90), k=len(self.vectorstore))
+        for child in children:
+            #Todos os ids apontam para parents gravados
+            for parent_id in [child.metadata["doc_id"]] + child.metadata.get("duplicate_parent_ids", []):
+                self.assertIsNotNone(self.docstore.mget([parent_id])[0])
+        child_90 = next(child for child in children if "90 dias" in child.page_content)
+        self.assertIn("90 dias", self.docstore.mget([child_90.metadata["doc_id"]])[0].page_content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,22 +1,195 @@
 import tiktoken, re
+import threading
+import time
+import yaml
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List
 
-def estimate_price_for_embedding_generation(words:list[str], current_cost_by_1000tokens_for_model=0.0001) -> tuple[float, int]:
-    enc = tiktoken.encoding_for_model('text-embedding-ada-002')
+#Tokenizador usado para medir textos (cl100k_base, o mesmo dos modelos de chat e de embeddings)
+TOKENIZER_MODEL = 'text-embedding-ada-002'
+#Textos até esse tamanho (separadores, prefixos de contexto, linhas de metadata, palavras) têm o número de tokens memorizado
+TOKEN_LENGTH_MEMO_MAX_CHARS = 64
+#Preço por 1000 tokens do modelo de embeddings, usado nas estimativas de custo
+EMBEDDING_COST_PER_1000_TOKENS = 0.0001
 
-    total_tokens = sum([len(enc.encode(word)) for word in words])
-    estimated_cost = total_tokens * (current_cost_by_1000tokens_for_model / 1000)
+
+@lru_cache(maxsize=None)
+def get_encoding(model:str = TOKENIZER_MODEL) -> tiktoken.Encoding:
+    #Carregar o encoder é caro; cada processo o carrega uma única vez por modelo
+    return tiktoken.encoding_for_model(model)
+
+
+@lru_cache(maxsize=16384)
+def _short_token_length(text:str, model:str) -> int:
+    return len(get_encoding(model).encode_ordinary(text))
+
+
+def token_length(text:str, model:str = TOKENIZER_MODEL) -> int:
+    """
+    Number of tokens of a text. Use it as the length_function of the text splitters to size chunks in tokens:
+    the splitters measure the same separators and short pieces over and over, and those lengths are memoized.
+    """
+    if len(text) <= TOKEN_LENGTH_MEMO_MAX_CHARS:
+        return _short_token_length(text, model)
+    return len(get_encoding(model).encode_ordinary(text))
+
+
+def token_lengths(texts:Iterable[str], model:str = TOKENIZER_MODEL) -> List[int]:
+    """Number of tokens of each text, encoded in a single batch (in parallel, by the tiktoken thread pool)."""
+    return [len(tokens) for tokens in get_encoding(model).encode_ordinary_batch(list(texts))]
+
+
+#Funções de tamanho dos chunks, por unidade (config.CHUNK_LENGTH_UNIT)
+LENGTH_FUNCTIONS = {
+    "chars": len,
+    "tokens": token_length,
+}
+
+
+def get_length_function(unit:str) -> Callable[[str], int]:
+    if unit not in LENGTH_FUNCTIONS:
+        raise ValueError(f"Unknown chunk length unit: {unit}. Use one of {list(LENGTH_FUNCTIONS)}")
+    return LENGTH_FUNCTIONS[unit]
+
+
+def price_for_tokens(total_tokens:int, current_cost_by_1000tokens_for_model:float = EMBEDDING_COST_PER_1000_TOKENS) -> float:
+    return total_tokens * (current_cost_by_1000tokens_for_model / 1000)
+
+
+def estimate_price_for_embedding_generation(words:list[str], current_cost_by_1000tokens_for_model:float = EMBEDDING_COST_PER_1000_TOKENS) -> tuple[float, int]:
+    total_tokens = sum(token_lengths(words))
+    estimated_cost = price_for_tokens(total_tokens, current_cost_by_1000tokens_for_model)
     
     return (estimated_cost, total_tokens)
 
+@dataclass
+class RewriteRule:
+    name: str
+    pattern: str
+    replacement: str
+
+
+def load_rewrite_rules(path:str, vocabularies:List[str]) -> List[RewriteRule]:
+    """
+    Rules of the selected vocabularies, in file order.
+    Raises ValueError if no vocabulary is selected, if a vocabulary is unknown, or if two active rules have the same
+    pattern (only the first one would ever match).
+    """
+    with open(path, encoding="utf-8") as f:
+        rules_by_vocabulary = yaml.safe_load(f) or {}
+
+    #Cada cliente tem o seu vocabulário: misturar todos por omissão reescreveria as perguntas com o nome de outro cliente
+    if not vocabularies:
+        raise ValueError(f"No query rewrite vocabulary selected. Use some of {list(rules_by_vocabulary)}")
+    unknown = [vocabulary for vocabulary in vocabularies if vocabulary not in rules_by_vocabulary]
+    if unknown:
+        raise ValueError(f"Unknown query rewrite vocabularies: {unknown}. Use some of {list(rules_by_vocabulary)}")
+
+    rules = []
+    names_by_pattern = {}
+    for vocabulary in vocabularies:
+        for index, rule in enumerate(rules_by_vocabulary[vocabulary]):
+            rewrite_rule = RewriteRule(f"{vocabulary}:{rule.get('name', index)}", rule["pattern"], rule["replacement"])
+            if rewrite_rule.pattern in names_by_pattern:
+                raise ValueError(f"Query rewrite rules {names_by_pattern[rewrite_rule.pattern]} and {rewrite_rule.name} have the same pattern: {rewrite_rule.pattern!r}")
+            names_by_pattern[rewrite_rule.pattern] = rewrite_rule.name
+            rules.append(rewrite_rule)
+    return rules
+
+
+def _compile_whole_words(pattern:str) -> re.Pattern:
+    #Limites de palavra por lookaround: funcionam também com padrões que começam ou terminam em não-letras
+    return re.compile(rf"(?<!\w)(?:{pattern})(?!\w)", re.IGNORECASE)
+
+
+class QueryRewriter:
+    """
+    Rewrites questions with literal replacements, in a single pass over the question.
+
+    All rules are compiled into one alternation of named groups, matched case-insensitively and only as whole words
+    (so "eu" does not match inside "seu"). Replaced text is never matched again. Rewritten questions are cached, and
+    hits per rule are counted; profile() times each rule on its own, to find expensive patterns.
+
+    Examples:
+        rewriter = QueryRewriter(load_rewrite_rules("config/query_rewrite_rules.yaml", ["bb_consorcios"]))
+        rewriter.rewrite("vocês cobram taxa?")
+        rewriter.stats()
+    """
+
+    def __init__(self, rules:List[RewriteRule], cache_size:int = 4096):
+        self.rules = rules
+        self._replacements = {f"r{index}": rule.replacement for index, rule in enumerate(rules)}
+        self._names = {f"r{index}": rule.name for index, rule in enumerate(rules)}
+        alternatives = "|".join(f"(?P<r{index}>{rule.pattern})" for index, rule in enumerate(rules))
+        self._pattern = _compile_whole_words(alternatives) if rules else None
+
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._calls = 0
+        self._cache_misses = 0
+        self._seconds = 0.0
+        self._cached_rewrite = lru_cache(maxsize=cache_size)(self._rewrite)
+
+    def rewrite(self, question:str) -> str:
+        with self._lock:
+            self._calls += 1
+        return self._cached_rewrite(question)
+
+    def _rewrite(self, question:str) -> str:
+        if self._pattern is None:
+            return question
+        start = time.perf_counter()
+        hits = Counter()
+
+        def replace(match):
+            hits[match.lastgroup] += 1
+            return self._replacements[match.lastgroup]
+
+        result = self._pattern.sub(replace, question)
+        with self._lock:
+            self._cache_misses += 1
+            self._seconds += time.perf_counter() - start
+            self._hits.update(hits)
+        return result
+
+    def stats(self) -> dict:
+        """Calls, cache hits, time spent rewriting and hits per rule (counted when the question is rewritten, not on cache hits)."""
+        with self._lock:
+            return {
+                "calls": self._calls,
+                "cache_hits": self._calls - self._cache_misses,
+                "rewrite_seconds": self._seconds,
+                "rule_hits": {self._names[group]: self._hits[group] for group in self._names},
+            }
+
+    def profile(self, questions:Iterable[str]) -> Dict[str, float]:
+        """Seconds spent by each rule alone over the questions (outside the request path)."""
+        questions = list(questions)
+        timings = {}
+        for rule in self.rules:
+            pattern = _compile_whole_words(rule.pattern)
+            start = time.perf_counter()
+            for question in questions:
+                pattern.sub(lambda match: rule.replacement, question)
+            timings[rule.name] = time.perf_counter() - start
+        return timings
+
+
+@lru_cache(maxsize=None)
+def get_query_rewriter() -> QueryRewriter:
+    #Import tardio: o config carrega o .env, o que os outros usos deste módulo não precisam
+    from config.config import QUERY_REWRITE_CACHE_SIZE, QUERY_REWRITE_RULES_PATH, QUERY_REWRITE_VOCABULARIES
+    return QueryRewriter(load_rewrite_rules(QUERY_REWRITE_RULES_PATH, QUERY_REWRITE_VOCABULARIES), QUERY_REWRITE_CACHE_SIZE)
+
+
 """
 'Truque' para ajudar a busca vetorial a associar o interlocutor/usuário com o consorciado no contrato,
 e termos como 'empresa', 'vocês', 'servopa', com administradora, pois esses termos são centrais a todos
-os conceitos dentro do contrato.
+os conceitos dentro do contrato. As regras ficam em config/query_rewrite_rules.yaml.
 
 TODO - Fazer a substituição pelo prompt, pedindo para o LLM. (Não fiz ainda pois ele gerará substituições no histórico também)
 """
 def improve_question(question):
-    question = re.sub(r'eu', 'eu, o consorciado, ', question, flags=re.IGNORECASE)
-    question = re.sub(r'bb', 'Administradora BB Consórcios', question, flags=re.IGNORECASE)
-    question = re.sub(r'voc[êe]s', 'vocês, Administradora BB Consórcios, ', question, flags=re.IGNORECASE)
-    return question
\ No newline at end of file
+    return get_query_rewriter().rewrite(question)
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+
+import util
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "query_rewrite_rules.yaml")
+
+
+class TestTokenLength(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        #O tiktoken baixa o encoding na primeira vez: sem rede e sem cache local, não há como contar tokens
+        try:
+            util.get_encoding()
+        except Exception as e:
+            raise unittest.SkipTest(f"tiktoken encoding unavailable: {e}")
+
+    def test_mesmo_resultado_do_encoder(self):
+        encoding = util.get_encoding()
+        texts = ["\n\n", "CLÁUSULA 12ª - ", "O consorciado obriga-se a pagar as contribuições mensais. " * 20, "<|endoftext|>"]
+        for text in texts:
+            self.assertEqual(util.token_length(text), len(encoding.encode_ordinary(text)))
+            #Segunda chamada vem da memória, com o mesmo valor
+            self.assertEqual(util.token_length(text), len(encoding.encode_ordinary(text)))
+        self.assertEqual(util.token_lengths(texts), [util.token_length(text) for text in texts])
+
+    def test_chunks_em_tokens(self):
+        from tratamento_dados.chunking import get_text_splitter
+
+        splitter = get_text_splitter(chunk_size=50, overlap=10, length_unit="tokens")
+        chunks = splitter.split_text("O consorciado obriga-se a pagar as contribuições mensais.\n" * 40)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(util.token_length(chunk) <= 50 for chunk in chunks))
+
+
+class TestLengthFunction(unittest.TestCase):
+
+    def test_unidade_invalida(self):
+        self.assertIs(util.get_length_function("chars"), len)
+        with self.assertRaises(ValueError):
+            util.get_length_function("words")
+
+
+class TestQueryRewriter(unittest.TestCase):
+
+    def setUp(self):
+        self.rules = util.load_rewrite_rules(RULES_PATH, ["bb_consorcios"])
+
+    def test_uma_passada_com_palavras_inteiras(self):
+        rewriter = util.QueryRewriter(self.rules)
+
+        self.assertEqual(
+            rewriter.rewrite("Eu paguei o BB, vocês receberam? E o seu europeu?"),
+            "eu, o consorciado,  paguei o Administradora BB Consórcios, vocês, Administradora BB Consórcios,  receberam? E o seu europeu?",
+        )
+
+    def test_cache_e_contadores(self):
+        rewriter = util.QueryRewriter(self.rules)
+        for _ in range(3):
+            rewriter.rewrite("eu quero falar com vocês")
+
+        stats = rewriter.stats()
+        self.assertEqual((stats["calls"], stats["cache_hits"]), (3, 2))
+        self.assertEqual(stats["rule_hits"], {"bb_consorcios:consorciado": 1, "bb_consorcios:administradora": 0, "bb_consorcios:voces": 1})
+        self.assertEqual(set(rewriter.profile(["eu e vocês"])), set(stats["rule_hits"]))
+
+    def test_vocabulario_desconhecido(self):
+        with self.assertRaises(ValueError):
+            util.load_rewrite_rules(RULES_PATH, ["outro_cliente"])
+
+    def test_vocabulario_obrigatorio(self):
+        for vocabularies in (None, []):
+            with self.assertRaisesRegex(ValueError, "bb_consorcios"):
+                util.load_rewrite_rules(RULES_PATH, vocabularies)
+
+    def test_padrao_repetido_entre_vocabularios(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "rules.yaml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(
+                    "cliente_a:\n  - {name: administradora, pattern: 'voc[êe]s', replacement: Administradora A}\n"
+                    "cliente_b:\n  - {name: administradora, pattern: 'voc[êe]s', replacement: Administradora B}\n"
+                )
+            self.assertEqual(len(util.load_rewrite_rules(path, ["cliente_b"])), 1)
+            with self.assertRaisesRegex(ValueError, "cliente_a:administradora and cliente_b:administradora"):
+                util.load_rewrite_rules(path, ["cliente_a", "cliente_b"])
+
+
+if __name__ == "__main__":
+    unittest.main()